@@ -0,0 +1,308 @@
+"""Pool of long-lived headless browser sessions, shared by the pages of a screenshot crawl."""
+import contextlib
+import json
+import threading
+import urllib.parse
+
+from logzero import logger
+from selenium import webdriver
+from selenium.webdriver.firefox.options import Options
+
+#: When ``driver.get()`` returns: once the page has loaded (``"normal"``), once its
+#: HTML has been parsed (``"eager"``), or at once (``"none"``).
+PAGE_LOAD_STRATEGIES = ("normal", "eager", "none")
+
+# Firefox preferences that stop each type of resource from being loaded
+_RESOURCE_PREFERENCES = {
+    "font": {
+        "gfx.downloadable_fonts.enabled": False,
+        "browser.display.use_document_fonts": 0,
+    },
+    "image": {"permissions.default.image": 2},
+    "media": {"media.autoplay.default": 5, "media.preload.default": 0},
+}
+
+#: Types of resources that can be blocked.
+RESOURCE_TYPES = tuple(sorted(_RESOURCE_PREFERENCES))
+
+# Blocked URLs are sent to a proxy that nothing listens on, so that they fail at once
+_BLOCKING_PROXY = "PROXY 127.0.0.1:9"
+
+
+def pac_script(patterns) -> str:
+    """Write a proxy auto-config (PAC) script that blocks URLs matching any pattern.
+
+    Args:
+        patterns (list): shell-style patterns, such as ``"*.doubleclick.net/*"``
+
+    Returns:
+        str: the PAC script
+
+    """
+    _conditions = " ||\n      ".join(
+        "shExpMatch(url, %s)" % json.dumps(_pattern) for _pattern in patterns
+    )
+    return (
+        "function FindProxyForURL(url, host) {\n"
+        "  if (%s) {\n"
+        "    return %s;\n"
+        "  }\n"
+        '  return "DIRECT";\n'
+        "}\n" % (_conditions, json.dumps(_BLOCKING_PROXY))
+    )
+
+
+class CaptureProfile:
+    """How browser sessions load pages, trading completeness for speed.
+
+    Pages are only captured once ``driver.get()`` returns, which by default is once
+    every resource of the page has loaded, including slow third-party scripts. The
+    profile can make it return sooner, keep the browser from requesting some
+    resources at all, and cap the time spent loading a page, after which loading is
+    stopped and whatever has loaded is captured.
+
+    Args:
+        page_load_strategy (:obj:`str`, optional): one of ``PAGE_LOAD_STRATEGIES``
+            (default: ``"normal"``)
+        page_load_timeout (:obj:`float`, optional): most seconds to load a page for
+            (default: the driver's own timeout)
+        block_urls (:obj:`list`, optional): shell-style patterns of URLs not to load,
+            such as ``"*.doubleclick.net/*"``
+        block_resources (:obj:`list`, optional): types of resources not to load, from
+            ``RESOURCE_TYPES``
+
+    Raises:
+        ValueError: if the strategy or a type of resource is unknown
+
+    """
+
+    def __init__(
+        self,
+        page_load_strategy="normal",
+        page_load_timeout=None,
+        block_urls=(),
+        block_resources=(),
+    ):
+        """Check and keep the settings."""
+        if page_load_strategy not in PAGE_LOAD_STRATEGIES:
+            raise ValueError("Unknown page load strategy: %s" % page_load_strategy)
+        for _resource in block_resources:
+            if _resource not in _RESOURCE_PREFERENCES:
+                raise ValueError("Unknown type of resource: %s" % _resource)
+        self.page_load_strategy = page_load_strategy
+        self.page_load_timeout = page_load_timeout
+        self.block_urls = list(block_urls)
+        self.block_resources = list(block_resources)
+
+    def firefox_options(self) -> Options:
+        """Build the Firefox options that apply the profile.
+
+        URLs are blocked by a PAC script, which sees the whole URL of each request.
+
+        Returns:
+            Options: the options, to add any others to
+
+        """
+        _options = Options()
+        _options.page_load_strategy = self.page_load_strategy
+        for _resource in self.block_resources:
+            for _name, _value in _RESOURCE_PREFERENCES[_resource].items():
+                _options.set_preference(_name, _value)
+        if self.block_urls:
+            _pac_url = "data:application/x-ns-proxy-autoconfig," + urllib.parse.quote(
+                pac_script(self.block_urls)
+            )
+            _options.set_preference("network.proxy.type", 2)
+            _options.set_preference("network.proxy.autoconfig_url", _pac_url)
+            _options.set_preference("network.proxy.autoconfig_url.include_path", True)
+        return _options
+
+
+def firefox_driver(profile=None) -> webdriver.Firefox:
+    """Start a headless Firefox session; the default ``driver_factory`` of the pool.
+
+    Args:
+        profile (:obj:`CaptureProfile`, optional): how the session loads pages
+
+    Returns:
+        webdriver.Firefox: the new session
+
+    """
+    _options = Options() if profile is None else profile.firefox_options()
+    _options.add_argument("-headless")
+    _driver = webdriver.Firefox(options=_options)
+    if profile is not None and profile.page_load_timeout:
+        _driver.set_page_load_timeout(profile.page_load_timeout)
+    return _driver
+
+
+class BrowserSession:
+    """A browser session of the pool, and the number of pages it has captured.
+
+    Args:
+        driver (obj): the Selenium WebDriver (or anything with the same interface)
+
+    Attributes:
+        driver (obj): the Selenium WebDriver
+        pages (int): number of pages that the session has been used for
+        window_size (dict): width and height of the window when the session started,
+            which it is put back to before each page
+
+    """
+
+    __slots__ = ("driver", "pages", "window_size")
+
+    def __init__(self, driver):
+        """Wrap the driver, and note the size of its window."""
+        self.driver = driver
+        self.pages = 0
+        self.window_size = driver.get_window_size()
+
+
+class BrowserPool:
+    """Pool of up to ``size`` browser sessions, reused from one page to the next.
+
+    Starting a browser takes seconds, so sessions are kept open between pages.
+    A session is recycled (quit, and replaced by a new one when next needed) once it
+    has been used for ``max_pages`` pages, since browsers grow slower and larger the
+    longer they run, or as soon as a page fails with it, in case the browser crashed.
+
+    Sessions are handed out to one thread at a time, so up to ``size`` threads can
+    capture pages in parallel. A page may resize the window to capture all of it, so
+    the window is put back to the size it started with when a session is handed back;
+    otherwise it would only grow, and each page would be laid out at the size of the
+    largest page before it.
+
+    Args:
+        size (:obj:`int`, optional): most sessions open at once (default: ``1``)
+        driver_factory (:obj:`callable`, optional): called with no arguments to start a
+            session (default: :func:`firefox_driver`); a stub can be used where no
+            browser is installed
+        max_pages (:obj:`int`, optional): pages after which a session is recycled
+            (default: ``100``)
+
+    Attributes:
+        size (int): most sessions open at once
+        max_pages (int): pages after which a session is recycled
+        started_count (int): number of sessions started
+        recycled_count (int): number of sessions quit before the pool was closed
+
+    Example::
+
+        with BrowserPool(size=4) as browsers:
+            with browsers.session() as driver:
+                driver.get(url)
+
+    """
+
+    def __init__(self, size=1, driver_factory=None, max_pages=100):
+        """Create the pool; sessions are only started when they are first needed."""
+        self.size = max(1, size)
+        self.driver_factory = (
+            firefox_driver if driver_factory is None else driver_factory
+        )
+        self.max_pages = max_pages
+        self.started_count = 0
+        self.recycled_count = 0
+        self._idle = []
+        # Number of sessions that are open, or being started
+        self._open = 0
+        self._available = threading.Condition()
+        self._closed = False
+
+    def acquire(self) -> BrowserSession:
+        """Take a session, starting one if none is idle, or waiting for one to be free.
+
+        Returns:
+            BrowserSession: the session, which must be handed back with :meth:`release`
+
+        """
+        with self._available:
+            while not self._idle and self._open >= self.size:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+        try:
+            _session = BrowserSession(self.driver_factory())
+        except BaseException:
+            self._discard()
+            raise
+        with self._available:
+            self.started_count += 1
+        return _session
+
+    def release(self, session, failed=False):
+        """Hand back a session after using it for a page.
+
+        Args:
+            session (BrowserSession): the session taken with :meth:`acquire`
+            failed (:obj:`bool`, optional): the page failed, so the session is recycled
+                (default: ``False``)
+
+        """
+        session.pages += 1
+        if not (failed or self._closed or session.pages >= self.max_pages):
+            failed = not self._reset_window(session)
+        if failed or self._closed or session.pages >= self.max_pages:
+            if not self._closed:
+                with self._available:
+                    self.recycled_count += 1
+            self._quit(session)
+        else:
+            with self._available:
+                self._idle.append(session)
+                self._available.notify()
+
+    def _reset_window(self, session) -> bool:
+        try:
+            session.driver.set_window_size(
+                session.window_size["width"], session.window_size["height"]
+            )
+        except Exception as e:
+            logger.debug("Unable to reset the browser window: %r" % e)
+            return False
+        return True
+
+    def _quit(self, session):
+        try:
+            session.driver.quit()
+        except Exception as e:
+            logger.debug("Unable to quit browser session: %r" % e)
+        finally:
+            self._discard()
+
+    def _discard(self):
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    @contextlib.contextmanager
+    def session(self):
+        """Use a session for a page, recycling it if the page fails.
+
+        Yields:
+            obj: the driver of the session
+
+        """
+        _session = self.acquire()
+        try:
+            yield _session.driver
+        except BaseException:
+            self.release(_session, failed=True)
+            raise
+        self.release(_session)
+
+    def close(self):
+        """Quit every idle session; sessions in use are quit when they are released."""
+        with self._available:
+            self._closed = True
+            _idle, self._idle = self._idle, []
+        for _session in _idle:
+            self._quit(_session)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
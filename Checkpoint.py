@@ -0,0 +1,235 @@
+"""Checkpoint a long crawl, so that it can be resumed after it is stopped."""
+import hashlib
+import json
+import os
+import time
+from array import array
+
+from SiteGloopErrors import CheckpointError
+from SiteGloopUtils import RecordPacker, unpack_records
+from UrlStore import UrlStore
+
+# Fraction of the index of rewritten URLs that may be in use
+_MAX_LOAD = 0.6
+
+
+def write_atomic(path, data):
+    """Write a file so that it is either fully replaced, or left as it was.
+
+    Args:
+        path (str): path of the file
+        data (bytes): the new contents of the file
+
+    """
+    _tmp_path = "%s.tmp" % path
+    with open(_tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(_tmp_path, path)
+
+
+class Checkpoint:
+    """Periodic record of which URLs of a crawl have been crawled.
+
+    Two files are kept:
+
+    * ``path``: a snapshot of the URLs to crawl (with their ``lastmod``), written once
+      when the crawl starts, so that a resumed crawl need not read the sitemap(s) again
+    * ``path + ".done"``: a bitmap with a bit for each URL, in the order of the
+      snapshot, that is set once the URL has been crawled
+
+    The checkpoint is called with each :class:`~SiteCrawlerQuick.CrawlResult` (so it can
+    be used as, or alongside, the ``result_sink`` of
+    :class:`~SiteCrawlerQuick.SiteCrawlerQuick`), and the bitmap is written out every
+    ``interval`` seconds, and when the checkpoint is closed. Both files are replaced
+    atomically, so a crash leaves the last checkpoint intact, and only the URLs crawled
+    since then are crawled again when the crawl is resumed.
+
+    Args:
+        path (str): path of the snapshot
+        interval (:obj:`float`, optional): most seconds between writing out the bitmap
+            (default: ``5.0``)
+        rewrite_url (:obj:`callable`, optional): called with each URL of the snapshot,
+            and returns the URL that is crawled (and reported on) instead
+
+    Attributes:
+        path (str): path of the snapshot
+        total (int): number of URLs in the snapshot
+        completed_count (int): number of URLs that have been crawled
+
+    Example::
+
+        checkpoint = Checkpoint("crawl.checkpoint")
+        urls = checkpoint.load()
+        if urls is None:
+            urls = checkpoint.start(sitemap.get_sitemap_data())
+        with checkpoint:
+            crawler = SiteCrawlerQuick(urls, result_sink=checkpoint)
+            await crawler.crawl_sites()
+
+    """
+
+    def __init__(self, path, interval=5.0, rewrite_url=None):
+        """Create the checkpoint; nothing is read or written until it is started or loaded."""
+        self.path = path
+        self.interval = interval
+        self.rewrite_url = rewrite_url
+        self.total = 0
+        self.completed_count = 0
+        self._done_path = "%s.done" % path
+        self._urls = UrlStore()
+        self._rewritten = None
+        self._done = bytearray()
+        self._snapshot_sha256 = None
+        self._saved_at = time.monotonic()
+
+    def _build_index(self, urls):
+        self._urls = urls
+        self.total = len(urls)
+        self._rewritten = None
+        if self.rewrite_url is None:
+            # Results are looked up in the snapshot itself
+            return
+        # Open addressing hash table of positions, by the URL that each one is crawled
+        # as; several positions can be rewritten to the same URL
+        _size = 8
+        while self.total > _size * _MAX_LOAD:
+            _size *= 2
+        self._rewritten = array("q", [0]) * _size
+        _mask = _size - 1
+        for _position, _url in enumerate(urls):
+            _slot = hash(self.rewrite_url(_url)) & _mask
+            while self._rewritten[_slot]:
+                _slot = (_slot + 1) & _mask
+            self._rewritten[_slot] = _position + 1
+
+    def _positions(self, url) -> list:
+        """Find the positions in the snapshot of the URLs that are crawled as ``url``."""
+        if self._rewritten is None:
+            _position = self._urls.position(url)
+            return [] if _position is None else [_position]
+        _positions = []
+        _mask = len(self._rewritten) - 1
+        _slot = hash(url) & _mask
+        while self._rewritten[_slot]:
+            _position = self._rewritten[_slot] - 1
+            if self.rewrite_url(self._urls.url_at(_position)) == url:
+                _positions.append(_position)
+            _slot = (_slot + 1) & _mask
+        return _positions
+
+    def start(self, urls) -> dict:
+        """Start checkpointing a new crawl, replacing any earlier checkpoint.
+
+        Args:
+            urls (dict): the URLs to crawl, with their ``lastmod``
+
+        Returns:
+            dict: ``urls``, which are all still to be crawled
+
+        """
+        _packer = RecordPacker()
+        for _url, _lastmod in urls.items():
+            _packer.add(_url, "" if _lastmod is None else _lastmod)
+        _snapshot = _packer.finish()
+        write_atomic(self.path, _snapshot)
+        self._snapshot_sha256 = hashlib.sha256(_snapshot).hexdigest()
+        self._build_index(urls if isinstance(urls, UrlStore) else UrlStore(urls))
+        self._done = bytearray((self.total + 7) // 8)
+        self.completed_count = 0
+        self.save()
+        return urls
+
+    def load(self) -> dict:
+        """Load the checkpoint of an earlier crawl, to resume it.
+
+        Returns:
+            UrlStore: the URLs that are still to be crawled, with their ``lastmod``, or
+                None if there is no checkpoint
+
+        Raises:
+            CheckpointError: if the snapshot is corrupt, or the bitmap is missing or
+                does not belong to the snapshot
+
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            _snapshot = f.read()
+        self._snapshot_sha256 = hashlib.sha256(_snapshot).hexdigest()
+        _urls = UrlStore()
+        try:
+            for _url, _lastmod in unpack_records(_snapshot, 2):
+                _urls[_url] = _lastmod or None
+        except ValueError as e:
+            raise CheckpointError("Cannot read '%s': %s" % (self.path, e))
+        try:
+            with open(self._done_path, "rb") as f:
+                _header = json.loads(f.readline())
+                self._done = bytearray(f.read())
+        except (OSError, ValueError) as e:
+            raise CheckpointError("Cannot read '%s': %s" % (self._done_path, e))
+        if _header.get("snapshot") != self._snapshot_sha256:
+            raise CheckpointError(
+                "'%s' does not belong to '%s'" % (self._done_path, self.path)
+            )
+        self._build_index(_urls)
+        if len(self._done) != (self.total + 7) // 8:
+            raise CheckpointError("'%s' is truncated" % self._done_path)
+        _pending = UrlStore()
+        for _position, (_url, _lastmod) in enumerate(_urls.items()):
+            if self._done[_position >> 3] & (1 << (_position & 7)):
+                self.completed_count += 1
+            else:
+                _pending[_url] = _lastmod
+        return _pending
+
+    def __call__(self, result):
+        """Record that a URL has been crawled.
+
+        Args:
+            result (CrawlResult): the outcome of crawling a URL
+
+        """
+        # URLs that are rewritten to the same URL are only crawled once, so every one
+        # of them is marked
+        for _position in self._positions(result.url):
+            self._mark(_position)
+        if time.monotonic() - self._saved_at >= self.interval:
+            self.save()
+
+    def _mark(self, position):
+        _bit = 1 << (position & 7)
+        if not self._done[position >> 3] & _bit:
+            self._done[position >> 3] |= _bit
+            self.completed_count += 1
+
+    def flush(self):
+        """Write out the bitmap."""
+        self.save()
+
+    def save(self):
+        """Write out the bitmap."""
+        if self._snapshot_sha256 is None:
+            return
+        _header = {
+            "snapshot": self._snapshot_sha256,
+            "urls": self.total,
+            "completed": self.completed_count,
+            "saved_at": time.time(),
+        }
+        write_atomic(
+            self._done_path, json.dumps(_header).encode("utf-8") + b"\n" + self._done
+        )
+        self._saved_at = time.monotonic()
+
+    def close(self):
+        """Write out the bitmap."""
+        self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,119 @@
+"""Adapt the number of requests in flight to what the origin can sustain."""
+import asyncio
+
+from SiteGloopUtils import SiteGloopLogger as GloopLog
+
+
+class ConcurrencyController:
+    """Additive-increase/multiplicative-decrease (AIMD) controller for concurrency.
+
+    Requests are only let through while fewer than ``limit`` are in flight. After
+    every window of completed requests (one window is at least ``limit`` requests)
+    the p95 latency and the error rate of that window are compared to their targets:
+
+    * while both are within their targets, ``limit`` grows: it doubles until the first
+      cut back (slow start), then grows by ``increase``
+    * when either is over its target, ``limit`` is multiplied by ``decrease``
+
+    Every change is logged, so operators can see the concurrency that the origin
+    actually sustains.
+
+    Args:
+        max_limit (int): the most requests that may be in flight at once
+        min_limit (:obj:`int`, optional): the fewest requests that may be in flight at
+            once (default: ``1``)
+        initial_limit (:obj:`int`, optional): the number of requests that may be in flight
+            at the start (default: ``min_limit``)
+        target_latency (:obj:`float`, optional): highest acceptable p95 latency, in seconds
+            (default: ``1.0``)
+        max_error_rate (:obj:`float`, optional): highest acceptable fraction of requests
+            ending in an error (default: ``0.05``)
+        increase (:obj:`int`, optional): amount to grow ``limit`` by (default: ``1``)
+        decrease (:obj:`float`, optional): factor to cut ``limit`` by (default: ``0.5``)
+        min_window (:obj:`int`, optional): fewest requests to base a decision on
+            (default: ``20``)
+        verbosity (:obj:`int`, optional): verbosity setting (default: ``50``)
+
+    Attributes:
+        limit (int): the number of requests that may currently be in flight
+        peak_limit (int): the highest ``limit`` reached
+        in_flight (int): the number of requests currently in flight
+
+    """
+
+    def __init__(
+        self,
+        max_limit,
+        min_limit=1,
+        initial_limit=None,
+        target_latency=1.0,
+        max_error_rate=0.05,
+        increase=1,
+        decrease=0.5,
+        min_window=20,
+        verbosity=50,
+    ):
+        """Create the controller."""
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = self.min_limit if initial_limit is None else initial_limit
+        self.limit = max(self.min_limit, min(self.limit, self.max_limit))
+        self.peak_limit = self.limit
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.min_window = min_window
+        self.in_flight = 0
+        self.glooplog = GloopLog(verbosity=verbosity)
+        self._slow_start = True
+        self._latencies = []
+        self._errors = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        """Wait until another request may be put in flight."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, latency, error=False) -> None:
+        """Record the outcome of a request that is no longer in flight.
+
+        Args:
+            latency (float): seconds that the request took
+            error (:obj:`bool`, optional): True if the request ended in an error
+
+        """
+        async with self._changed:
+            self.in_flight -= 1
+            self._latencies.append(latency)
+            self._errors += 1 if error else 0
+            if len(self._latencies) >= max(self.min_window, self.limit):
+                self._adjust()
+            self._changed.notify_all()
+
+    def _adjust(self) -> None:
+        self._latencies.sort()
+        _p95 = self._latencies[int(0.95 * (len(self._latencies) - 1))]
+        _error_rate = self._errors / len(self._latencies)
+        self._latencies = []
+        self._errors = 0
+        _old_limit = self.limit
+        if _p95 <= self.target_latency and _error_rate <= self.max_error_rate:
+            if self._slow_start:
+                self.limit = min(self.max_limit, self.limit * 2)
+            else:
+                self.limit = min(self.max_limit, self.limit + self.increase)
+            _level = "info"
+        else:
+            self._slow_start = False
+            self.limit = max(self.min_limit, int(self.limit * self.decrease))
+            _level = "warning"
+        self.peak_limit = max(self.peak_limit, self.limit)
+        if self.limit != _old_limit:
+            self.glooplog.logit(
+                level=_level,
+                msg="Concurrency %s -> %s (p95 %.3fs, errors %.1f%%)"
+                % (_old_limit, self.limit, _p95, _error_rate * 100),
+            )
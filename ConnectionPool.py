@@ -0,0 +1,101 @@
+"""Connection pool shared between reading sitemaps and crawling."""
+import ssl
+
+import aiohttp
+
+
+class ConnectionPool:
+    """Pool of HTTP connections that can be shared by several aiohttp sessions.
+
+    Passing the same pool to :class:`~SitemapReaderQuick.SitemapReaderQuick` and
+    :class:`~SiteCrawlerQuick.SiteCrawlerQuick` lets the crawl reuse the connections
+    (and DNS lookups) that were warmed up while reading the sitemaps, and makes sure
+    that the connection limits apply to all of the requests being made.
+
+    Args:
+        limit (:obj:`int`, optional): maximum number of connections open at once (default: ``100``)
+        limit_per_host (:obj:`int`, optional): maximum number of connections open at once to
+            the same host, or ``0`` for no limit (default: ``0``)
+        keepalive_timeout (:obj:`float`, optional): seconds to keep an idle connection open
+            for reuse (default: ``15``)
+        ttl_dns_cache (:obj:`int`, optional): seconds to cache DNS lookups for, or ``None`` to
+            cache them forever (default: ``10``)
+        ssl_context (:obj:`ssl.SSLContext`, optional): TLS context used by every connection
+            (default: a context from :func:`ssl.create_default_context`)
+
+    Attributes:
+        limit (int): maximum number of connections open at once
+        limit_per_host (int): maximum number of connections open at once to the same host
+        keepalive_timeout (float): seconds to keep an idle connection open for reuse
+        ttl_dns_cache (int): seconds to cache DNS lookups for
+        ssl_context (ssl.SSLContext): TLS context used by every connection
+
+    Example::
+
+        pool = ConnectionPool(limit=200, limit_per_host=50)
+        async with pool.session() as session:
+            ...
+        await pool.close()
+
+    """
+
+    def __init__(
+        self,
+        limit=None,
+        limit_per_host=0,
+        keepalive_timeout=15,
+        ttl_dns_cache=10,
+        ssl_context=None,
+    ):
+        """Create the pool.
+
+        The underlying connector is only created once a session is requested, so
+        the pool can be created before an event loop is running.
+        """
+        self.limit = 100 if limit is None else limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.ssl_context = (
+            ssl.create_default_context() if ssl_context is None else ssl_context
+        )
+        self.connector = None
+
+    def get_connector(self) -> aiohttp.TCPConnector:
+        """Getter for the connector, creating it if needed.
+
+        Returns:
+            aiohttp.TCPConnector: the connector holding the pooled connections
+
+        """
+        if self.connector is None or self.connector.closed:
+            self.connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True,
+                ttl_dns_cache=self.ttl_dns_cache,
+                ssl=self.ssl_context,
+            )
+        return self.connector
+
+    def session(self, **kwargs) -> aiohttp.ClientSession:
+        """Create a client session that uses the pooled connections.
+
+        Closing the session leaves the pooled connections open for the next one.
+
+        Args:
+            **kwargs: passed on to :class:`aiohttp.ClientSession`
+
+        Returns:
+            aiohttp.ClientSession: a session using the pool's connector
+
+        """
+        return aiohttp.ClientSession(
+            connector=self.get_connector(), connector_owner=False, **kwargs
+        )
+
+    async def close(self) -> None:
+        """Close every pooled connection."""
+        if self.connector is not None:
+            await self.connector.close()
@@ -0,0 +1,475 @@
+"""Spread a crawl across several machines: one coordinator hands out URLs to workers.
+
+The coordinator and its workers talk over TCP, one JSON object per line:
+
+* a worker sends ``{"op": "lease"}`` to ask for URLs, and the coordinator replies with
+  ``{"op": "batch", "lease": id, "urls": [[url, lastmod], ...], "lease_timeout": s}``,
+  ``{"op": "wait", "seconds": s}`` if every URL is leased out but not yet crawled, or
+  ``{"op": "done"}`` once every URL has been crawled
+* while crawling a batch, a worker streams ``{"op": "results", "lease": id, "results":
+  [[kind, result], ...]}`` messages, where ``kind`` is ``"result"`` or ``"dead_letter"``,
+  sends ``{"op": "renew", "lease": id}`` every so often, and finally sends
+  ``{"op": "complete", "lease": id}``
+
+A lease that is not renewed within ``lease_timeout`` seconds, or whose worker
+disconnects, is taken back, and the URLs of it that have no result yet are leased to
+another worker. Results for a lease that was taken back are ignored, so each URL is
+only recorded once. There is no authentication, so only use this on a trusted network.
+"""
+import asyncio
+import collections
+import itertools
+import json
+import time
+
+from LatencyStats import LatencyStats, RequestTiming
+from RetryPolicy import RetryPolicy
+from SiteCrawlerQuick import VALIDATED, CrawlResult
+from SiteGloopUtils import SiteGloopLogger as GloopLog
+
+#: Longest line (in bytes) that may be sent between the coordinator and a worker.
+LINE_LIMIT = 64 * 1024 * 1024
+
+
+def encode_result(result) -> list:
+    """Turn a result into something that can be sent as JSON.
+
+    Args:
+        result (CrawlResult): the outcome of crawling a URL
+
+    Returns:
+        list: the fields of the result
+
+    """
+    return list(result)
+
+
+def decode_result(fields) -> CrawlResult:
+    """Turn the output of :func:`encode_result` back into a result.
+
+    Args:
+        fields (list): the fields of the result
+
+    Returns:
+        CrawlResult: the outcome of crawling a URL
+
+    """
+    _result = CrawlResult(*fields)
+    if _result.timing is not None:
+        _result = _result._replace(timing=RequestTiming(*_result.timing))
+    return _result
+
+
+def parse_address(address, default_host="127.0.0.1") -> tuple:
+    """Split a ``host:port`` address.
+
+    Args:
+        address (str): the address, such as ``"10.0.0.5:8770"`` or ``":8770"``
+        default_host (:obj:`str`, optional): the host to use if none is given
+
+    Returns:
+        tuple: the host and the port
+
+    """
+    _host, _sep, _port = address.rpartition(":")
+    return _host or default_host, int(_port)
+
+
+async def _send(writer, message):
+    writer.write(json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+class Lease:
+    """URLs that have been handed to a worker to crawl.
+
+    Args:
+        lease_id (int): identifies the lease
+        urls (dict): the URLs, with their ``lastmod``, that have no result yet
+        owner (int): identifies the connection that holds the lease
+        expires_at (float): :func:`time.monotonic` time at which the lease expires
+
+    """
+
+    __slots__ = ("lease_id", "urls", "owner", "expires_at")
+
+    def __init__(self, lease_id, urls, owner, expires_at):
+        """Create the lease."""
+        self.lease_id = lease_id
+        self.urls = urls
+        self.owner = owner
+        self.expires_at = expires_at
+
+
+class Coordinator:
+    """Hand out the URLs of a crawl in leased batches, and collect the results.
+
+    Args:
+        urls (dict): the URLs to crawl, with their ``lastmod``
+        host (:obj:`str`, optional): address to listen on (default: ``"127.0.0.1"``)
+        port (:obj:`int`, optional): port to listen on (default: ``8770``)
+        batch_size (:obj:`int`, optional): most URLs in a batch (default: ``500``)
+        lease_timeout (:obj:`float`, optional): seconds that a lease lasts without being
+            renewed (default: ``120``)
+        result_sink (:obj:`callable`, optional): called with each
+            :class:`~SiteCrawlerQuick.CrawlResult` sent back by the workers
+        dead_letter_sink (:obj:`callable`, optional): called with each
+            :class:`~SiteCrawlerQuick.CrawlResult` that failed for good
+        url_filter (:obj:`callable`, optional): called with each URL and its ``lastmod``;
+            the URL is only handed out if it returns True
+        rewrite_url (:obj:`callable`, optional): called with each URL, and returns the URL
+            to crawl instead
+        conditional (:obj:`bool`, optional): whether the workers make conditional
+            requests, so that ``304`` responses are counted as
+            :data:`~SiteCrawlerQuick.VALIDATED` (default: ``False``)
+        verbosity (:obj:`int`, optional): verbosity setting (default: ``50``)
+
+    Attributes:
+        status_counts (collections.Counter): Number of URLs crawled per status.
+        latency_stats (LatencyStats): Percentiles of the time taken by the last request
+            made for each URL.
+        dead_letter_count (int): Number of URLs that failed for good.
+        concurrency (None): Adaptive concurrency is reported on by each worker, not here.
+
+    """
+
+    def __init__(
+        self,
+        urls,
+        host="127.0.0.1",
+        port=8770,
+        batch_size=500,
+        lease_timeout=120,
+        result_sink=None,
+        dead_letter_sink=None,
+        url_filter=None,
+        rewrite_url=None,
+        conditional=False,
+        verbosity=50,
+    ):
+        """Create the coordinator."""
+        self.urls = urls
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.lease_timeout = lease_timeout
+        self.result_sink = result_sink
+        self.dead_letter_sink = dead_letter_sink
+        self.url_filter = url_filter
+        self.rewrite_url = rewrite_url
+        self.conditional = conditional
+        self.glooplog = GloopLog(verbosity=verbosity)
+        self.status_counts = collections.Counter()
+        self.latency_stats = LatencyStats()
+        self.dead_letter_count = 0
+        self.concurrency = None
+        self._pending = collections.deque()
+        self._leases = {}
+        self._lease_ids = itertools.count(1)
+        self._connection_ids = itertools.count(1)
+        self._connections = set()
+        self._finished = None
+
+    def _batches(self):
+        _batch = {}
+        for _url, _lastmod in self.urls.items():
+            if self.rewrite_url is not None:
+                _url = self.rewrite_url(_url)
+            if self.url_filter is None or self.url_filter(_url, _lastmod):
+                _batch[_url] = _lastmod
+            if len(_batch) >= self.batch_size:
+                yield _batch
+                _batch = {}
+        if _batch:
+            yield _batch
+
+    async def run(self):
+        """Serve batches to workers until every URL has been crawled."""
+        self._pending.extend(self._batches())
+        self._finished = asyncio.Event()
+        self._check_finished()
+        _server = await asyncio.start_server(
+            self._serve, self.host, self.port, limit=LINE_LIMIT
+        )
+        print("Coordinating crawl on %s:%s...\n" % (self.host, self.port))
+        _expiry = asyncio.ensure_future(self._expire_leases())
+        try:
+            await self._finished.wait()
+            # Let connected workers ask for more and be told that the crawl is done.
+            _deadline = time.monotonic() + 5
+            while self._connections and time.monotonic() < _deadline:
+                await asyncio.sleep(0.1)
+        finally:
+            _expiry.cancel()
+            _server.close()
+            await _server.wait_closed()
+
+    def _check_finished(self):
+        if not self._pending and not self._leases:
+            self._finished.set()
+
+    def _release(self, lease, reason):
+        """Take back a lease, so that its remaining URLs are leased to another worker."""
+        del self._leases[lease.lease_id]
+        if lease.urls:
+            self._pending.appendleft(lease.urls)
+            self.glooplog.logit(
+                level="warning",
+                msg="Lease %s %s, re-leasing %s URL(s)"
+                % (lease.lease_id, reason, len(lease.urls)),
+            )
+
+    async def _expire_leases(self):
+        while True:
+            await asyncio.sleep(1)
+            _now = time.monotonic()
+            for _lease in list(self._leases.values()):
+                if _lease.expires_at < _now:
+                    self._release(_lease, "expired")
+
+    async def _serve(self, reader, writer):
+        _owner = next(self._connection_ids)
+        self._connections.add(_owner)
+        try:
+            while True:
+                _line = await reader.readline()
+                if not _line:
+                    break
+                await self._handle(json.loads(_line), _owner, writer)
+        except (ConnectionError, ValueError) as e:
+            self.glooplog.logit(
+                level="error", msg="Dropping worker connection %s: %r" % (_owner, e)
+            )
+        finally:
+            self._connections.discard(_owner)
+            for _lease in list(self._leases.values()):
+                if _lease.owner == _owner:
+                    self._release(_lease, "lost its worker")
+            writer.close()
+
+    async def _handle(self, message, owner, writer):
+        _op = message.get("op")
+        if _op == "lease":
+            await _send(writer, self._lease(owner))
+            return
+        _lease = self._leases.get(message.get("lease"))
+        if _lease is None or _lease.owner != owner:
+            # The lease was taken back, and its URLs handed to another worker.
+            return
+        _lease.expires_at = time.monotonic() + self.lease_timeout
+        if _op == "results":
+            for _kind, _fields in message["results"]:
+                if _kind == "result":
+                    self._record(_lease, decode_result(_fields))
+                else:
+                    self.dead_letter_count += 1
+                    if self.dead_letter_sink is not None:
+                        self.dead_letter_sink(decode_result(_fields))
+        elif _op == "complete":
+            del self._leases[_lease.lease_id]
+            self._check_finished()
+
+    def _lease(self, owner) -> dict:
+        if self._pending:
+            _lease = Lease(
+                next(self._lease_ids),
+                self._pending.popleft(),
+                owner,
+                time.monotonic() + self.lease_timeout,
+            )
+            self._leases[_lease.lease_id] = _lease
+            return {
+                "op": "batch",
+                "lease": _lease.lease_id,
+                "urls": list(_lease.urls.items()),
+                "lease_timeout": self.lease_timeout,
+            }
+        if self._leases:
+            return {"op": "wait", "seconds": 1}
+        return {"op": "done"}
+
+    def _record(self, lease, result):
+        if lease.urls.pop(result.url, False) is False:
+            return
+        if result.status == 304 and self.conditional:
+            self.status_counts[VALIDATED] += 1
+        elif result.error is None:
+            self.status_counts[result.status] += 1
+        else:
+            self.status_counts["Error: %s" % result.error] += 1
+        self.latency_stats.record(result)
+        if self.result_sink is not None:
+            self.result_sink(result)
+
+
+class StreamSink:
+    """Result sink that streams results to the coordinator in batches.
+
+    Dead letters are sent through :meth:`dead_letter`, in order with the results, so
+    that the coordinator always sees the result of a URL before its dead letter.
+    Results are only sent by :meth:`drain`, which the crawler awaits after each
+    result (see :class:`~SiteCrawlerQuick.SiteCrawlerQuick`), and which waits for the
+    coordinator to take them in. A coordinator that falls behind thus holds the crawl
+    back, rather than results piling up in memory.
+
+    Args:
+        writer (obj): the asyncio StreamWriter connected to the coordinator
+        lease_id (int): the lease that the results belong to
+        buffer_size (:obj:`int`, optional): most results to hold before sending them
+            (default: ``200``)
+        flush_interval (:obj:`float`, optional): most seconds to hold a result before
+            sending it (default: ``0.25``)
+
+    """
+
+    def __init__(self, writer, lease_id, buffer_size=200, flush_interval=0.25):
+        """Create the sink."""
+        self.writer = writer
+        self.lease_id = lease_id
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._flushed_at = time.monotonic()
+        # Keeps batches in order while the crawler's workers wait on the coordinator
+        self._lock = asyncio.Lock()
+
+    def __call__(self, result):
+        """Send a result, batching it with others for a while."""
+        self._append("result", result)
+
+    def dead_letter(self, result):
+        """Send a result that failed for good."""
+        self._append("dead_letter", result)
+
+    def _append(self, kind, result):
+        self._buffer.append((kind, encode_result(result)))
+
+    async def drain(self):
+        """Send the buffered results if they are due, waiting for the coordinator."""
+        if len(self._buffer) >= self.buffer_size:
+            await self.flush()
+        elif time.monotonic() - self._flushed_at >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self):
+        """Send every buffered result, waiting for the coordinator to take them in."""
+        _results, self._buffer = self._buffer, []
+        self._flushed_at = time.monotonic()
+        async with self._lock:
+            if _results:
+                await _send(
+                    self.writer,
+                    {"op": "results", "lease": self.lease_id, "results": _results},
+                )
+
+
+class Worker:
+    """Crawl batches of URLs leased from a :class:`Coordinator` until it is done.
+
+    Args:
+        host (str): address of the coordinator
+        port (int): port of the coordinator
+        crawler_factory (callable): called as ``crawler_factory(urls, result_sink,
+            dead_letter_sink)`` to build the :class:`~SiteCrawlerQuick.SiteCrawlerQuick`
+            for each batch
+        connect_timeout (:obj:`float`, optional): seconds to keep trying to connect to
+            the coordinator, which only starts listening once it has read the sitemap
+            (default: ``600``)
+        verbosity (:obj:`int`, optional): verbosity setting (default: ``50``)
+
+    Attributes:
+        status_counts (collections.Counter): Number of URLs crawled per status by this worker.
+        latency_stats (LatencyStats): Percentiles of the time taken by this worker's requests.
+        dead_letter_count (int): Number of URLs that failed for good.
+        concurrency (None): Not reported on for a worker.
+        result_sink (None): Results are sent to the coordinator instead.
+
+    """
+
+    def __init__(self, host, port, crawler_factory, connect_timeout=600, verbosity=50):
+        """Create the worker."""
+        self.host = host
+        self.port = port
+        self.crawler_factory = crawler_factory
+        self.connect_timeout = connect_timeout
+        self.glooplog = GloopLog(verbosity=verbosity)
+        self.status_counts = collections.Counter()
+        self.latency_stats = LatencyStats()
+        self.dead_letter_count = 0
+        self.concurrency = None
+        self.result_sink = None
+
+    async def run(self):
+        """Lease and crawl batches until the coordinator has no more."""
+        reader, writer = await self._connect()
+        try:
+            while True:
+                await _send(writer, {"op": "lease"})
+                _line = await reader.readline()
+                if not _line:
+                    break
+                _message = json.loads(_line)
+                if _message["op"] == "batch":
+                    await self._crawl_batch(_message, writer)
+                elif _message["op"] == "wait":
+                    await asyncio.sleep(_message["seconds"])
+                else:
+                    break
+        finally:
+            writer.close()
+
+    async def _connect(self) -> tuple:
+        """Connect to the coordinator, retrying with backoff until ``connect_timeout``.
+
+        Returns:
+            tuple: the ``(reader, writer)`` streams of the connection
+
+        Raises:
+            OSError: if the coordinator could not be reached in time
+
+        """
+        _deadline = time.monotonic() + self.connect_timeout
+        _backoff = RetryPolicy(base_delay=0.5, max_delay=10)
+        for _attempt in itertools.count():
+            try:
+                return await asyncio.open_connection(
+                    self.host, self.port, limit=LINE_LIMIT
+                )
+            except OSError as e:
+                _delay = _backoff.backoff(_attempt)
+                if time.monotonic() + _delay > _deadline:
+                    raise
+                self.glooplog.logit(
+                    level="info",
+                    msg="Cannot reach the coordinator at %s:%s (%s), retrying in %.1fs"
+                    % (self.host, self.port, e, _delay),
+                )
+                await asyncio.sleep(_delay)
+
+    async def _crawl_batch(self, message, writer):
+        _lease_id = message["lease"]
+        self.glooplog.logit(
+            level="info",
+            msg="Crawling lease %s (%s URLs)" % (_lease_id, len(message["urls"])),
+        )
+        _result_sink = StreamSink(writer, _lease_id)
+        _crawler = self.crawler_factory(
+            dict(message["urls"]), _result_sink, _result_sink.dead_letter
+        )
+        _heartbeat = asyncio.ensure_future(
+            self._renew(writer, _lease_id, message["lease_timeout"] / 3.0)
+        )
+        try:
+            await _crawler.crawl_sites()
+        finally:
+            _heartbeat.cancel()
+        await _result_sink.flush()
+        await _send(writer, {"op": "complete", "lease": _lease_id})
+        self.status_counts.update(_crawler.status_counts)
+        self.latency_stats.merge(_crawler.latency_stats)
+        self.dead_letter_count += _crawler.dead_letter_count
+
+    async def _renew(self, writer, lease_id, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await _send(writer, {"op": "renew", "lease": lease_id})
@@ -0,0 +1,270 @@
+"""Encode the screenshots of a snapshot, and their thumbnails, in a pool of processes."""
+import concurrent.futures
+import hashlib
+import io
+import multiprocessing
+import struct
+
+from SiteGloopErrors import ImageEncodingError
+
+try:
+    from PIL import Image
+except ImportError:  # Screenshots can only be written as they are without Pillow
+    Image = None
+
+#: Formats that screenshots can be written in, and the extension of their files.
+IMAGE_FORMATS = {"png": "png", "webp": "webp", "jpeg": "jpg"}
+
+# Largest width or height of a WebP image; larger screenshots are written as JPEG
+_WEBP_MAX_SIZE = 16383
+
+# Thumbnails show the top of a page, at most this many times as tall as it is wide
+_THUMBNAIL_ASPECT = 1.5
+
+
+def png_size(png) -> tuple:
+    """Read the dimensions of a PNG from its header.
+
+    Args:
+        png (bytes): the PNG
+
+    Returns:
+        tuple: ``(width, height)``, or ``(None, None)`` if ``png`` is not a PNG
+
+    """
+    if png[:8] != b"\x89PNG\r\n\x1a\n" or len(png) < 24:
+        return None, None
+    return struct.unpack(">II", png[16:24])
+
+
+def dhash(image, hash_size=16) -> str:
+    """Compute the difference hash (dHash) of an image.
+
+    Each bit records whether a pixel of a small greyscale copy of the image is
+    brighter than the pixel to its right, so images that look the same have the same
+    hash even if their bytes differ (such as after being encoded again).
+
+    Args:
+        image (PIL.Image.Image): the image
+        hash_size (:obj:`int`, optional): rows and columns of the hash, which has
+            ``hash_size ** 2`` bits (default: ``16``)
+
+    Returns:
+        str: the hash, in hex
+
+    """
+    _small = image.convert("L").resize((hash_size + 1, hash_size))
+    _pixels = list(_small.getdata())
+    _bits = 0
+    for _row in range(hash_size):
+        _offset = _row * (hash_size + 1)
+        for _column in range(hash_size):
+            _left = _pixels[_offset + _column]
+            _bits = (_bits << 1) | (_left > _pixels[_offset + _column + 1])
+    return "%0*x" % (hash_size * hash_size // 4, _bits)
+
+
+class EncodedImage:
+    """A screenshot, as it is to be written, and its thumbnail.
+
+    Args:
+        data (bytes): the image
+        extension (str): extension of the image file, such as ``"webp"``
+        width (:obj:`int`, optional): width of the image, in pixels
+        height (:obj:`int`, optional): height of the image, in pixels
+        thumbnail (:obj:`bytes`, optional): the thumbnail, in the same format
+        phash (:obj:`str`, optional): perceptual hash of the image (see :func:`dhash`)
+        pixels (:obj:`str`, optional): SHA-256 hash of the decoded pixels of the image,
+            which is the same for images that look identical but are encoded
+            differently
+
+    """
+
+    __slots__ = ("data", "extension", "width", "height", "thumbnail", "phash", "pixels")
+
+    def __init__(
+        self,
+        data,
+        extension,
+        width=None,
+        height=None,
+        thumbnail=None,
+        phash=None,
+        pixels=None,
+    ):
+        """Create the image."""
+        self.data = data
+        self.extension = extension
+        self.width = width
+        self.height = height
+        self.thumbnail = thumbnail
+        self.phash = phash
+        self.pixels = pixels
+
+
+def _save(image, image_format, quality) -> bytes:
+    if image_format == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    _buffer = io.BytesIO()
+    if image_format == "png":
+        image.save(_buffer, "PNG")
+    else:
+        image.save(_buffer, image_format.upper(), quality=quality)
+    return _buffer.getvalue()
+
+
+def encode_image(
+    png, image_format="png", quality=80, thumbnail_width=0, hash_size=0
+) -> EncodedImage:
+    """Encode a screenshot, make its thumbnail, and compute its perceptual hashes.
+
+    A PNG that is neither encoded again nor hashed is not decoded at all. WebP images
+    can be at most 16383 pixels tall, so taller screenshots are written as JPEG.
+
+    Args:
+        png (bytes): the screenshot, as a PNG
+        image_format (:obj:`str`, optional): ``"png"``, ``"webp"`` or ``"jpeg"``
+            (default: ``"png"``)
+        quality (:obj:`int`, optional): quality of WebP and JPEG images, from ``1`` to
+            ``100`` (default: ``80``)
+        thumbnail_width (:obj:`int`, optional): width of the thumbnail, or ``0`` for
+            none (default: ``0``)
+        hash_size (:obj:`int`, optional): rows and columns of the perceptual hash, or
+            ``0`` for none, in which case the pixels are not hashed either (default:
+            ``0``)
+
+    Returns:
+        EncodedImage: the image, with its thumbnail and perceptual hashes
+
+    Raises:
+        ImageEncodingError: if Pillow is needed but is not installed
+
+    """
+    if image_format == "png" and not thumbnail_width:
+        if not hash_size or Image is None:
+            return EncodedImage(png, "png", *png_size(png))
+    if Image is None:
+        raise ImageEncodingError()
+    with Image.open(io.BytesIO(png)) as _image:
+        _image.load()
+        _width, _height = _image.size
+        _phash = _pixels = None
+        if hash_size:
+            _phash = dhash(_image, hash_size)
+            _pixels = hashlib.sha256(_image.convert("RGB").tobytes()).hexdigest()
+        _format = image_format
+        if _format == "webp" and max(_width, _height) > _WEBP_MAX_SIZE:
+            _format = "jpeg"
+        _data = png if _format == "png" else _save(_image, _format, quality)
+        _thumbnail = None
+        if thumbnail_width:
+            _top_height = min(_height, int(_width * _THUMBNAIL_ASPECT))
+            _top = _image.crop((0, 0, _width, _top_height))
+            _top.thumbnail(
+                (thumbnail_width, int(thumbnail_width * _THUMBNAIL_ASPECT)),
+                Image.LANCZOS,
+            )
+            _thumbnail = _save(_top, _format, quality)
+    return EncodedImage(
+        _data, IMAGE_FORMATS[_format], _width, _height, _thumbnail, _phash, _pixels
+    )
+
+
+class ImageEncoder:
+    """Encode screenshots in a pool of processes, off the writer threads.
+
+    Decoding and encoding large images holds the GIL for seconds, so it is done in
+    separate processes to let several screenshots be encoded at once. Encoding is
+    done in the calling thread instead if there is nothing to decode (PNG
+    screenshots, without thumbnails or perceptual hashes), or if ``processes`` is
+    ``0``. The pool is started by entering the encoder as a context manager; its
+    processes are spawned rather than forked.
+
+    Args:
+        image_format (:obj:`str`, optional): ``"png"``, ``"webp"`` or ``"jpeg"``
+            (default: ``"png"``)
+        quality (:obj:`int`, optional): quality of WebP and JPEG images, from ``1`` to
+            ``100`` (default: ``80``)
+        thumbnail_width (:obj:`int`, optional): width of thumbnails, or ``0`` for none
+            (default: ``0``)
+        hash_size (:obj:`int`, optional): rows and columns of perceptual hashes, or
+            ``0`` for none (default: ``0``)
+        processes (:obj:`int`, optional): number of processes to encode with (default:
+            one per CPU)
+
+    Raises:
+        ImageEncodingError: if Pillow is needed but is not installed
+
+    Example::
+
+        with ImageEncoder("webp", quality=75, thumbnail_width=400) as encoder:
+            image = encoder.encode(png)
+
+    """
+
+    def __init__(
+        self,
+        image_format="png",
+        quality=80,
+        thumbnail_width=0,
+        hash_size=0,
+        processes=None,
+    ):
+        """Check that the images can be encoded."""
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError("Unknown image format: %s" % image_format)
+        if Image is None and (image_format != "png" or thumbnail_width):
+            raise ImageEncodingError()
+        self.image_format = image_format
+        self.quality = quality
+        self.thumbnail_width = thumbnail_width
+        self.hash_size = hash_size if Image is not None else 0
+        self.processes = processes
+        self._pool = None
+
+    @property
+    def decodes(self) -> bool:
+        """bool: whether screenshots are decoded, so are worth encoding in a pool."""
+        return bool(
+            self.image_format != "png" or self.thumbnail_width or self.hash_size
+        )
+
+    def encode(self, png) -> EncodedImage:
+        """Encode a screenshot, waiting for a process of the pool to do it.
+
+        Args:
+            png (bytes): the screenshot, as a PNG
+
+        Returns:
+            EncodedImage: the image, with its thumbnail and perceptual hashes
+
+        """
+        _args = (
+            png,
+            self.image_format,
+            self.quality,
+            self.thumbnail_width,
+            self.hash_size,
+        )
+        if self._pool is None:
+            return encode_image(*_args)
+        return self._pool.submit(encode_image, *_args).result()
+
+    def close(self):
+        """Shut the pool down, once the images being encoded are done."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        if self.decodes and self.processes != 0:
+            # The workers are started from a writer thread while the browser threads
+            # run, and forking a threaded process can deadlock on a lock held by
+            # another thread, so they are started afresh instead
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                self.processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,326 @@
+"""Time the phases of each request, and summarize them as percentiles."""
+import collections
+import math
+import time
+import urllib.parse
+
+import aiohttp
+
+#: Phases of a request that are timed.
+PHASES = ("dns", "connect", "ttfb", "total")
+
+#: Percentiles shown in the summary tables.
+PERCENTILES = (50, 90, 99)
+
+RequestTiming = collections.namedtuple("RequestTiming", PHASES)
+RequestTiming.__doc__ = """How long each phase of a request took, in seconds.
+
+Phases that did not happen during the request (such as ``dns`` when the lookup was
+cached, or ``connect`` when a pooled connection was reused) are ``None``.
+
+Attributes:
+    dns (float): resolving the host name
+    connect (float): opening the connection, including the TLS handshake (aiohttp does
+        not report the handshake separately)
+    ttfb (float): from the start of the request until the response headers were received
+    total (float): from the start of the request until the whole body was received
+
+"""
+
+
+def _timings(context):
+    _timings = context.trace_request_ctx
+    return _timings if isinstance(_timings, dict) else None
+
+
+async def _on_request_start(session, context, params):
+    _t = _timings(context)
+    if _t is not None:
+        _t.setdefault("start", time.monotonic())
+
+
+async def _on_dns_resolvehost_start(session, context, params):
+    _t = _timings(context)
+    if _t is not None:
+        _t["dns_start"] = time.monotonic()
+
+
+async def _on_dns_resolvehost_end(session, context, params):
+    _t = _timings(context)
+    if _t is not None and "dns_start" in _t:
+        _t["dns"] = _t.get("dns", 0.0) + time.monotonic() - _t.pop("dns_start")
+
+
+async def _on_connection_create_start(session, context, params):
+    _t = _timings(context)
+    if _t is not None:
+        _t["connect_start"] = time.monotonic()
+
+
+async def _on_connection_create_end(session, context, params):
+    _t = _timings(context)
+    if _t is not None and "connect_start" in _t:
+        _t["connect"] = (
+            _t.get("connect", 0.0) + time.monotonic() - _t.pop("connect_start")
+        )
+
+
+async def _on_request_end(session, context, params):
+    _t = _timings(context)
+    if _t is not None and "start" in _t:
+        _t["ttfb"] = time.monotonic() - _t["start"]
+
+
+def trace_config() -> aiohttp.TraceConfig:
+    """Create a trace config that times the phases of each request.
+
+    Only requests made with a dict as their ``trace_request_ctx`` are timed. The
+    ``dns``, ``connect`` and ``ttfb`` phases (see :class:`RequestTiming`) are stored in
+    that dict, in seconds.
+
+    Returns:
+        aiohttp.TraceConfig: a trace config to pass to :class:`aiohttp.ClientSession`
+
+    Example::
+
+        async with aiohttp.ClientSession(trace_configs=[trace_config()]) as session:
+            timings = {}
+            async with session.get(url, trace_request_ctx=timings) as resp:
+                ...
+            print(timings.get("ttfb"))
+
+    """
+    _config = aiohttp.TraceConfig()
+    _config.on_request_start.append(_on_request_start)
+    _config.on_dns_resolvehost_start.append(_on_dns_resolvehost_start)
+    _config.on_dns_resolvehost_end.append(_on_dns_resolvehost_end)
+    _config.on_connection_create_start.append(_on_connection_create_start)
+    _config.on_connection_create_end.append(_on_connection_create_end)
+    _config.on_request_end.append(_on_request_end)
+    return _config
+
+
+class LogHistogram:
+    """Histogram with logarithmically sized buckets.
+
+    Each bucket is ``growth`` times wider than the one before it, so percentiles are
+    accurate to within ``growth`` (10% by default) of the true value, whatever the
+    scale. Memory use is fixed by the range of values, not by how many are added.
+
+    Args:
+        min_value (:obj:`float`, optional): lower edge of the first bucket; smaller values
+            are counted in it (default: ``0.0001``)
+        max_value (:obj:`float`, optional): upper edge of the last bucket; larger values
+            are counted in it (default: ``1000``)
+        growth (:obj:`float`, optional): ratio between the widths of adjacent buckets
+            (default: ``1.1``)
+
+    Attributes:
+        count (int): the number of values added
+        min (float): the smallest value added
+        max (float): the largest value added
+
+    """
+
+    def __init__(self, min_value=0.0001, max_value=1000, growth=1.1):
+        """Create an empty histogram."""
+        self.min_value = min_value
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self._buckets = [0] * (self._bucket(max_value) + 1)
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def _bucket(self, value) -> int:
+        if value <= self.min_value:
+            return 0
+        return int(math.log(value / self.min_value) / self._log_growth)
+
+    def add(self, value):
+        """Add a value to the histogram.
+
+        Args:
+            value (float): the value to add
+
+        """
+        self._buckets[min(self._bucket(value), len(self._buckets) - 1)] += 1
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Add every value counted by another histogram with the same buckets.
+
+        Args:
+            other (LogHistogram): the histogram to add
+
+        """
+        for _i, _count in enumerate(other._buckets):
+            self._buckets[_i] += _count
+        self.count += other.count
+        for _value in (other.min, other.max):
+            if _value is not None:
+                self.min = _value if self.min is None else min(self.min, _value)
+                self.max = _value if self.max is None else max(self.max, _value)
+
+    def percentile(self, percent) -> float:
+        """Estimate a percentile of the values added.
+
+        Args:
+            percent (float): the percentile, from ``0`` to ``100``
+
+        Returns:
+            float: the estimated value, or ``None`` if the histogram is empty
+
+        """
+        if not self.count:
+            return None
+        _rank = max(1, math.ceil(self.count * percent / 100.0))
+        _seen = 0
+        for _i, _count in enumerate(self._buckets):
+            _seen += _count
+            if _seen >= _rank:
+                break
+        # Report the middle of the bucket, within the range actually seen.
+        _value = self.min_value * self.growth ** (_i + 0.5)
+        return max(self.min, min(self.max, _value))
+
+
+class LatencyStats:
+    """Percentiles of request timings, by status class and by path prefix.
+
+    Only a :class:`LogHistogram` per phase is kept for each status class (``2xx``,
+    ``3xx``, ..., or ``error``) and each path prefix (the first segment of the path,
+    such as ``/blog/``), so memory use does not grow with the number of requests.
+
+    Args:
+        max_prefixes (:obj:`int`, optional): most path prefixes to keep separately;
+            requests to any others are counted under ``(other)`` (default: ``50``)
+
+    Attributes:
+        by_status (dict): ``{status class: {phase: LogHistogram}}``
+        by_prefix (dict): ``{path prefix: {phase: LogHistogram}}``
+
+    """
+
+    def __init__(self, max_prefixes=50):
+        """Create empty statistics."""
+        self.max_prefixes = max_prefixes
+        self.by_status = {}
+        self.by_prefix = {}
+
+    @staticmethod
+    def status_class(result) -> str:
+        """Group a result by the first digit of its response code.
+
+        Args:
+            result (CrawlResult): the outcome of crawling a URL
+
+        Returns:
+            str: for example ``"2xx"``, or ``"error"`` if no response was received
+
+        """
+        if result.status is None:
+            return "error"
+        return "%sxx" % (result.status // 100)
+
+    def path_prefix(self, url) -> str:
+        """Group a URL by the first segment of its path.
+
+        Args:
+            url (str): the URL that was requested
+
+        Returns:
+            str: for example ``"/blog/"``, or ``"(other)"`` once ``max_prefixes`` is reached
+
+        """
+        _path = urllib.parse.urlsplit(url).path
+        _segment, _sep, _rest = _path.lstrip("/").partition("/")
+        _prefix = "/%s%s" % (_segment, _sep)
+        if _prefix not in self.by_prefix and len(self.by_prefix) >= self.max_prefixes:
+            return "(other)"
+        return _prefix
+
+    @staticmethod
+    def _add(groups, key, timing):
+        if key not in groups:
+            groups[key] = {_phase: LogHistogram() for _phase in PHASES}
+        for _phase, _value in zip(PHASES, timing):
+            if _value is not None:
+                groups[key][_phase].add(_value)
+
+    def record(self, result):
+        """Add the timings of a request.
+
+        Args:
+            result (CrawlResult): the outcome of crawling a URL, with its ``timing``
+
+        """
+        if result.timing is None:
+            return
+        self._add(self.by_status, self.status_class(result), result.timing)
+        self._add(self.by_prefix, self.path_prefix(result.url), result.timing)
+
+    def merge(self, other):
+        """Add every timing recorded by another set of statistics.
+
+        Args:
+            other (LatencyStats): the statistics to add
+
+        """
+        for _groups, _other_groups in (
+            (self.by_status, other.by_status),
+            (self.by_prefix, other.by_prefix),
+        ):
+            for _key, _histograms in _other_groups.items():
+                if _key not in _groups:
+                    _groups[_key] = {_phase: LogHistogram() for _phase in PHASES}
+                for _phase, _histogram in _histograms.items():
+                    _groups[_key][_phase].merge(_histogram)
+
+    def format_table(self, title, groups) -> str:
+        """Format the percentiles of some groups as a table, in milliseconds.
+
+        Args:
+            title (str): the heading of the first column
+            groups (dict): ``{group: {phase: LogHistogram}}``
+
+        Returns:
+            str: the table
+
+        """
+        _width = max([len(title)] + [len(_key) for _key in groups])
+        _header = ["%-*s" % (_width, title), "%-7s" % "phase", "%8s" % "count"]
+        _header += ["%9s" % ("p%s" % _percent) for _percent in PERCENTILES]
+        _lines = [" ".join(_header)]
+        for _key in sorted(groups):
+            _label = _key
+            for _phase in PHASES:
+                _histogram = groups[_key][_phase]
+                if not _histogram.count:
+                    continue
+                _row = ["%-*s" % (_width, _label), "%-7s" % _phase]
+                _row.append("%8d" % _histogram.count)
+                _row += [
+                    "%9.1f" % (_histogram.percentile(_percent) * 1000)
+                    for _percent in PERCENTILES
+                ]
+                _lines.append(" ".join(_row))
+                _label = ""
+        return "\n".join(_lines)
+
+    def format_tables(self) -> str:
+        """Format the percentiles by status class and by path prefix.
+
+        Returns:
+            str: both tables, with latencies in milliseconds
+
+        """
+        return (
+            "Latency by status class (ms):\n%s\n\nLatency by path prefix (ms):\n%s"
+            % (
+                self.format_table("status", self.by_status),
+                self.format_table("prefix", self.by_prefix),
+            )
+        )
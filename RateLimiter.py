@@ -0,0 +1,149 @@
+"""Limit the rate at which requests are made, globally and per host."""
+import asyncio
+import email.utils
+import time
+
+
+def parse_retry_after(value):
+    """Parse the value of a ``Retry-After`` header.
+
+    Args:
+        value (str): either a number of seconds or an HTTP date
+
+    Returns:
+        float: the number of seconds to wait, or None if the value could not be parsed
+
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        _when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if _when is None:
+        return None
+    return max(0.0, _when.timestamp() - time.time())
+
+
+class TokenBucket:
+    """Token bucket that spaces out requests to a steady rate.
+
+    Each call to :meth:`acquire` reserves the next available token and sleeps until
+    it is due, so waiting callers are let through in the order they arrived.
+
+    Args:
+        rate (:obj:`float`, optional): tokens added per second, or ``None`` for no limit
+            (default: ``None``)
+        burst (:obj:`int`, optional): number of tokens that may be used at once after
+            the bucket has been idle (default: ``1``)
+
+    Attributes:
+        rate (float): tokens added per second
+        burst (int): number of tokens that may be used at once
+        paused_until (float): :func:`time.monotonic` time until which no tokens are handed out
+
+    """
+
+    def __init__(self, rate=None, burst=1):
+        """Create the bucket."""
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.paused_until = 0.0
+        self._next_token_at = 0.0
+
+    def _reserve(self) -> float:
+        _now = time.monotonic()
+        _start = max(_now, self.paused_until)
+        if self.rate:
+            _interval = 1.0 / self.rate
+            _due = max(self._next_token_at, _start)
+            _start = max(_start, _due - (self.burst - 1) * _interval)
+            self._next_token_at = _due + _interval
+        return _start - _now
+
+    async def acquire(self) -> None:
+        """Wait until a token is available, then take it."""
+        _delay = self._reserve()
+        if _delay > 0:
+            await asyncio.sleep(_delay)
+        # The bucket may have been paused while we were waiting.
+        _delay = self.paused_until - time.monotonic()
+        if _delay > 0:
+            await asyncio.sleep(_delay)
+
+    def pause(self, seconds) -> None:
+        """Stop handing out tokens for a while.
+
+        Args:
+            seconds (float): number of seconds to pause for
+
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """Requests-per-second limiter with an optional limit for each host.
+
+    Hosts can also be paused, such as when they respond with ``429 Too Many
+    Requests`` or ``503 Service Unavailable`` and a ``Retry-After`` header.
+
+    Args:
+        rate (:obj:`float`, optional): requests per second across all hosts, or ``None``
+            for no limit (default: ``None``)
+        host_rate (:obj:`float`, optional): requests per second to each host, or ``None``
+            for no limit (default: ``None``)
+        burst (:obj:`int`, optional): number of requests that may be made at once after
+            an idle period (default: ``1``)
+        max_pause (:obj:`float`, optional): longest that a host will be paused for, in
+            seconds (default: ``120``)
+
+    Attributes:
+        rate (float): requests per second across all hosts
+        host_rate (float): requests per second to each host
+        burst (int): number of requests that may be made at once after an idle period
+        max_pause (float): longest that a host will be paused for, in seconds
+
+    """
+
+    def __init__(self, rate=None, host_rate=None, burst=1, max_pause=120):
+        """Create the limiter."""
+        self.rate = rate
+        self.host_rate = host_rate
+        self.burst = burst
+        self.max_pause = max_pause
+        self._bucket = TokenBucket(rate, burst)
+        self._host_buckets = {}
+
+    def _host_bucket(self, host) -> TokenBucket:
+        if host not in self._host_buckets:
+            self._host_buckets[host] = TokenBucket(self.host_rate, self.burst)
+        return self._host_buckets[host]
+
+    async def acquire(self, host) -> None:
+        """Wait until a request may be made to a host.
+
+        Args:
+            host (str): the host that the request will be made to
+
+        """
+        await self._host_bucket(host).acquire()
+        await self._bucket.acquire()
+
+    def pause(self, host, seconds) -> bool:
+        """Stop making requests to a host for a while.
+
+        Args:
+            host (str): the host to pause
+            seconds (float): number of seconds to pause for
+
+        Returns:
+            bool: True if the host was paused, False if ``seconds`` is more than ``max_pause``
+
+        """
+        if seconds > self.max_pause:
+            return False
+        self._host_bucket(host).pause(seconds)
+        return True
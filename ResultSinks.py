@@ -0,0 +1,265 @@
+"""Write crawl results out as each one completes."""
+import asyncio
+import csv
+import io
+import json
+import sys
+import time
+
+from colored import attr, fg
+
+#: Fields written for each result.
+RECORD_FIELDS = ("url", "status", "bytes", "latency", "error")
+
+
+def result_record(result) -> dict:
+    """Flatten a result into the fields that are written out.
+
+    Args:
+        result (CrawlResult): the outcome of crawling a URL
+
+    Returns:
+        dict: the :data:`RECORD_FIELDS` of the result, with ``latency`` in seconds
+
+    """
+    _latency = None
+    if result.timing is not None:
+        _latency = round(result.timing.total, 6)
+    return {
+        "url": result.url,
+        "status": result.status,
+        "bytes": result.bytes,
+        "latency": _latency,
+        "error": result.error,
+    }
+
+
+class ResultSink:
+    """Buffered writer for crawl results.
+
+    A sink is called with each :class:`~SiteCrawlerQuick.CrawlResult` (so it can be
+    passed as the ``result_sink`` of :class:`~SiteCrawlerQuick.SiteCrawlerQuick`).
+    Formatted results are buffered, and written out whenever ``buffer_size`` of them
+    are waiting or ``flush_interval`` seconds after the first of them was buffered, so
+    a run that dies part way through loses at most the last moment of results. Within
+    an event loop, a timer writes them out, even if no more results arrive; otherwise
+    the interval is checked as each result arrives.
+
+    Subclasses implement :meth:`format` (and :meth:`header`, if they have one).
+
+    Args:
+        output (:obj:`str` or file, optional): path of the file to write to, or an open
+            file (default: ``sys.stdout``)
+        buffer_size (:obj:`int`, optional): most results to hold before writing them out
+            (default: ``1000``)
+        flush_interval (:obj:`float`, optional): most seconds to hold a result before
+            writing it out (default: ``1.0``)
+
+    Attributes:
+        count (int): the number of results written
+
+    Example::
+
+        with NdjsonSink("results.ndjson") as sink:
+            crawler = SiteCrawlerQuick(urls, result_sink=sink)
+            await crawler.crawl_sites()
+
+    """
+
+    #: Keyword arguments used to open ``output`` when it is a path.
+    open_kwargs = {}
+
+    def __init__(self, output=None, buffer_size=1000, flush_interval=1.0):
+        """Create the sink, opening ``output`` if it is a path."""
+        if output is None:
+            output = sys.stdout
+        self._owns_stream = isinstance(output, str)
+        if self._owns_stream:
+            output = open(output, "w", **self.open_kwargs)
+        self.stream = output
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._buffer = []
+        self._flushed_at = time.monotonic()
+        self._timer = None
+        _header = self.header()
+        if _header:
+            self._buffer.append(_header)
+
+    def header(self) -> str:
+        """Text written before the first result.
+
+        Returns:
+            str: the header, or an empty string for none
+
+        """
+        return ""
+
+    def format(self, result) -> str:
+        """Format a single result.
+
+        Args:
+            result (CrawlResult): the outcome of crawling a URL
+
+        Returns:
+            str: the text to write, including its line ending
+
+        """
+        raise NotImplementedError
+
+    def __call__(self, result):
+        """Write a result, buffering it for a while.
+
+        Args:
+            result (CrawlResult): the outcome of crawling a URL
+
+        """
+        self._buffer.append(self.format(result))
+        self.count += 1
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+        elif self._timer is None:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            _loop = asyncio.get_running_loop()
+        except RuntimeError:
+            if time.monotonic() - self._flushed_at >= self.flush_interval:
+                self.flush()
+            return
+        self._timer = _loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        """Write out every buffered result."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._buffer:
+            self.stream.write("".join(self._buffer))
+            self._buffer = []
+        self.stream.flush()
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        """Write out every buffered result, then close ``output`` if it was opened."""
+        self.flush()
+        if self._owns_stream:
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NdjsonSink(ResultSink):
+    """Write each result as a line of JSON (see :func:`result_record`)."""
+
+    def format(self, result) -> str:
+        """Format a result as a line of JSON."""
+        return json.dumps(result_record(result), separators=(",", ":")) + "\n"
+
+
+class CsvSink(ResultSink):
+    """Write each result as a CSV row (see :func:`result_record`), after a header row."""
+
+    open_kwargs = {"newline": ""}
+
+    def _row(self, values) -> str:
+        _text = io.StringIO()
+        csv.writer(_text).writerow(values)
+        return _text.getvalue()
+
+    def header(self) -> str:
+        """Format the header row."""
+        return self._row(RECORD_FIELDS)
+
+    def format(self, result) -> str:
+        """Format a result as a CSV row."""
+        _record = result_record(result)
+        return self._row(
+            [
+                "" if _record[_field] is None else _record[_field]
+                for _field in RECORD_FIELDS
+            ]
+        )
+
+
+class UrlSink(ResultSink):
+    """Write the URL of each result on a line of its own.
+
+    The file can be read back in with ``sitegloop.py -u``, such as to crawl the URLs of
+    a dead-letter file again.
+    """
+
+    def format(self, result) -> str:
+        """Format a result as its URL."""
+        return result.url + "\n"
+
+
+class TerminalSink(ResultSink):
+    """Write each result as a colored ``url : status (latency)`` line.
+
+    On a terminal, lines start by clearing the current line, so they replace the
+    progress spinner rather than being tacked on to it.
+    """
+
+    def __init__(self, output=None, buffer_size=1000, flush_interval=0.25):
+        """Create the sink, writing to ``sys.stdout`` by default."""
+        super().__init__(output, buffer_size, flush_interval)
+        self._clear_line = "\r\x1b[K" if self.stream.isatty() else ""
+
+    def format(self, result) -> str:
+        """Format a result as a colored line."""
+        status = result.status
+        if result.error is not None:
+            status = "Error: %s" % result.error
+            status_color = "%s%s" % (attr("bold"), fg("red"))
+        elif status < 300 or status == 304:
+            # 304s answer conditional requests, confirming that the URL is unchanged
+            status_color = fg("green")
+        elif status < 400:
+            status_color = fg("yellow")
+        else:
+            status_color = "%s%s" % (attr("bold"), fg("red"))
+        _line = "%s : %s%s%s" % (result.url, status_color, status, attr("reset"))
+        if result.timing is not None:
+            _line += " (%d ms)" % (result.timing.total * 1000)
+        return "%s%s\n" % (self._clear_line, _line)
+
+
+class TeeSink:
+    """Hand each result to several sinks.
+
+    Args:
+        sinks (list): the sinks to write to
+
+    """
+
+    def __init__(self, sinks):
+        """Create the sink."""
+        self.sinks = list(sinks)
+
+    def __call__(self, result):
+        """Write a result to every sink."""
+        for _sink in self.sinks:
+            _sink(result)
+
+    def flush(self):
+        """Flush every sink."""
+        for _sink in self.sinks:
+            _sink.flush()
+
+    def close(self):
+        """Close every sink."""
+        for _sink in self.sinks:
+            _sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,114 @@
+"""Decide whether, and when, a failed request should be retried."""
+import asyncio
+import random
+
+import aiohttp
+
+#: Response codes that are retried by default.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+#: Errors that are retried by default.
+RETRY_ERRORS = (
+    asyncio.TimeoutError,
+    aiohttp.ServerDisconnectedError,
+    aiohttp.ClientConnectorError,
+    aiohttp.ClientOSError,
+    aiohttp.ClientPayloadError,
+)
+
+
+class RetryPolicy:
+    """Retry policy with jittered exponential backoff.
+
+    The number of retries can be set separately for each response code and each
+    error class. Before retry ``n`` (counting from ``0``) a random delay of between
+    ``0`` and ``min(max_delay, base_delay * 2 ** n)`` seconds is waited ("full
+    jitter"), so that many URLs failing at once are not all retried at once.
+
+    Args:
+        max_retries (:obj:`int`, optional): number of times to retry each of the
+            ``statuses`` and ``errors`` that have no number of their own (default: ``3``)
+        base_delay (:obj:`float`, optional): seconds to back off before the first retry
+            (default: ``0.5``)
+        max_delay (:obj:`float`, optional): longest that a retry is backed off for, in
+            seconds (default: ``30``)
+        statuses (:obj:`dict`, optional): number of retries for each response code, or a
+            list of response codes to retry ``max_retries`` times (default:
+            :data:`RETRY_STATUSES`)
+        errors (:obj:`dict`, optional): number of retries for each exception class, or a
+            list of exception classes to retry ``max_retries`` times (default:
+            :data:`RETRY_ERRORS`)
+
+    Attributes:
+        max_retries (int): number of retries for response codes and errors without one of
+            their own
+        base_delay (float): seconds to back off before the first retry
+        max_delay (float): longest that a retry is backed off for, in seconds
+        statuses (dict): number of retries for each response code
+        errors (dict): number of retries for each exception class
+
+    Example::
+
+        # Give up on 500s straight away, but retry timeouts up to 5 times
+        policy = RetryPolicy(
+            statuses={500: 0, 502: 3, 503: 3, 504: 3},
+            errors={asyncio.TimeoutError: 5, aiohttp.ClientConnectorError: 3},
+        )
+
+    """
+
+    def __init__(
+        self, max_retries=3, base_delay=0.5, max_delay=30, statuses=None, errors=None
+    ):
+        """Create the policy."""
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.statuses = self._retries_by_key(
+            RETRY_STATUSES if statuses is None else statuses
+        )
+        self.errors = self._retries_by_key(RETRY_ERRORS if errors is None else errors)
+
+    def _retries_by_key(self, keys) -> dict:
+        if isinstance(keys, dict):
+            return dict(keys)
+        return {_key: self.max_retries for _key in keys}
+
+    def retries_for_status(self, status) -> int:
+        """Number of times a response code may be retried.
+
+        Args:
+            status (int): the response code received
+
+        Returns:
+            int: the number of retries allowed, or ``None`` if it is never retried
+
+        """
+        return self.statuses.get(status)
+
+    def retries_for_error(self, error) -> int:
+        """Number of times an error may be retried.
+
+        Args:
+            error (Exception): the exception raised by the request
+
+        Returns:
+            int: the number of retries allowed, or ``None`` if it is never retried
+
+        """
+        for _cls in type(error).__mro__:
+            if _cls in self.errors:
+                return self.errors[_cls]
+        return None
+
+    def backoff(self, attempt) -> float:
+        """Seconds to wait before retrying.
+
+        Args:
+            attempt (int): the number of retries made so far
+
+        Returns:
+            float: a random delay, up to ``base_delay * 2 ** attempt`` seconds
+
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
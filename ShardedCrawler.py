@@ -0,0 +1,253 @@
+"""Crawl URLs with several processes, each crawling its own shard of them."""
+import asyncio
+import collections
+import multiprocessing
+import queue
+import time
+import traceback
+import zlib
+
+from LatencyStats import LatencyStats
+from SiteGloopErrors import WorkerError
+from UrlStore import UrlStore
+
+#: Seconds to wait for a message from the workers before checking that they are alive.
+POLL_INTERVAL = 0.5
+
+
+def shard_of(url, shards) -> int:
+    """Pick the shard that a URL belongs to.
+
+    The same URL always lands in the same shard, whichever process asks.
+
+    Args:
+        url (str): the URL to place
+        shards (int): the number of shards
+
+    Returns:
+        int: the shard, from ``0`` to ``shards - 1``
+
+    """
+    return zlib.crc32(url.encode("utf-8")) % shards
+
+
+class QueueSink:
+    """Result sink that sends results back to the parent process in batches.
+
+    Args:
+        results (obj): a :class:`multiprocessing.Queue` read by the parent process
+        kind (str): label of the messages, such as ``"result"`` or ``"dead_letter"``
+        shard (int): the shard being crawled
+        buffer_size (:obj:`int`, optional): most results to hold before sending them
+            (default: ``500``)
+        flush_interval (:obj:`float`, optional): most seconds to hold a result before
+            sending it (default: ``0.25``)
+
+    """
+
+    def __init__(self, results, kind, shard, buffer_size=500, flush_interval=0.25):
+        """Create the sink."""
+        self.results = results
+        self.kind = kind
+        self.shard = shard
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._flushed_at = time.monotonic()
+
+    def __call__(self, result):
+        """Send a result, batching it with others for a while."""
+        self._buffer.append(result)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+        elif time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Send every buffered result."""
+        if self._buffer:
+            self.results.put((self.kind, self.shard, self._buffer))
+            self._buffer = []
+        self._flushed_at = time.monotonic()
+
+
+def crawl_shard(crawler_factory, shard, shards, urls, results):
+    """Crawl one shard of the URLs; the target of each worker process.
+
+    The crawler's ``pool`` and ``validator_cache`` (if any) are closed once the shard
+    has been crawled.
+
+    Args:
+        crawler_factory (callable): builds the crawler, see :class:`ShardedCrawler`
+        shard (int): the shard to crawl
+        shards (int): the number of shards
+        urls (dict): the URLs of the shard, with their ``lastmod``
+        results (obj): a :class:`multiprocessing.Queue` read by the parent process
+
+    """
+    try:
+        _result_sink = QueueSink(results, "result", shard)
+        _dead_letter_sink = QueueSink(results, "dead_letter", shard)
+        _crawler = crawler_factory(shard, shards, urls, _result_sink, _dead_letter_sink)
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+        try:
+            _loop.run_until_complete(_crawler.crawl_sites())
+            if _crawler.pool is not None:
+                _loop.run_until_complete(_crawler.pool.close())
+        finally:
+            _loop.close()
+            if _crawler.validator_cache is not None:
+                _crawler.validator_cache.close()
+        _result_sink.flush()
+        _dead_letter_sink.flush()
+        _stats = (
+            dict(_crawler.status_counts),
+            _crawler.latency_stats,
+            _crawler.dead_letter_count,
+        )
+        results.put(("done", shard, _stats))
+    except BaseException:
+        results.put(("error", shard, traceback.format_exc()))
+        raise
+
+
+class ShardedCrawler:
+    """Crawl URLs with several worker processes, to make use of more than one CPU core.
+
+    The URLs are split into ``workers`` shards by a hash of each URL (see
+    :func:`shard_of`), and each shard is crawled by its own process, with its own
+    event loop, connection pool and :class:`~SiteCrawlerQuick.SiteCrawlerQuick`.
+    Results are sent back to the parent process in batches and handed to
+    ``result_sink`` there, and the statistics of every worker are merged once it is
+    done, so the crawl can be reported on as if it were made by a single crawler.
+
+    Args:
+        urls (dict): the URLs to crawl, with their ``lastmod``
+        workers (int): the number of worker processes
+        crawler_factory (callable): called in each worker process as
+            ``crawler_factory(shard, shards, urls, result_sink, dead_letter_sink)`` to
+            build the :class:`~SiteCrawlerQuick.SiteCrawlerQuick` for a shard; it must be
+            picklable (such as a module level function, or a :func:`functools.partial` of
+            one), and should split any limits (connections, rates) by ``shards``
+        result_sink (:obj:`callable`, optional): called in the parent process with each
+            :class:`~SiteCrawlerQuick.CrawlResult`
+        dead_letter_sink (:obj:`callable`, optional): called in the parent process with
+            each :class:`~SiteCrawlerQuick.CrawlResult` that failed for good
+        url_filter (:obj:`callable`, optional): called in the parent process with each URL
+            and its ``lastmod``; the URL is only crawled if it returns True
+        rewrite_url (:obj:`callable`, optional): called in the parent process with each URL,
+            and returns the URL to crawl instead (such as
+            :meth:`~SiteCrawlerQuick.SiteCrawlerQuick.rewrite_url`)
+
+    Attributes:
+        workers (int): the number of worker processes
+        status_counts (collections.Counter): Number of URLs crawled per status, across
+            every worker.
+        latency_stats (LatencyStats): Percentiles of the time taken by requests, across
+            every worker.
+        dead_letter_count (int): Number of URLs that failed for good.
+        concurrency (None): Adaptive concurrency is reported on by each worker, not here.
+
+    """
+
+    def __init__(
+        self,
+        urls,
+        workers,
+        crawler_factory,
+        result_sink=None,
+        dead_letter_sink=None,
+        url_filter=None,
+        rewrite_url=None,
+    ):
+        """Create the crawler."""
+        self.urls = urls
+        self.workers = max(1, workers)
+        self.crawler_factory = crawler_factory
+        self.result_sink = result_sink
+        self.dead_letter_sink = dead_letter_sink
+        self.url_filter = url_filter
+        self.rewrite_url = rewrite_url
+        self.status_counts = collections.Counter()
+        self.latency_stats = LatencyStats()
+        self.dead_letter_count = 0
+        self.concurrency = None
+
+    def shard_urls(self) -> list:
+        """Split the URLs to crawl into shards.
+
+        Returns:
+            list: a :class:`~UrlStore.UrlStore` of the URLs for each worker, which is
+                compact to send to the worker process
+
+        """
+        _shards = [UrlStore() for _ in range(self.workers)]
+        for _url, _lastmod in self.urls.items():
+            if self.rewrite_url is not None:
+                _url = self.rewrite_url(_url)
+            if self.url_filter is None or self.url_filter(_url, _lastmod):
+                _shards[shard_of(_url, self.workers)][_url] = _lastmod
+        return _shards
+
+    async def crawl_sites(self) -> None:
+        """Crawl every shard, each in its own worker process.
+
+        Raises:
+            WorkerError: if a worker fails or exits before its shard is crawled
+
+        """
+        _context = multiprocessing.get_context("spawn")
+        _results = _context.Queue()
+        _processes = [
+            _context.Process(
+                target=crawl_shard,
+                args=(self.crawler_factory, _shard, self.workers, _urls, _results),
+                daemon=True,
+            )
+            for _shard, _urls in enumerate(self.shard_urls())
+        ]
+        for _process in _processes:
+            _process.start()
+        try:
+            await self._collect(_results, _processes)
+        finally:
+            for _process in _processes:
+                if _process.is_alive():
+                    _process.terminate()
+                _process.join()
+
+    async def _collect(self, results, processes):
+        _loop = asyncio.get_event_loop()
+        _remaining = set(range(len(processes)))
+        _exited = set()
+        while _remaining:
+            try:
+                _kind, _shard, _payload = await _loop.run_in_executor(
+                    None, results.get, True, POLL_INTERVAL
+                )
+            except queue.Empty:
+                # Give the messages of a worker that just exited a chance to arrive.
+                for _shard in _remaining & _exited:
+                    raise WorkerError(
+                        "Worker %s exited with code %s before finishing its shard"
+                        % (_shard, processes[_shard].exitcode)
+                    )
+                _exited = {_s for _s in _remaining if not processes[_s].is_alive()}
+                continue
+            if _kind == "result":
+                for _result in _payload:
+                    if self.result_sink is not None:
+                        self.result_sink(_result)
+            elif _kind == "dead_letter":
+                self.dead_letter_count += len(_payload)
+                for _result in _payload:
+                    if self.dead_letter_sink is not None:
+                        self.dead_letter_sink(_result)
+            elif _kind == "done":
+                _status_counts, _latency_stats, _dead_letter_count = _payload
+                self.status_counts.update(_status_counts)
+                self.latency_stats.merge(_latency_stats)
+                _remaining.discard(_shard)
+            elif _kind == "error":
+                raise WorkerError("Worker %s failed:\n%s" % (_shard, _payload))
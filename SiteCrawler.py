@@ -1,12 +1,23 @@
 """Crawl a site and optionally perform snapshots of the pages."""
+import concurrent.futures
+import functools
 import os
+import threading
 
 from jinja2 import Environment, FileSystemLoader
 from logzero import logger
-from selenium import webdriver
-from selenium.webdriver.firefox.options import Options
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
 
 import url_utils
+from BrowserPool import BrowserPool, firefox_driver
+from ImageEncoder import ImageEncoder
+
+# Size of the whole page, measured in a single round trip to the browser
+_PAGE_SIZE_SCRIPT = (
+    "return [document.documentElement.scrollWidth, "
+    "document.documentElement.scrollHeight]"
+)
 
 
 class SiteCrawler:
@@ -20,6 +31,28 @@ class SiteCrawler:
     :type template_dir: str
     :param mode: crawler mode: quick or snapshot (default: "quick")
     :type mode: str
+    :param browsers: number of browser sessions capturing pages at once (default: 1)
+    :type browsers: int
+    :param max_pages_per_browser: pages after which a browser session is replaced (default: 100)
+    :type max_pages_per_browser: int
+    :param driver_factory: starts a browser session (default: headless Firefox)
+    :type driver_factory: callable
+    :param writers: number of threads writing screenshots and HTML pages (default: 2)
+    :type writers: int
+    :param write_queue_size: most captured pages waiting to be written (default: 16)
+    :type write_queue_size: int
+    :param manifest: skips unchanged pages and stores each distinct image once
+    :type manifest: SnapshotManifest
+    :param image_format: format of screenshots: png, webp or jpeg (default: "png")
+    :type image_format: str
+    :param quality: quality of WebP and JPEG screenshots, from 1 to 100 (default: 80)
+    :type quality: int
+    :param thumbnail_width: width of the thumbnails shown in HTML pages, or 0 for none (default: 0)
+    :type thumbnail_width: int
+    :param encoders: number of processes encoding screenshots (default: one per CPU)
+    :type encoders: int
+    :param capture_profile: how the default browser sessions load pages
+    :type capture_profile: CaptureProfile
     """
 
     def __init__(
@@ -29,6 +62,17 @@ class SiteCrawler:
         template_dir=None,
         page_template=None,
         mode=None,
+        browsers=1,
+        max_pages_per_browser=100,
+        driver_factory=None,
+        writers=2,
+        write_queue_size=16,
+        manifest=None,
+        image_format="png",
+        quality=80,
+        thumbnail_width=0,
+        encoders=None,
+        capture_profile=None,
     ):
         """Initialize the SiteCrawler class.
 
@@ -40,6 +84,28 @@ class SiteCrawler:
         :type template_dir: str
         :param mode: crawler mode: quick or snapshot (default: "quick")
         :type mode: str
+        :param browsers: number of browser sessions capturing pages at once (default: 1)
+        :type browsers: int
+        :param max_pages_per_browser: pages after which a browser session is replaced (default: 100)
+        :type max_pages_per_browser: int
+        :param driver_factory: starts a browser session (default: headless Firefox)
+        :type driver_factory: callable
+        :param writers: number of threads writing screenshots and HTML pages (default: 2)
+        :type writers: int
+        :param write_queue_size: most captured pages waiting to be written (default: 16)
+        :type write_queue_size: int
+        :param manifest: skips unchanged pages and stores each distinct image once
+        :type manifest: SnapshotManifest
+        :param image_format: format of screenshots: png, webp or jpeg (default: "png")
+        :type image_format: str
+        :param quality: quality of WebP and JPEG screenshots, from 1 to 100 (default: 80)
+        :type quality: int
+        :param thumbnail_width: width of the thumbnails shown in HTML pages, or 0 for none (default: 0)
+        :type thumbnail_width: int
+        :param encoders: number of processes encoding screenshots (default: one per CPU)
+        :type encoders: int
+        :param capture_profile: how the default browser sessions load pages
+        :type capture_profile: CaptureProfile
         """
         self.urls = [] if urls is None else urls
         self.output_dir = (
@@ -55,54 +121,173 @@ class SiteCrawler:
         self.jinja_env = Environment(loader=self.jinja_file_loader)
         # logger.debug("jinja_env: %s" % self.jinja_env)
         self.jinja_template = self.jinja_env.get_template(self.page_template)
+        self.browsers = max(1, browsers)
+        self.max_pages_per_browser = max_pages_per_browser
+        self.capture_profile = capture_profile
+        if driver_factory is None and capture_profile is not None:
+            driver_factory = functools.partial(firefox_driver, capture_profile)
+        self.driver_factory = driver_factory
+        self.writers = max(1, writers)
+        self.write_queue_size = max(1, write_queue_size)
+        self.manifest = manifest
+        self.image_encoder = ImageEncoder(
+            image_format=image_format,
+            quality=quality,
+            thumbnail_width=thumbnail_width,
+            hash_size=0 if manifest is None else manifest.hash_size,
+            processes=encoders,
+        )
+        self.failed_count = 0
+        self.stopped_count = 0
+        self._counts_lock = threading.Lock()
         if len(self.urls) > 0:
             self.crawl_site()
 
     def crawl_site(self):
-        """Crawl the site and perform a snapshot."""
-        for url, lastmod in self.urls.items():
-            # Dictionary containing the path of the resource separated into a parent/child
-            res_path = url_utils.get_path_components(url_utils.get_path_from_url(url))
-            # Set where to output data
-            _output_dir = os.path.normpath(
-                "%s%s" % (self.output_dir, res_path["parent"])
-            )
-            logger.debug("_output_dir: %s" % _output_dir)
-            # Create the output directory if needed
-            url_utils.make_output_dir(_output_dir)
+        """Crawl the site and perform a snapshot, of up to `browsers` pages at once.
+
+        The work is split into two stages, so that the browsers are kept busy: browser
+        threads only navigate to each page and capture its screenshot, then hand it to
+        `writers` threads that write the screenshot and render the HTML page. Once
+        `write_queue_size` captured pages are waiting to be written, the browsers wait.
+        Screenshots in other formats than PNG, and thumbnails, are encoded by a pool of
+        `encoders` processes (see `ImageEncoder`).
+
+        Browser sessions are reused from one page to the next (see `BrowserPool`). A
+        page that fails is logged and counted in `failed_count`, and the crawl goes on.
+        A page that takes longer than the page load timeout of the `capture_profile` to
+        load is stopped, counted in `stopped_count`, and captured as it is.
+
+        With a `manifest`, pages whose `lastmod` has not changed since their last
+        snapshot are not visited at all.
+        """
+        browser_pool = BrowserPool(
+            size=self.browsers,
+            driver_factory=self.driver_factory,
+            max_pages=self.max_pages_per_browser,
+        )
+        # Only queue a few pages per browser, rather than every URL at once
+        pending = threading.BoundedSemaphore(2 * self.browsers)
+        self._write_slots = threading.BoundedSemaphore(self.write_queue_size)
+        # Leaving the block waits for the captures, then the writes, then stops the
+        # encoders and quits the browsers
+        with browser_pool, self.image_encoder, concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.writers
+        ) as writer_pool, concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.browsers
+        ) as capture_pool:
+            for url, lastmod in self.urls.items():
+                pending.acquire()
+                future = capture_pool.submit(
+                    self._capture, browser_pool, writer_pool, url, lastmod
+                )
+                future.add_done_callback(lambda _future: pending.release())
+        logger.info(
+            "Started %s browser session(s) for %s page(s)"
+            % (browser_pool.started_count, len(self.urls))
+        )
+
+    def _failed(self, url, error):
+        logger.error("Unable to snapshot %s: %r" % (url, error))
+        with self._counts_lock:
+            self.failed_count += 1
+
+    def _capture(self, browser_pool, writer_pool, url, lastmod):
+        if self.manifest is not None and self.manifest.unchanged(url, lastmod):
+            logger.debug("Unchanged since the last snapshot: %s" % url)
+            return
+        try:
+            png = self.capture_page(browser_pool, url)
+        except Exception as e:
+            self._failed(url, e)
+            return
+        self._write_slots.acquire()
+        future = writer_pool.submit(self._write, url, lastmod, png)
+        future.add_done_callback(lambda _future: self._write_slots.release())
+
+    def _write(self, url, lastmod, png):
+        try:
+            self.write_snapshot(url, lastmod, png)
+        except Exception as e:
+            self._failed(url, e)
 
+    def capture_page(self, browser_pool, url) -> bytes:
+        """Take a screenshot of the whole of a page.
+
+        :param browser_pool: browser sessions to take the screenshot with
+        :type browser_pool: BrowserPool
+        :param url: URL of the page
+        :type url: str
+        :return: the screenshot, as a PNG
+        :rtype: bytes
+        """
+        with browser_pool.session() as driver:
             try:
-                # Setup Firefox as headless
-                fireFoxOptions = Options()
-                fireFoxOptions.headless = True
-                # Create an actual Firefox instance, then get the url
-                driver = webdriver.Firefox(options=fireFoxOptions)
                 driver.get(url)
-                scroll_height = driver.execute_script(
-                    "return document.documentElement.scrollHeight"
-                )
-                S = lambda X: driver.execute_script(
-                    "return document.body.parentNode.scroll" + X
-                )
-                driver.set_window_size(S("Width"), scroll_height)
-                driver.find_element_by_tag_name("body").screenshot(
-                    "%s%s.png" % (self.output_dir, res_path["child"])
-                )
-            finally:
-                try:
-                    driver.close()
-                except Exception:
-                    pass
-
-            # Output to HTML
-            output_html_path = "%s/%s.html" % (_output_dir, res_path["child"])
-            self.jinja_template.stream(
-                output_dir=res_path["parent"],
-                child=res_path["child"],
-                lastmod=lastmod,
-                url=url,
-            ).dump(output_html_path)
-            logger.info("Created %s" % output_html_path)
+            except TimeoutException:
+                # Capture what has loaded, rather than wait for the slowest asset
+                logger.debug("Stopped loading %s after the page load timeout" % url)
+                driver.execute_script("window.stop();")
+                with self._counts_lock:
+                    self.stopped_count += 1
+            scroll_width, scroll_height = driver.execute_script(_PAGE_SIZE_SCRIPT)
+            driver.set_window_size(scroll_width, scroll_height)
+            return driver.find_element(By.TAG_NAME, "body").screenshot_as_png
+
+    def write_snapshot(self, url, lastmod, png):
+        """Write the screenshot of a page, and the HTML page that shows it.
+
+        :param url: URL of the page
+        :type url: str
+        :param lastmod: when the page was last modified, according to the sitemap
+        :type lastmod: str
+        :param png: the screenshot, as a PNG, which is encoded as `image_format`
+        :type png: bytes
+        """
+        # Dictionary containing the path of the resource separated into a parent/child
+        res_path = url_utils.get_path_components(url_utils.get_path_from_url(url))
+        # Set where to output data
+        _output_dir = os.path.normpath("%s%s" % (self.output_dir, res_path["parent"]))
+        logger.debug("_output_dir: %s" % _output_dir)
+        # Create the output directory if needed
+        url_utils.make_output_dir(_output_dir)
+
+        encoded = self.image_encoder.encode(png)
+        thumbnail = None
+        if self.manifest is None:
+            # Save the screenshot next to the HTML page, which refers to it
+            image = "%s.%s" % (res_path["child"], encoded.extension)
+            with open("%s/%s" % (_output_dir, image), "wb") as f:
+                f.write(encoded.data)
+            if encoded.thumbnail is not None:
+                thumbnail = "%s.thumb.%s" % (res_path["child"], encoded.extension)
+                with open("%s/%s" % (_output_dir, thumbnail), "wb") as f:
+                    f.write(encoded.thumbnail)
+        else:
+            # Refer to the stored copy of the screenshot, which may be shared
+            sha256, image, thumbnail = self.manifest.store_image(encoded)
+            image = self._relative_path(image, _output_dir)
+            if thumbnail is not None:
+                thumbnail = self._relative_path(thumbnail, _output_dir)
+
+        # Output to HTML
+        output_html_path = "%s/%s.html" % (_output_dir, res_path["child"])
+        self.jinja_template.stream(
+            output_dir=res_path["parent"],
+            child=res_path["child"],
+            image=image,
+            thumbnail=thumbnail,
+            lastmod=lastmod,
+            url=url,
+        ).dump(output_html_path)
+        if self.manifest is not None:
+            self.manifest.record(url, lastmod, sha256)
+        logger.info("Created %s" % output_html_path)
+
+    def _relative_path(self, path, page_dir) -> str:
+        """Get the path of a stored image, relative to the HTML page that shows it."""
+        _path = os.path.join(self.manifest.output_dir, path)
+        return os.path.relpath(_path, page_dir).replace(os.sep, "/")
 
     def get_urls(self) -> list:
         """Get URLs contained in the class.
@@ -1,5 +1,8 @@
 """Crawl a list of URLs asynchronously."""
 import asyncio
+import collections
+import collections.abc
+import time
 import urllib.parse
 
 import aiohttp
@@ -7,9 +10,91 @@ import progress
 from logzero import logger
 from progress.spinner import Spinner
 
+from ConnectionPool import ConnectionPool
+from LatencyStats import LatencyStats, RequestTiming, trace_config
+from RateLimiter import RateLimiter, parse_retry_after
+from RetryPolicy import RetryPolicy
 from SiteGloopErrors import InvalidHostname
 from SiteGloopUtils import SiteGloopLogger as GloopLog
 from SiteGloopUtils import is_fqdn
+from UrlRewriter import RewrittenUrls, UrlRewriter, split_origin
+from UrlStore import UrlStore
+
+#: Number of URLs per connection that may be waiting to be crawled at once.
+FRONTIER_FACTOR = 2
+
+#: Most URLs whose validators are looked up together, just before they are crawled.
+VALIDATOR_BATCH_SIZE = 256
+
+#: Ways in which a URL can be requested in order to warm it:
+#: ``get`` streams the body and discards it, ``head`` only requests the headers,
+#: and ``range`` only requests the first byte of the body.
+WARM_METHODS = ("get", "head", "range")
+
+#: Response codes whose ``Retry-After`` header pauses the host before the URL is retried.
+RETRY_AFTER_STATUSES = (429, 503)
+
+#: Key of ``status_counts`` for URLs that were confirmed to be unchanged by a
+#: conditional request (a ``304 Not Modified`` response).
+VALIDATED = "Validated"
+
+#: Timeouts used for each request unless others are given.
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=60, connect=10, sock_read=30)
+
+#: Errors that a request may raise, which are recorded rather than stopping the crawl.
+CRAWL_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+#: Descriptions of the errors that a request may raise, most specific first.
+ERROR_DESCRIPTIONS = (
+    (aiohttp.ClientSSLError, "SSL Connection Error"),
+    (aiohttp.TooManyRedirects, "Too Many Redirects"),
+    (aiohttp.ServerDisconnectedError, "Server Disconnected"),
+    (aiohttp.ServerTimeoutError, "Server Timeout"),
+    (aiohttp.InvalidURL, "Invalid URL"),
+    (aiohttp.ClientConnectorError, "Cannot Connect"),
+    (aiohttp.ClientOSError, "Connection Error"),
+    (aiohttp.ClientPayloadError, "Payload Error"),
+    (asyncio.TimeoutError, "Timeout"),
+)
+
+
+def describe_error(error) -> str:
+    """Describe an error raised while requesting a URL.
+
+    Args:
+        error (Exception): the exception raised by the request
+
+    Returns:
+        str: a short description of the error
+
+    """
+    for _cls, _description in ERROR_DESCRIPTIONS:
+        if isinstance(error, _cls):
+            return _description
+    if isinstance(error, aiohttp.ClientResponseError):
+        return "%s Code Received" % error.status
+    return type(error).__name__
+
+
+CrawlResult = collections.namedtuple(
+    "CrawlResult",
+    ["url", "status", "bytes", "retry_after", "error", "attempts", "timing"],
+    defaults=[None, 0, None, None, 1, None],
+)
+CrawlResult.__doc__ = """The outcome of crawling a single URL.
+
+Attributes:
+    url (str): the URL that was crawled
+    status (int): the response code received, or ``None`` if the request failed
+    bytes (int): the number of body bytes received (before any decompression)
+    retry_after (float): seconds that the server asked us to wait before retrying, if
+        it responded with one of :data:`RETRY_AFTER_STATUSES` and a ``Retry-After`` header
+    error (str): a description of the error encountered (see :func:`describe_error`), or
+        ``None`` if a response was received
+    attempts (int): the number of times the URL was requested
+    timing (RequestTiming): how long each phase of the last request took
+
+"""
 
 
 class SiteCrawlerQuick:
@@ -24,6 +109,30 @@ class SiteCrawlerQuick:
         conn_limit (:obj:`int`, *optional*): The maximum number of connections to use.
         verbosity (:obj:`int`, *optional*): The verbosity setting for output.
             (see: https://docs.python.org/3/library/logging.html#logging-levels)
+        result_sink (:obj:`callable`, *optional*): Called with each :class:`CrawlResult` as
+            soon as it is available. If it has a ``drain`` coroutine method, that is
+            awaited after each URL, so that a sink that falls behind holds the crawl back.
+        keep_results (:obj:`bool`, *optional*): Keep every :class:`CrawlResult` in ``results``.
+        warm_method (:obj:`str`, *optional*): How to request each URL, one of
+            :data:`WARM_METHODS`.
+        pool (:obj:`ConnectionPool`, *optional*): The connection pool to use, which may be
+            shared with the sitemap reader.
+        rate_limiter (:obj:`RateLimiter`, *optional*): Limits the rate of requests, and pauses
+            hosts that send a ``Retry-After`` header.
+        concurrency (:obj:`ConcurrencyController`, *optional*): Adapts the number of requests
+            in flight (up to ``conn_limit``) to the latency and errors observed.
+        timeout (:obj:`aiohttp.ClientTimeout`, *optional*): The connect, read and total
+            timeouts for each request.
+        retry_policy (:obj:`RetryPolicy`, *optional*): Decides which failed requests are
+            retried, and how long to back off for first.
+        dead_letter_sink (:obj:`callable`, *optional*): Called with each :class:`CrawlResult`
+            that failed with an error, or still failed after every retry.
+        validator_cache (:obj:`ValidatorCache`, *optional*): Stores the ``ETag`` and
+            ``Last-Modified`` validators of each URL, so that later crawls can make
+            conditional requests.
+        url_filter (:obj:`callable`, *optional*): Called with each URL (after it has been
+            pointed at ``target_loc``) and its ``lastmod``; the URL is only crawled if it
+            returns True.
 
     Attributes:
         urls (list): A list of URLs to crawl.
@@ -34,6 +143,26 @@ class SiteCrawlerQuick:
         conn_limit (int): The maximum number of connections to use.
         verbosity (int): The verbosity setting for output.
             (see: https://docs.python.org/3/library/logging.html#logging-levels)
+        result_sink (callable): Called with each :class:`CrawlResult` as soon as it is available.
+        keep_results (bool): Keep every :class:`CrawlResult` in ``results``.
+        results (list): Every :class:`CrawlResult`, if ``keep_results`` is set.
+        status_counts (collections.Counter): Number of URLs crawled per status (or error).
+            ``304`` responses to conditional requests are counted as :data:`VALIDATED`.
+        warm_method (str): How to request each URL, one of :data:`WARM_METHODS`.
+        pool (ConnectionPool): The connection pool to use.
+        rate_limiter (RateLimiter): Limits the rate of requests, and pauses hosts that send a
+            ``Retry-After`` header.
+        concurrency (ConcurrencyController): Adapts the number of requests in flight.
+        timeout (aiohttp.ClientTimeout): The connect, read and total timeouts for each request.
+        retry_policy (RetryPolicy): Decides which failed requests are retried.
+        dead_letter_sink (callable): Called with each :class:`CrawlResult` that failed with
+            an error, or still failed after every retry.
+        dead_letter_count (int): Number of URLs that failed with an error, or still failed
+            after every retry.
+        url_filter (callable): Decides which URLs are crawled.
+        validator_cache (ValidatorCache): Stores the validators of each URL.
+        latency_stats (LatencyStats): Percentiles of the time taken by each phase of the
+            requests made, by status class and by path prefix.
 
     """
 
@@ -44,6 +173,17 @@ class SiteCrawlerQuick:
         target_scheme=None,
         conn_limit=None,
         verbosity=50,
+        result_sink=None,
+        keep_results=False,
+        warm_method="get",
+        pool=None,
+        rate_limiter=None,
+        concurrency=None,
+        timeout=None,
+        retry_policy=None,
+        dead_letter_sink=None,
+        url_filter=None,
+        validator_cache=None,
     ):
         """Initialize the Quick Site Crawler.
 
@@ -58,6 +198,36 @@ class SiteCrawlerQuick:
                 maximum number of connections to use (default: 100)
             verbosity (int, *optional*):
                 verbosity setting, by default 50 (see: https://docs.python.org/3/library/logging.html#logging-levels)
+            result_sink (callable, *optional*):
+                called with each :class:`CrawlResult` as soon as it is available (default: None)
+            keep_results (bool, *optional*):
+                keep every :class:`CrawlResult` in ``results``, which uses memory in proportion
+                to the number of URLs (default: False)
+            warm_method (str, *optional*):
+                how to request each URL, one of :data:`WARM_METHODS` (default: "get")
+            pool (ConnectionPool, *optional*):
+                connection pool to use (default: a pool of ``conn_limit`` connections that is
+                closed once crawling is complete)
+            rate_limiter (RateLimiter, *optional*):
+                limits the rate of requests (default: no limit, but ``Retry-After`` headers
+                are still honored)
+            concurrency (ConcurrencyController, *optional*):
+                adapts the number of requests in flight (default: always ``conn_limit``)
+            timeout (aiohttp.ClientTimeout, *optional*):
+                timeouts for each request (default: :data:`DEFAULT_TIMEOUT`)
+            retry_policy (RetryPolicy, *optional*):
+                decides which failed requests are retried (default: ``RetryPolicy()``)
+            dead_letter_sink (callable, *optional*):
+                called with each :class:`CrawlResult` that failed with an error, or still
+                failed after every retry, such as to write it out to be crawled again
+                later (default: None)
+            url_filter (callable, *optional*):
+                called with each URL and its ``lastmod`` (or None if it is not known), and
+                returns True if the URL should be crawled (default: crawl every URL)
+            validator_cache (ValidatorCache, *optional*):
+                stores the ``ETag`` and ``Last-Modified`` validators of each URL, and sends
+                them as ``If-None-Match`` / ``If-Modified-Since`` headers when the URL is
+                crawled again (default: no conditional requests)
         """
         self.verbosity = verbosity
         self.glooplog = GloopLog(verbosity=self.verbosity)
@@ -74,50 +244,71 @@ class SiteCrawlerQuick:
         else:
             self.target_loc = target_loc
         self.target_scheme = target_scheme
-        if self.target_loc and isinstance(urls, dict):
+        self.url_rewriter = None
+        if self.target_loc:
+            self.url_rewriter = UrlRewriter(self.target_loc, self.target_scheme)
+        if self.target_loc and isinstance(urls, collections.abc.Mapping):
             self.urls = self.change_url_location(urls)
         else:
             self.urls = urls
         self.conn_limit = 100 if conn_limit is None else conn_limit
+        self.result_sink = result_sink
+        self.keep_results = keep_results
         self.results = None
+        self.status_counts = collections.Counter()
+        self.warm_method = warm_method
+        self.pool = pool
+        self.rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self.concurrency = concurrency
+        self.timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+        self.retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+        self.dead_letter_sink = dead_letter_sink
+        self.dead_letter_count = 0
+        self.url_filter = url_filter
+        self.validator_cache = validator_cache
+        self.latency_stats = LatencyStats()
+        self._retrying = set()
         if self.verbosity >= 30:
             self.glooplog.spinner = None
 
-    def change_url_location(self, urls=[]) -> list:
+    def change_url_location(self, urls={}):
         """Change the netloc in the URL to something user-defined.
 
+        URLs that all share one origin are each rewritten to a different URL, so they
+        are not copied, but rewritten as they are iterated over. URLs of several
+        origins may be rewritten to the same URL, such as ``http://`` and ``https://``
+        copies of a page, so they are copied into a :class:`~UrlStore.UrlStore`, in
+        which each URL only appears once (with the ``lastmod`` of its last copy).
+
         Args:
-            urls (list, *optional*):
-                URLs that we want to change, by default []
+            urls (dict, *optional*):
+                URLs that we want to change, with their ``lastmod``, by default {}
 
         Returns:
-            list: A list of dictionaries containing modified URLs as their keys.
+            RewrittenUrls or UrlStore: the modified URLs, with their ``lastmod``.
 
         """
-        changed_urls = {}
-        self.glooplog.spinner = Spinner("Replacing URLs with %s : " % self.target_loc)
-        for url, lastmod in urls.items():
-            _parsed = urllib.parse.urlparse(url)
-            if self.target_scheme:
-                _scheme = self.target_scheme
-            else:
-                _scheme = _parsed.scheme
-            _path = _parsed.path
-            _params = _parsed.params
-            _query = _parsed.query
-            _fragment = _parsed.fragment
-            _new_url = "%s://%s%s%s%s%s" % (
-                _scheme,
-                self.target_loc,
-                _path,
-                _params,
-                _query,
-                _fragment,
-            )
-            changed_urls[_new_url] = lastmod
-            self.glooplog.logit(spin=True)
-        self.glooplog.spinner.finish()
-        return changed_urls
+        if isinstance(urls, UrlStore):
+            _origins = urls.origins()
+        else:
+            _origins = {split_origin(_url)[0] for _url in urls}
+        if len(_origins) <= 1 and "" not in _origins:
+            return RewrittenUrls(urls, self.url_rewriter)
+        return UrlStore(self.url_rewriter.rewrite_items(urls.items()))
+
+    def rewrite_url(self, url) -> str:
+        """Change the netloc (and scheme, if set) of a single URL.
+
+        Args:
+            url (str): URL that we want to change
+
+        Returns:
+            str: the URL pointed at ``target_loc``, or ``url`` if it is not set
+
+        """
+        if self.url_rewriter is None:
+            return url
+        return self.url_rewriter.rewrite(url)
 
     def get_urls(self) -> list:
         """Getter for the provided URLs.
@@ -128,83 +319,388 @@ class SiteCrawlerQuick:
         """
         return self.urls
 
-    async def request(self, url, session, spinner) -> dict:
+    async def request(self, url, session, spinner) -> CrawlResult:
         """Asynchronously request a URL from a web server.
 
         Args:
             url (str): the URL to be requested by the crawler.
             session (obj): an aiohttp Client Session
+            spinner (obj): progress spinner to spin
+
+        Returns:
+            CrawlResult: The URL and its response code (or error) from the crawler.
+
+        """
+        _result, _retries = await self._request(url, session, spinner)
+        return _result
+
+    async def _request(self, url, session, spinner) -> tuple:
+        """Request a URL, and find out how many times it may be retried.
+
+        Args:
+            url (str): the URL to be requested by the crawler.
+            session (obj): an aiohttp Client Session
+            spinner (obj): progress spinner to spin
 
         Returns:
-            dict: The URL as the key, and it's response code as the value from the crawler.
+            tuple: the :class:`CrawlResult`, and the number of retries that the
+                ``retry_policy`` allows for it (``None`` if it is never retried)
 
         """
+        _timings = {}
+        _started = time.monotonic()
         try:
-            async with session.get(url) as resp:
-                if self.verbosity < 30:
-                    self.glooplog.logit(
-                        level="debug", msg="Starting session for %s" % url
-                    )
-                else:
-                    spinner.next()
-                await resp.text(encoding="utf-8")
-                return {url: resp.status}
-        except aiohttp.ClientSSLError:
-            return {url: "Error: SSL Connection Error"}
-        except aiohttp.ClientResponseError as e:
-            return {url: "Error: %s Code Received" % e.status}
-        except aiohttp.TooManyRedirects:
-            return {url: "Error: Too Many Redirects"}
-        except aiohttp.ServerDisconnectedError:
-            return {url: "Error: Server Disconnected"}
-        except aiohttp.ServerTimeoutError:
-            return {url: "Error: Server Timeout"}
-        except aiohttp.InvalidURL:
-            return {url: "Error: Invalid URL"}
-
-    async def bound_request(self, sem, url, session, spinner):
-        """Bind the request to the semaphore pool.
+            _result = await self._fetch(url, session, spinner, _timings)
+            _retries = self.retry_policy.retries_for_status(_result.status)
+        except CRAWL_ERRORS as e:
+            _result = CrawlResult(url, error=describe_error(e))
+            _retries = self.retry_policy.retries_for_error(e)
+        _timing = RequestTiming(
+            _timings.get("dns"),
+            _timings.get("connect"),
+            _timings.get("ttfb"),
+            time.monotonic() - _started,
+        )
+        return _result._replace(timing=_timing), _retries
+
+    async def _fetch(self, url, session, spinner, timings) -> CrawlResult:
+        _headers = {}
+        if self.validator_cache is not None:
+            _headers = self.validator_cache.headers(url)
+        if self.warm_method == "head":
+            _request = session.head(
+                url, headers=_headers, allow_redirects=True, trace_request_ctx=timings
+            )
+        else:
+            if self.warm_method == "range":
+                _headers["Range"] = "bytes=0-0"
+            _request = session.get(url, headers=_headers, trace_request_ctx=timings)
+        async with _request as resp:
+            if self.verbosity < 30:
+                self.glooplog.logit(level="debug", msg="Starting session for %s" % url)
+            else:
+                spinner.next()
+            # Only the origin/CDN serving the body matters, so don't keep it.
+            _bytes = 0
+            async for _chunk in resp.content.iter_any():
+                _bytes += len(_chunk)
+            _retry_after = None
+            if resp.status in RETRY_AFTER_STATUSES:
+                _retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            if self.validator_cache is not None and resp.status in (200, 206, 304):
+                self.validator_cache.update(url, resp.headers)
+            return CrawlResult(url, resp.status, _bytes, _retry_after)
+
+    def _record(self, result):
+        """Hand a result to the sink, and keep it if asked to.
+
+        Args:
+            result (CrawlResult): the outcome of crawling a URL
+
+        """
+        if result.status == 304 and self.validator_cache is not None:
+            self.status_counts[VALIDATED] += 1
+        elif result.error is None:
+            self.status_counts[result.status] += 1
+        else:
+            self.status_counts["Error: %s" % result.error] += 1
+        if self.keep_results:
+            self.results.append(result)
+        if self.result_sink is not None:
+            self.result_sink(result)
+
+    async def _crawl_worker(self, frontier, slots, session, spinner):
+        """Crawl URLs taken from the frontier until cancelled.
+
+        Requests are spaced out by the ``rate_limiter``. URLs that fail in a way that the
+        ``retry_policy`` allows to be retried are placed back onto the frontier, after
+        a backoff or, when the host responded with a ``Retry-After`` header, once the
+        host is no longer paused. Hosts are paused for as long as their ``Retry-After``
+        header asks, even if the URL is not retried. URLs that fail with an error, or
+        with a retryable response after every retry, are handed to the
+        ``dead_letter_sink``.
 
         Args:
-            sem (obj): a sempahore object to manage an internal counter for the connection limit
-            url (str): the URL to be requested by the crawler
+            frontier (obj): an asyncio Queue of ``(url, attempt)`` tuples waiting to be crawled
+            slots (obj): a semaphore bounding the number of URLs in the frontier
             session (obj): an aiohttp Client Session
+            spinner (obj): progress spinner to spin
+
         """
-        async with sem:
-            return await self.request(url, session, spinner)
+        while True:
+            _url, _attempt = await frontier.get()
+            _requeued = False
+            try:
+                _host = urllib.parse.urlsplit(_url).netloc
+                await self.rate_limiter.acquire(_host)
+                _result, _retries = await self._timed_request(_url, session, spinner)
+                _result = _result._replace(attempts=_attempt + 1)
+                self.latency_stats.record(_result)
+                _paused = False
+                if _result.retry_after is not None:
+                    # The host asked to be left alone for a while, whether or not
+                    # this URL is tried again
+                    _paused = self.rate_limiter.pause(_host, _result.retry_after)
+                if _retries is not None and _attempt < _retries:
+                    _requeued = self._retry(frontier, _host, _result, _attempt, _paused)
+                if not _requeued:
+                    self._record(_result)
+                # Errors are dead-lettered whether or not they could be retried,
+                # retryable responses only once they have used up their retries
+                if not _requeued and (
+                    _result.error is not None or _retries is not None
+                ):
+                    self._dead_letter(_result)
+                _drain = getattr(self.result_sink, "drain", None)
+                if _drain is not None:
+                    await _drain()
+            finally:
+                if not _requeued:
+                    slots.release()
+                    frontier.task_done()
 
-    async def crawl_sites(self) -> list:
-        """Asynchronously crawl a list of URLs.
+    def _retry(self, frontier, host, result, attempt, paused) -> bool:
+        """Place a failed URL back onto the frontier once it is due to be retried.
 
-        Return:
-            list: A list of dictionaries containing URLs crawled as their key and their response codes
-                as the value:
+        The URL keeps its slot in the frontier, and remains unfinished (as far as
+        ``frontier.join()`` is concerned) while it waits.
 
-            Example::
+        Args:
+            frontier (obj): an asyncio Queue of ``(url, attempt)`` tuples waiting to be crawled
+            host (str): the host that the URL is on
+            result (CrawlResult): the outcome of the failed request
+            attempt (int): the number of retries made so far
+            paused (bool): whether the host was paused for the ``Retry-After`` of the
+                result
 
-                [
-                    {
-                        'https://www.javierayala.com/page1': 200
-                    },
-                    {
-                        'https://www.javierayala.com/page2': 200
-                    }
-                ]
+        Returns:
+            bool: True if the URL will be retried, False if the server asked us to wait
+                longer than the ``rate_limiter`` allows
+
+        """
+        if result.retry_after is not None:
+            if not paused:
+                return False
+            _delay = 0
+            _reason = "pausing %s for %ss" % (host, result.retry_after)
+        else:
+            _delay = self.retry_policy.backoff(attempt)
+            _reason = "backing off for %.2fs" % _delay
+        self.glooplog.logit(
+            level="info",
+            msg="Retrying %s after %s (attempt %s), %s"
+            % (result.url, result.error or result.status, result.attempts, _reason),
+        )
+        _task = asyncio.ensure_future(
+            self._requeue_later(frontier, (result.url, attempt + 1), _delay)
+        )
+        self._retrying.add(_task)
+        _task.add_done_callback(self._retrying.discard)
+        return True
+
+    async def _requeue_later(self, frontier, item, delay):
+        try:
+            await asyncio.sleep(delay)
+            frontier.put_nowait(item)
+        finally:
+            frontier.task_done()
+
+    def _dead_letter(self, result):
+        """Hand a result that failed for good to the dead-letter sink.
+
+        Args:
+            result (CrawlResult): the outcome of the last attempt to crawl a URL
+
+        """
+        self.dead_letter_count += 1
+        self.glooplog.logit(
+            level="warning",
+            msg="Giving up on %s after %s attempt(s): %s"
+            % (result.url, result.attempts, result.error or result.status),
+        )
+        if self.dead_letter_sink is not None:
+            self.dead_letter_sink(result)
+
+    async def _timed_request(self, url, session, spinner) -> tuple:
+        """Request a URL, reporting its latency to the concurrency controller.
+
+        Args:
+            url (str): the URL to be requested by the crawler.
+            session (obj): an aiohttp Client Session
+            spinner (obj): progress spinner to spin
+
+        Returns:
+            tuple: the :class:`CrawlResult`, and the number of retries allowed for it
+
+        """
+        if self.concurrency is None:
+            return await self._request(url, session, spinner)
+        await self.concurrency.acquire()
+        _started = time.monotonic()
+        _result = None
+        try:
+            _result, _retries = await self._request(url, session, spinner)
+            return _result, _retries
+        finally:
+            _status = None if _result is None else _result.status
+            _error = _status is None or _status >= 500 or _status == 429
+            await self.concurrency.release(time.monotonic() - _started, _error)
+
+    async def _feed(self, urls, frontier, slots):
+        """Move URLs into the frontier as room becomes available, then wait for them.
+
+        Args:
+            urls (obj): an async iterator of URLs to crawl
+            frontier (obj): an asyncio Queue of URLs waiting to be crawled
+            slots (obj): a semaphore bounding the number of URLs in the frontier
 
         """
-        self.results = []
-        sem = asyncio.Semaphore(self.conn_limit)
+        async for _url in urls:
+            await slots.acquire()
+            frontier.put_nowait((_url, 0))
+        await frontier.join()
+
+    async def _crawl(self, urls) -> list:
+        """Crawl URLs with a fixed pool of ``conn_limit`` workers.
+
+        URLs are pulled from ``urls`` only as workers free up, so memory use depends
+        on the number of connections rather than on the number of URLs.
+
+        Args:
+            urls (obj): an async iterator of URLs to crawl
+
+        Return:
+            list: every :class:`CrawlResult` if ``keep_results`` is set, otherwise None
+
+        """
+        self.results = [] if self.keep_results else None
         crawlSpinner = Spinner()
         print("Beginning Crawl...\n")
-        async with aiohttp.ClientSession() as session:
-            for url in self.urls:
-                self.results.append(
-                    asyncio.create_task(
-                        self.bound_request(sem, url, session, crawlSpinner)
-                    )
-                )
-            await asyncio.gather(*self.results)
+        _pool = self.pool if self.pool is not None else ConnectionPool(self.conn_limit)
+        try:
+            async with _pool.session(
+                auto_decompress=False,
+                timeout=self.timeout,
+                trace_configs=[trace_config()],
+            ) as session:
+                await self._run_workers(urls, session, crawlSpinner)
+        finally:
+            if self.pool is None:
+                await _pool.close()
         if isinstance(self.glooplog.spinner, progress.spinner.Spinner):
             self.glooplog.spinner.finish()
         crawlSpinner.finish()
         return self.results
+
+    async def _run_workers(self, urls, session, spinner):
+        """Feed URLs to a pool of workers until every one has been crawled.
+
+        Args:
+            urls (obj): an async iterator of URLs to crawl
+            session (obj): an aiohttp Client Session
+            spinner (obj): progress spinner to spin
+
+        """
+        _workers_count = max(1, self.conn_limit)
+        frontier = asyncio.Queue()
+        slots = asyncio.Semaphore(FRONTIER_FACTOR * _workers_count)
+        _workers = [
+            asyncio.ensure_future(self._crawl_worker(frontier, slots, session, spinner))
+            for _ in range(_workers_count)
+        ]
+        _fed = asyncio.ensure_future(self._feed(urls, frontier, slots))
+        _done, _pending = await asyncio.wait(
+            [_fed] + _workers, return_when=asyncio.FIRST_COMPLETED
+        )
+        _retrying = list(self._retrying)
+        for _task in _workers + [_fed] + _retrying:
+            _task.cancel()
+        await asyncio.gather(*_workers, _fed, *_retrying, return_exceptions=True)
+        # Workers only finish early if they raised, so surface that error.
+        for _task in _done:
+            _task.result()
+
+    async def _iter_urls(self):
+        if isinstance(self.urls, (collections.abc.Mapping, RewrittenUrls)):
+            _items = self.urls.items()
+        else:
+            _items = ((url, None) for url in self.urls)
+        _batch = []
+        for url, lastmod in _items:
+            if self.url_filter is None or self.url_filter(url, lastmod):
+                _batch.append(url)
+            if len(_batch) >= VALIDATOR_BATCH_SIZE:
+                for _url in self._prefetch(_batch):
+                    yield _url
+                _batch = []
+        for _url in self._prefetch(_batch):
+            yield _url
+
+    async def _iter_queue(self, url_queue):
+        _done = False
+        while not _done:
+            _items = [await url_queue.get()]
+            # Take whatever else is already waiting, without waiting for more
+            while len(_items) < VALIDATOR_BATCH_SIZE and not url_queue.empty():
+                _items.append(url_queue.get_nowait())
+            _batch = []
+            for _item in _items:
+                if _item is None:
+                    _done = True
+                    break
+                url = self.rewrite_url(_item[0]) if self.target_loc else _item[0]
+                if self.url_filter is None or self.url_filter(url, _item[1]):
+                    _batch.append(url)
+            for _url in self._prefetch(_batch):
+                yield _url
+
+    def _prefetch(self, urls) -> list:
+        """Look up the validators of a batch of URLs in one go, before they are crawled.
+
+        Args:
+            urls (list): the URLs about to be crawled
+
+        Returns:
+            list: ``urls``
+
+        """
+        if self.validator_cache is not None:
+            self.validator_cache.prefetch(urls)
+        return urls
+
+    async def crawl_sites(self) -> list:
+        """Asynchronously crawl a list of URLs.
+
+        A fixed pool of ``conn_limit`` workers crawls the URLs. Each
+        :class:`CrawlResult` is handed to ``result_sink`` as it completes.
+
+        Return:
+            list: A list of :class:`CrawlResult` objects if ``keep_results`` is set,
+                otherwise None:
+
+            Example::
+
+                [
+                    CrawlResult(url='https://www.javierayala.com/page1', status=200, bytes=5120, retry_after=None, error=None, attempts=1, timing=RequestTiming(dns=None, connect=None, ttfb=0.021, total=0.023)),
+                    CrawlResult(url='https://www.javierayala.com/page2', status=None, bytes=0, retry_after=None, error='Timeout', attempts=4, timing=RequestTiming(dns=None, connect=None, ttfb=None, total=60.0)),
+                ]
+
+        """
+        return await self._crawl(self._iter_urls())
+
+    async def crawl_queue(self, url_queue) -> list:
+        """Asynchronously crawl URLs as they are placed onto a queue.
+
+        ``(url, lastmod)`` tuples are taken off of the queue (such as the
+        ``url_queue`` fed by :class:`~SitemapReaderQuick.SitemapReaderQuick`) and
+        crawled straight away. URLs are pointed at ``target_loc`` as they are taken
+        off of the queue. Crawling finishes once ``None`` is taken off of the queue.
+
+        Args:
+            url_queue (obj): an asyncio Queue of ``(url, lastmod)`` tuples
+
+        Return:
+            list: the same results as :meth:`crawl_sites`
+
+        """
+        return await self._crawl(self._iter_queue(url_queue))
@@ -47,3 +47,57 @@ class InvalidHostname(Exception):
     def __init__(self, message="Provided hostname is not a FQDN."):
         """Create the exception."""
         self.message = message
+
+
+class WorkerError(Exception):
+    """Exception raised when a worker process fails part way through a crawl.
+
+    Args:
+        message (str): Human readable string describing the exception
+
+    Attributes:
+        message (str): Human readable string describing the exception
+
+    """
+
+    def __init__(self, message="A crawl worker failed."):
+        """Create the exception."""
+        super().__init__(message)
+        self.message = message
+
+
+class CheckpointError(Exception):
+    """Exception raised when a checkpoint cannot be used to resume a crawl.
+
+    Args:
+        message (str): Human readable string describing the exception
+
+    Attributes:
+        message (str): Human readable string describing the exception
+
+    """
+
+    def __init__(self, message="The checkpoint cannot be resumed from."):
+        """Create the exception."""
+        super().__init__(message)
+        self.message = message
+
+
+class ImageEncodingError(Exception):
+    """Exception raised when snapshots cannot be encoded in the format asked for.
+
+    Args:
+        message (str): Human readable string describing the exception
+
+    Attributes:
+        message (str): Human readable string describing the exception
+
+    """
+
+    def __init__(
+        self,
+        message="Pillow is needed to encode images as WebP or JPEG, or to make thumbnails.",
+    ):
+        """Create the exception."""
+        super().__init__(message)
+        self.message = message
@@ -1,10 +1,22 @@
 """Various utilities for use by SiteGloop."""
 import re
 import sys
+import zlib
 
 import logzero
 from logzero import logger
 
+# First line of snapshots packed by RecordPacker
+_RECORDS_HEADER = b"#sitegloop-records 1"
+
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_UNESCAPES = {"\\": "\\", "t": "\t", "n": "\n", "r": "\r"}
+# A backslash at the end of a field matches too, so that it is reported
+_ESCAPED_RE = re.compile(r"\\(.?)")
+
+# Bytes of a snapshot to decompress at a time
+_UNPACK_CHUNK_SIZE = 64 * 1024
+
 
 def is_fqdn(hostname: str) -> bool:
     """Check for a valid hostname.
@@ -37,6 +49,119 @@ def is_fqdn(hostname: str) -> bool:
     return all(fqdn.match(label) for label in labels)
 
 
+def _unescape(field) -> str:
+    if "\\" not in field:
+        return field
+    return _ESCAPED_RE.sub(_unescape_match, field)
+
+
+def _unescape_match(match) -> str:
+    _unescaped = _UNESCAPES.get(match.group(1))
+    if _unescaped is None:
+        raise ValueError("Unknown escape %r in a record" % match.group(0))
+    return _unescaped
+
+
+class RecordPacker:
+    """Pack records of text fields into a compressed snapshot, one record at a time.
+
+    Each record is a line of tab separated fields, in which backslashes, tabs and
+    newlines are escaped, so that fields may hold any text. Records are compressed as
+    they are added, so only the compressed snapshot is held in memory.
+
+    Example::
+
+        packer = RecordPacker()
+        for url, lastmod in urls.items():
+            packer.add(url, lastmod)
+        snapshot = packer.finish()
+
+    """
+
+    def __init__(self):
+        """Start the snapshot."""
+        self._compressor = zlib.compressobj()
+        self._chunks = [self._compressor.compress(_RECORDS_HEADER)]
+
+    def add(self, *fields):
+        """Add a record.
+
+        Args:
+            *fields (str): the fields of the record
+
+        """
+        _line = "\t".join(_field.translate(_ESCAPES) for _field in fields)
+        _chunk = self._compressor.compress(b"\n" + _line.encode("utf-8"))
+        if _chunk:
+            self._chunks.append(_chunk)
+
+    def finish(self) -> bytes:
+        """Finish the snapshot.
+
+        Returns:
+            bytes: the compressed records, to be read back with :func:`unpack_records`
+
+        """
+        self._chunks.append(self._compressor.flush())
+        return b"".join(self._chunks)
+
+
+def unpack_records(snapshot, field_count):
+    """Read back the records of a snapshot made by :class:`RecordPacker`.
+
+    The snapshot is decompressed a piece at a time.
+
+    Args:
+        snapshot (bytes): the compressed records
+        field_count (int): the number of fields in each record
+
+    Yields:
+        list: the fields of each record
+
+    Raises:
+        ValueError: if the snapshot is corrupt, or a record has another number of fields
+
+    """
+    _decompressor = zlib.decompressobj()
+    _pending = b""
+    _header = None
+    for _start in range(0, len(snapshot), _UNPACK_CHUNK_SIZE):
+        _end = _start + _UNPACK_CHUNK_SIZE
+        try:
+            _data = _pending + _decompressor.decompress(snapshot[_start:_end])
+        except zlib.error as e:
+            raise ValueError("Corrupt snapshot: %s" % e)
+        _lines = _data.split(b"\n")
+        _pending = _lines.pop()
+        for _line in _lines:
+            if _header is None:
+                _header = _check_header(_line)
+                continue
+            yield _unpack_record(_line, field_count)
+    if not _decompressor.eof:
+        raise ValueError("Corrupt snapshot: it is truncated")
+    if _header is None:
+        # A snapshot without records
+        _check_header(_pending)
+        return
+    yield _unpack_record(_pending, field_count)
+
+
+def _check_header(line) -> bytes:
+    if line != _RECORDS_HEADER:
+        raise ValueError("Corrupt snapshot: it does not start with a header")
+    return line
+
+
+def _unpack_record(line, field_count) -> list:
+    _fields = line.decode("utf-8").split("\t")
+    if len(_fields) != field_count:
+        raise ValueError(
+            "Expected %s field(s) in a record, not %s" % (field_count, len(_fields))
+        )
+    return [_unescape(_field) for _field in _fields]
+
+
 class SiteGloopLogger:
     """Logger for SiteGloop.
 
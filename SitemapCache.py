@@ -0,0 +1,229 @@
+"""Keep parsed snapshots of sitemaps, so that unchanged sitemaps need not be parsed again."""
+import sqlite3
+import time
+
+from logzero import logger
+
+from SiteGloopUtils import RecordPacker, unpack_records
+from SitemapParser import SitemapEntry
+
+#: Most bytes of a sitemap to hold in memory while it is downloaded; the rest of it
+#: is spooled to a temporary file.
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sitemaps (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    sha256 TEXT NOT NULL,
+    entries BLOB NOT NULL,
+    fetched_at REAL NOT NULL
+)
+"""
+
+
+class EntryPacker:
+    """Pack the entries of a sitemap into a snapshot as they are parsed.
+
+    Example::
+
+        packer = EntryPacker()
+        for entry in entries:
+            packer.add(entry)
+        cache.save(url, headers, sha256, packer)
+
+    """
+
+    def __init__(self):
+        """Start the snapshot."""
+        self._packer = RecordPacker()
+
+    def add(self, entry):
+        """Add an entry.
+
+        Args:
+            entry (SitemapEntry): the entry
+
+        """
+        self._packer.add(entry.kind, entry.loc, entry.lastmod or "")
+
+    def finish(self) -> bytes:
+        """Finish the snapshot.
+
+        Returns:
+            bytes: the compressed entries
+
+        """
+        return self._packer.finish()
+
+
+def pack_entries(entries) -> bytes:
+    """Pack sitemap entries into a compact snapshot.
+
+    Args:
+        entries (list): the :class:`~SitemapParser.SitemapEntry` objects of a sitemap
+
+    Returns:
+        bytes: the compressed entries
+
+    """
+    _packer = EntryPacker()
+    for _entry in entries:
+        _packer.add(_entry)
+    return _packer.finish()
+
+
+def unpack_entries(snapshot) -> list:
+    """Unpack a snapshot made by :func:`pack_entries` or :class:`EntryPacker`.
+
+    Args:
+        snapshot (bytes): the packed entries
+
+    Returns:
+        list: the :class:`~SitemapParser.SitemapEntry` objects of the sitemap
+
+    Raises:
+        ValueError: if the snapshot is corrupt
+
+    """
+    return [
+        SitemapEntry(_kind, _loc, _lastmod or None)
+        for _kind, _loc, _lastmod in unpack_records(snapshot, 3)
+    ]
+
+
+class SitemapCache:
+    """SQLite cache of the validators, content hash and entries of each sitemap.
+
+    Before a sitemap is requested, :meth:`headers` gives the ``If-None-Match`` /
+    ``If-Modified-Since`` headers to send. If the server responds with ``304 Not
+    Modified``, or the body has the same SHA-256 hash as last time, the entries are
+    loaded from the snapshot instead of parsing the sitemap again.
+
+    Args:
+        path (str): path of the SQLite database, which is created if needed
+
+    Attributes:
+        path (str): path of the SQLite database
+        hits (int): number of sitemaps loaded from their snapshot
+
+    Example::
+
+        with SitemapCache("sitemaps.db") as cache:
+            sitemap = SitemapReaderQuick(sitemap_url, sitemap_cache=cache)
+            await sitemap.parse_sitemap()
+
+    """
+
+    def __init__(self, path):
+        """Open (or create) the database."""
+        self.path = path
+        self.hits = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def headers(self, url) -> dict:
+        """Build the headers that make a request for a sitemap conditional.
+
+        Args:
+            url (str): the URL of the sitemap
+
+        Returns:
+            dict: ``If-None-Match`` and/or ``If-Modified-Since`` headers, or an empty dict
+                if the sitemap has no snapshot
+
+        """
+        _row = self._conn.execute(
+            "SELECT etag, last_modified FROM sitemaps WHERE url = ?", (url,)
+        ).fetchone()
+        _headers = {}
+        if _row is not None and _row[0]:
+            _headers["If-None-Match"] = _row[0]
+        if _row is not None and _row[1]:
+            _headers["If-Modified-Since"] = _row[1]
+        return _headers
+
+    def load(self, url, sha256=None) -> list:
+        """Load the entries of a sitemap from its snapshot.
+
+        Args:
+            url (str): the URL of the sitemap
+            sha256 (:obj:`str`, optional): only load the snapshot if it was taken of a
+                body with this SHA-256 hash
+
+        Returns:
+            list: the :class:`~SitemapParser.SitemapEntry` objects of the sitemap, or None
+                if there is no (matching) snapshot
+
+        """
+        _row = self._conn.execute(
+            "SELECT sha256, entries FROM sitemaps WHERE url = ?", (url,)
+        ).fetchone()
+        if _row is None or sha256 is not None and _row[0] != sha256:
+            return None
+        try:
+            _entries = unpack_entries(_row[1])
+        except ValueError as e:
+            logger.warning("Ignoring the corrupt snapshot of %s: %s" % (url, e))
+            return None
+        self.hits += 1
+        return _entries
+
+    def touch(self, url, headers):
+        """Record that a sitemap was found to be unchanged.
+
+        Args:
+            url (str): the URL of the sitemap
+            headers (obj): the headers of the response, whose validators are kept
+
+        """
+        with self._conn:
+            self._conn.execute(
+                "UPDATE sitemaps SET etag = COALESCE(?, etag), "
+                "last_modified = COALESCE(?, last_modified), fetched_at = ? "
+                "WHERE url = ?",
+                (headers.get("ETag"), headers.get("Last-Modified"), time.time(), url,),
+            )
+
+    def save(self, url, headers, sha256, entries):
+        """Store the snapshot of a sitemap that was parsed.
+
+        Args:
+            url (str): the URL of the sitemap
+            headers (obj): the headers of the response, whose validators are kept
+            sha256 (str): the SHA-256 hash of the body of the response
+            entries (EntryPacker): a packer fed every entry in the sitemap, or a list of
+                every :class:`~SitemapParser.SitemapEntry`
+
+        """
+        if isinstance(entries, EntryPacker):
+            _snapshot = entries.finish()
+        else:
+            _snapshot = pack_entries(entries)
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sitemaps "
+                "(url, etag, last_modified, sha256, entries, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    headers.get("ETag"),
+                    headers.get("Last-Modified"),
+                    sha256,
+                    _snapshot,
+                    time.time(),
+                ),
+            )
+
+    def close(self):
+        """Close the database."""
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
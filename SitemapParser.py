@@ -0,0 +1,141 @@
+"""Incrementally parse sitemaps as their bytes are received."""
+import collections
+import zlib
+
+from lxml import etree
+
+#: Number of bytes to read from a response before handing them to the parser.
+CHUNK_SIZE = 64 * 1024
+
+#: Leading bytes of a gzip stream.
+GZIP_MAGIC = b"\x1f\x8b"
+
+SitemapEntry = collections.namedtuple("SitemapEntry", ["kind", "loc", "lastmod"])
+SitemapEntry.__doc__ = """An entry found within a sitemap.
+
+Attributes:
+    kind (str): ``"url"`` for an entry of a ``urlset``, or ``"sitemap"`` for an entry of
+        a ``sitemapindex``
+    loc (str): the location found within the entry
+    lastmod (str): the ``lastmod`` found within the entry, or ``None`` if there was none
+
+"""
+
+
+class SitemapParser:
+    """Streaming parser for sitemaps and sitemap indexes.
+
+    Data is fed to the parser in chunks as it arrives, and each ``<url>`` or
+    ``<sitemap>`` entry is emitted as soon as its closing tag has been seen. Entries
+    are freed from the document tree once they have been emitted, so memory use stays
+    flat regardless of the size of the sitemap.
+
+    Gzip compressed sitemaps (``sitemap.xml.gz``) are detected from their leading
+    bytes and decompressed in bounded pieces on their way into the parser, so neither
+    the whole compressed nor the whole decompressed document is ever held in memory.
+
+    Example::
+
+        parser = SitemapParser()
+        for chunk in chunks:
+            for entry in parser.feed(chunk):
+                print(entry.loc, entry.lastmod)
+        for entry in parser.close():
+            print(entry.loc, entry.lastmod)
+
+    """
+
+    def __init__(self):
+        """Create the parser."""
+        self._parser = etree.XMLPullParser(
+            events=("end",),
+            tag=("{*}url", "{*}sitemap"),
+            recover=True,
+            resolve_entities=False,
+            no_network=True,
+        )
+        self._head = b""
+        self._inflater = None
+        self.gzipped = None
+
+    def feed(self, data) -> list:
+        """Feed a chunk of the sitemap to the parser.
+
+        Args:
+            data (bytes): the next chunk of the sitemap, compressed or not
+
+        Returns:
+            list: the :class:`SitemapEntry` objects completed by this chunk
+
+        """
+        if self.gzipped is None:
+            # Hold on to the data until there is enough of it to sniff the format.
+            self._head += data
+            if len(self._head) < len(GZIP_MAGIC):
+                return []
+            data, self._head = self._head, b""
+            self.gzipped = data.startswith(GZIP_MAGIC)
+            if self.gzipped:
+                self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if not self.gzipped:
+            self._parser.feed(data)
+            return self._read_entries()
+        return self._inflate(data)
+
+    def close(self) -> list:
+        """Signal the end of the sitemap.
+
+        Returns:
+            list: any remaining :class:`SitemapEntry` objects
+
+        """
+        _entries = []
+        if self._head:
+            self.gzipped = False
+            self._parser.feed(self._head)
+            self._head = b""
+        elif self._inflater is not None:
+            self._parser.feed(self._inflater.flush())
+            _entries = self._read_entries()
+        try:
+            self._parser.close()
+        except etree.XMLSyntaxError:
+            pass
+        return _entries + self._read_entries()
+
+    def _inflate(self, data) -> list:
+        _entries = []
+        while data:
+            self._parser.feed(self._inflater.decompress(data, CHUNK_SIZE))
+            _entries.extend(self._read_entries())
+            data = self._inflater.unconsumed_tail
+            if self._inflater.eof:
+                # Another gzip member may follow; anything else is trailing garbage.
+                data = self._inflater.unused_data
+                if not data.startswith(GZIP_MAGIC):
+                    break
+                self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return _entries
+
+    def _read_entries(self) -> list:
+        _entries = []
+        for _event, _element in self._parser.read_events():
+            _loc = None
+            _lastmod = None
+            for _child in _element:
+                if not isinstance(_child.tag, str):
+                    continue
+                _name = etree.QName(_child).localname
+                if _name == "loc" and _child.text:
+                    _loc = _child.text.strip()
+                elif _name == "lastmod" and _child.text:
+                    _lastmod = _child.text.strip()
+            if _loc:
+                _entries.append(
+                    SitemapEntry(etree.QName(_element).localname, _loc, _lastmod)
+                )
+            # Free the entry, along with any siblings that came before it.
+            _element.clear()
+            while _element.getprevious() is not None:
+                del _element.getparent()[0]
+        return _entries
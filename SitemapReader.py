@@ -1,9 +1,9 @@
 """Read and parse through a sitemap and return the data."""
 import requests
 import xml
-from bs4 import BeautifulSoup
 from logzero import logger
 from SiteGloopErrors import SitemapUrlError
+from SitemapParser import CHUNK_SIZE, SitemapParser
 
 
 class SitemapReader:
@@ -52,11 +52,16 @@ class SitemapReader:
         """
         return self.sitemap_data
 
-    def _retrieve_sitemap(self, sitemap_url=None, parser="xml"):
+    def _retrieve_sitemap(self, sitemap_url=None):
         if sitemap_url is None:
             raise SitemapUrlError
-        r = requests.get(sitemap_url, parser)
-        return r.text
+        _parser = SitemapParser()
+        with requests.get(sitemap_url, stream=True) as r:
+            for _chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                for _entry in _parser.feed(_chunk):
+                    yield _entry
+        for _entry in _parser.close():
+            yield _entry
 
     def parse_sitemap(self) -> bool:
         """Process the data within the sitemap.
@@ -67,23 +72,17 @@ class SitemapReader:
         """
         self.sitemap_data = {}
         while len(self.found_sitemap_urls) > 0:
-            _soup = None
             _current_url = self.found_sitemap_urls.pop()
             logger.debug("Current URL: %s" % _current_url)
-            _soup = BeautifulSoup(self._retrieve_sitemap(_current_url, "xml"))
-
-            if _soup.sitemapindex is not None:
-                for _sitemap in _soup.sitemapindex.find_all("sitemap"):
-                    _sitemap_url = _sitemap.loc.text
-                    if _sitemap_url not in self.found_sitemap_urls:
-                        self.found_sitemap_urls.append(_sitemap.loc.text)
-                        logger.debug("New Sitemap Found: %s" % _sitemap.loc.text)
+            for _entry in self._retrieve_sitemap(_current_url):
+                if _entry.kind == "sitemap":
+                    if _entry.loc not in self.found_sitemap_urls:
+                        self.found_sitemap_urls.append(_entry.loc)
+                        logger.debug("New Sitemap Found: %s" % _entry.loc)
                     logger.debug("Found sitemaps: %s" % len(self.found_sitemap_urls))
-            if _soup.urlset is not None:
-                _urlset = _soup.urlset.find_all("url")
-                for _url in _urlset:
-                    _lastmod = _url.lastmod.text if _url.lastmod else "UNKNOWN"
-                    self.sitemap_data[_url.findNext("loc").text] = _lastmod
+                else:
+                    _lastmod = _entry.lastmod if _entry.lastmod else "UNKNOWN"
+                    self.sitemap_data[_entry.loc] = _lastmod
         return True
 
     def print_stats(self) -> None:
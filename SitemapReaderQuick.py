@@ -1,19 +1,24 @@
 """Read and parse through a sitemap and return the data."""
 import asyncio
+import hashlib
 import logging
+import tempfile
 import urllib.parse
 import xml
 
 import aiohttp
 import logzero
-from bs4 import BeautifulSoup
 from colored import attr, bg, fg
 from logzero import logger
 from progress.spinner import Spinner
 
+from ConnectionPool import ConnectionPool
 from SiteGloopErrors import InvalidHostname, NoConnectorError, SitemapUrlError
 from SiteGloopUtils import SiteGloopLogger as GloopLog
 from SiteGloopUtils import is_fqdn
+from SitemapCache import SPOOL_MAX_SIZE, EntryPacker
+from SitemapParser import CHUNK_SIZE, SitemapParser
+from UrlStore import UrlStore
 
 
 class SitemapReaderQuick:
@@ -24,12 +29,23 @@ class SitemapReaderQuick:
       sitemap_data (:obj:`dict`, optional): data from a parsed sitemap (default: ``{}``)
       conn_limit (:obj:`int`, optional): maximum number of connections to use at once (default: ``100``)
       verbosity (:obj:`int`, optional): verbosity setting (default: ``50``)
+      url_queue (:obj:`asyncio.Queue`, optional): queue to feed ``(url, lastmod)`` tuples into
+        as they are found, for a crawler to consume (default: ``None``)
+      url_limit (:obj:`int`, optional): maximum number of URLs to collect (default: ``None``)
+      pool (:obj:`ConnectionPool`, optional): connection pool to use, which may be shared with
+        the crawler (default: a pool of ``conn_limit`` connections)
+      sitemap_cache (:obj:`SitemapCache`, optional): snapshots of previously parsed sitemaps,
+        which are used instead of parsing sitemaps that have not changed (default: ``None``)
 
     Attributes:
       sitemap_url (str): URL to the sitemap
-      sitemap_data (dict): data from a parsed sitemap
+      sitemap_data (UrlStore): data from a parsed sitemap
       conn_limit (int): maximum number of connections to use at once
       verbosity (int): verbosity setting
+      url_queue (asyncio.Queue): queue that found URLs are fed into
+      url_limit (int): maximum number of URLs to collect
+      pool (ConnectionPool): connection pool to use
+      sitemap_cache (SitemapCache): snapshots of previously parsed sitemaps
 
     Note:
         See https://docs.python.org/3/library/logging.html#logging-levels for more information on using
@@ -45,6 +61,10 @@ class SitemapReaderQuick:
         target_loc=None,
         target_scheme=None,
         verbosity=50,
+        url_queue=None,
+        url_limit=None,
+        pool=None,
+        sitemap_cache=None,
     ):
         """Initialize the Sitemap reader.
 
@@ -58,6 +78,19 @@ class SitemapReaderQuick:
             maximum number of connections to use (default: 100)
         verbosity : int, optional
             verbosity setting, by default 50 (see: https://docs.python.org/3/library/logging.html#logging-levels)
+        url_queue : asyncio.Queue, optional
+            queue to feed ``(url, lastmod)`` tuples into as they are found, by default None.
+            Once reading is complete ``None`` is put onto the queue. If the queue is
+            bounded, reading pauses whenever it is full.
+        url_limit : int, optional
+            maximum number of URLs to collect, by default None (no limit)
+        pool : ConnectionPool, optional
+            connection pool to use, by default a pool of ``conn_limit`` connections that
+            is closed once reading is complete
+        sitemap_cache : SitemapCache, optional
+            snapshots of previously parsed sitemaps, by default None. Sitemaps are
+            requested conditionally, and the snapshot is used instead of parsing a
+            sitemap that is unchanged (a 304 response, or the same content hash).
         """
         self.verbosity = verbosity
         self.glooplog = GloopLog(verbosity=self.verbosity)
@@ -69,6 +102,10 @@ class SitemapReaderQuick:
         self.queue.put_nowait(self.sitemap_url)
         self.spinner = None
         self.found_sitemap_urls = [self.sitemap_url]
+        self.url_queue = url_queue
+        self.url_limit = url_limit
+        self.pool = pool
+        self.sitemap_cache = sitemap_cache
 
     def get_sitemap_url(self) -> str:
         """Getter for the sitemap_url.
@@ -83,86 +120,216 @@ class SitemapReaderQuick:
         """Getter for the parsed sitemap data.
 
         Returns:
-            dict: provides the URL and ``lastmod`` data from the sitemap
+            UrlStore: provides the URL and ``lastmod`` data from the sitemap, in a
+                compact dict-like store
 
         """
         return self.sitemap_data
 
-    async def _retrieve_sitemap(self, session=None, sitemap_url=None, parser="xml"):
+    def _url_limit_reached(self) -> bool:
+        return self.url_limit is not None and len(self.sitemap_data) >= self.url_limit
+
+    async def _retrieve_sitemap(self, session=None, sitemap_url=None):
+        """Retrieve a sitemap, yielding its entries as the response streams in.
+
+        Args:
+            session (obj): an aiohttp Client Session
+            sitemap_url (str): URL to the sitemap
+
+        Yields:
+            SitemapEntry: each entry found within the sitemap
+
+        """
         if session is None:
             raise NoConnectorError
         if sitemap_url is None:
             raise SitemapUrlError
-        async with session.get(sitemap_url) as resp:
+        _headers = {}
+        if self.sitemap_cache is not None:
+            _headers = self.sitemap_cache.headers(sitemap_url)
+        async with session.get(sitemap_url, headers=_headers) as resp:
             self.glooplog.logit(
                 level="debug", msg="Starting session for %s" % sitemap_url
             )
             self.glooplog.logit(spin=True)
-            return await resp.text(encoding="utf-8")
+            if self.sitemap_cache is None:
+                _entries = self._parse_stream(resp)
+            else:
+                _entries = self._parse_cached(sitemap_url, resp)
+            try:
+                async for _entry in _entries:
+                    yield _entry
+            finally:
+                await _entries.aclose()
+
+    async def _parse_stream(self, resp):
+        """Parse a sitemap as its response streams in.
+
+        Args:
+            resp (obj): the aiohttp response for the sitemap
+
+        Yields:
+            SitemapEntry: each entry found within the sitemap
+
+        """
+        _parser = SitemapParser()
+        async for _chunk in resp.content.iter_chunked(CHUNK_SIZE):
+            for _entry in _parser.feed(_chunk):
+                yield _entry
+        for _entry in _parser.close():
+            yield _entry
+
+    async def _parse_cached(self, sitemap_url, resp):
+        """Load a sitemap from its snapshot if it is unchanged, otherwise parse it.
+
+        The body is spooled (to memory, then to disk) while its hash is computed, so
+        that it only needs to be parsed if the hash differs from that of the snapshot.
+        The snapshot is replaced once a sitemap has been parsed in full.
+
+        Args:
+            sitemap_url (str): URL to the sitemap
+            resp (obj): the aiohttp response for the sitemap
+
+        Yields:
+            SitemapEntry: each entry found within the sitemap
+
+        """
+        if resp.status == 304:
+            _snapshot = self.sitemap_cache.load(sitemap_url)
+            if _snapshot is None:
+                self.glooplog.logit(
+                    level="warning",
+                    msg="No snapshot of unchanged sitemap %s" % sitemap_url,
+                )
+                return
+            self.glooplog.logit(
+                level="debug", msg="Sitemap not modified: %s" % sitemap_url
+            )
+            self.sitemap_cache.touch(sitemap_url, resp.headers)
+            for _entry in _snapshot:
+                yield _entry
+            return
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as _spool:
+            _digest = hashlib.sha256()
+            async for _chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                _digest.update(_chunk)
+                _spool.write(_chunk)
+            _sha256 = _digest.hexdigest()
+            _snapshot = None
+            if resp.status == 200:
+                _snapshot = self.sitemap_cache.load(sitemap_url, _sha256)
+            if _snapshot is not None:
+                self.glooplog.logit(
+                    level="debug", msg="Sitemap content unchanged: %s" % sitemap_url
+                )
+                self.sitemap_cache.touch(sitemap_url, resp.headers)
+                for _entry in _snapshot:
+                    yield _entry
+                return
+            _spool.seek(0)
+            _parser = SitemapParser()
+            # The entries are packed as they are parsed, rather than held until the
+            # snapshot is saved
+            _packer = EntryPacker()
+            for _chunk in iter(lambda: _spool.read(CHUNK_SIZE), b""):
+                for _entry in _parser.feed(_chunk):
+                    _packer.add(_entry)
+                    yield _entry
+            for _entry in _parser.close():
+                _packer.add(_entry)
+                yield _entry
+            if resp.status == 200:
+                self.sitemap_cache.save(sitemap_url, resp.headers, _sha256, _packer)
+
+    async def _process_entry(self, entry):
+        """Queue a child sitemap or record a URL found within a sitemap.
+
+        New URLs are also fed into ``url_queue`` when one was provided.
+
+        Args:
+            entry (SitemapEntry): entry found within a sitemap
+
+        """
+        if entry.kind == "sitemap":
+            if entry.loc not in self.found_sitemap_urls:
+                self.found_sitemap_urls.append(entry.loc)
+                self.queue.put_nowait(entry.loc)
+                self.glooplog.logit(
+                    level="debug", msg="New Sitemap Found: %s" % entry.loc
+                )
+                self.glooplog.logit(spin=True)
+            self.glooplog.logit(
+                level="debug", msg="Found sitemaps: %s" % self.queue.qsize(),
+            )
+        elif self._url_limit_reached():
+            return
+        elif self.sitemap_data.add(entry.loc, entry.lastmod or "UNKNOWN"):
+            self.glooplog.logit(level="debug", msg="Added %s" % entry.loc)
+            if self.url_queue is not None:
+                await self.url_queue.put((entry.loc, entry.lastmod or "UNKNOWN"))
+        else:
+            self.glooplog.logit(
+                level="debug",
+                msg="Duplicate found. Sitemaps found: %s" % self.queue.qsize(),
+            )
+        self.glooplog.logit(spin=True)
+
+    async def _sitemap_worker(self, session):
+        """Retrieve and process sitemaps from the queue until cancelled.
+
+        Args:
+            session (obj): an aiohttp Client Session
+
+        """
+        while True:
+            _sitemap_url = await self.queue.get()
+            _entries = self._retrieve_sitemap(session, _sitemap_url)
+            try:
+                # Once enough URLs have been found there is no need to keep reading.
+                if not self._url_limit_reached():
+                    async for _entry in _entries:
+                        await self._process_entry(_entry)
+                        if self._url_limit_reached():
+                            break
+                self.glooplog.logit(
+                    level="debug",
+                    msg="Sitemap Data Entries: %s" % len(self.sitemap_data),
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.glooplog.logit(
+                    level="error",
+                    msg="Unable to retrieve sitemap %s: %r" % (_sitemap_url, e),
+                )
+            finally:
+                await _entries.aclose()
+                self.queue.task_done()
 
     async def parse_sitemap(self):
-        """Process the data within the sitemap."""
+        """Process the data within the sitemap.
+
+        Sitemaps are retrieved by a pool of up to ``conn_limit`` workers draining
+        the queue concurrently.  Child sitemaps found within a sitemap index are
+        placed back onto the queue and picked up by whichever worker is free.
+
+        If a ``url_queue`` was provided, ``None`` is put onto it once reading has
+        finished so that consumers know that no more URLs are coming.
+        """
         print(
             "\n%s Beginning to parse sitemap(s)... %s\n" % (attr("bold"), attr("reset"))
         )
         if self.verbosity >= 30:
             self.glooplog.spinner = Spinner(" Loading ")
-        self.connector = aiohttp.TCPConnector(limit=self.conn_limit)
-        async with aiohttp.ClientSession(connector=self.connector) as session:
-            self.sitemap_data = {}
-            _soups = None
-            while not self.queue.empty():
-                _soups = await asyncio.gather(
-                    *[
-                        self._retrieve_sitemap(session, self.queue.get_nowait(), "xml")
-                        # for u in self.found_sitemap_urls
-                    ]
-                )
-
-                for _soupraw in _soups:
-                    _soup = BeautifulSoup(_soupraw, "xml")
-                    if _soup.sitemapindex is not None:
-                        for _sitemap in _soup.sitemapindex.find_all("sitemap"):
-                            _sitemap_url = _sitemap.loc.text
-                            if _sitemap_url not in self.found_sitemap_urls:
-                                self.found_sitemap_urls.append(_sitemap_url)
-                                self.queue.put_nowait(_sitemap_url)
-                                self.glooplog.logit(
-                                    level="debug",
-                                    msg="New Sitemap Found: %s" % _sitemap_url,
-                                )
-                                self.glooplog.logit(spin=True)
-                            self.glooplog.logit(
-                                level="debug",
-                                msg="Found sitemaps: %s" % self.queue.qsize(),
-                            )
-                            self.glooplog.logit(spin=True)
-                    if _soup.urlset is not None:
-                        self.glooplog.logit(
-                            level="debug",
-                            msg="Sitemap Data Entries: %s" % len(self.sitemap_data),
-                        )
-                        self.glooplog.logit(spin=True)
-                        _urlset = _soup.urlset.find_all("url")
-                        for _url in _urlset:
-                            _url_text = _url.findNext("loc").text
-                            if _url_text not in self.sitemap_data:
-                                _lastmod = (
-                                    _url.lastmod.text if _url.lastmod else "UNKNOWN"
-                                )
-                                self.sitemap_data[_url.findNext("loc").text] = _lastmod
-                                self.glooplog.logit(
-                                    level="debug", msg="Added %s" % _url_text
-                                )
-                                self.glooplog.logit(spin=True)
-                            elif _url_text in self.sitemap_data:
-                                self.glooplog.logit(
-                                    level="debug",
-                                    msg="Duplicate found. Sitemaps found: %s"
-                                    % self.queue.qsize(),
-                                )
-                                self.glooplog.logit(spin=True)
-                self.queue.task_done()
+        _pool = self.pool if self.pool is not None else ConnectionPool(self.conn_limit)
+        self.connector = _pool.get_connector()
+        self.sitemap_data = UrlStore()
+        try:
+            async with _pool.session() as session:
+                await self._run_workers(session)
+        finally:
+            if self.pool is None:
+                await _pool.close()
+            if self.url_queue is not None:
+                await self.url_queue.put(None)
         self.glooplog.logit(level="info", msg="Sitemap Reading Complete!")
         print(
             "\n\n%s%s%s Sitemap Reading Complete! %s\n"
@@ -170,6 +337,29 @@ class SitemapReaderQuick:
         )
         return
 
+    async def _run_workers(self, session):
+        """Drain the sitemap queue with a pool of workers.
+
+        Args:
+            session (obj): an aiohttp Client Session
+
+        """
+        _workers = [
+            asyncio.ensure_future(self._sitemap_worker(session))
+            for _ in range(max(1, self.conn_limit))
+        ]
+        _joined = asyncio.ensure_future(self.queue.join())
+        _done, _pending = await asyncio.wait(
+            [_joined] + _workers, return_when=asyncio.FIRST_COMPLETED
+        )
+        for _task in _workers + [_joined]:
+            _task.cancel()
+        await asyncio.gather(*_workers, _joined, return_exceptions=True)
+        # A worker only finishes early if it raised, so surface that error.
+        for _task in _done:
+            if _task is not _joined:
+                _task.result()
+
     def print_stats(self) -> None:
         """Print out the number of URLs found in the sitemaps."""
         self.glooplog.logit(
@@ -0,0 +1,203 @@
+"""Remember what each snapshot holds, so that unchanged pages and images are not stored again."""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from StateStore import UNKNOWN_LASTMODS
+
+#: Directory (within the output directory) that images are stored in, by content hash.
+IMAGE_DIR = "images"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    sha256 TEXT PRIMARY KEY,
+    phash TEXT,
+    pixels TEXT,
+    width INTEGER,
+    height INTEGER,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_phash ON images (phash, width, height);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    lastmod TEXT,
+    sha256 TEXT NOT NULL,
+    captured_at REAL NOT NULL
+);
+"""
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first, so that a partly written image is never used
+    _tmp_path = "%s.%s.tmp" % (path, threading.get_ident())
+    with open(_tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(_tmp_path, path)
+
+
+class SnapshotManifest:
+    """SQLite manifest of the pages of a snapshot, and the images that show them.
+
+    For each page, the manifest keeps its ``lastmod`` and the hash of its screenshot,
+    so that :meth:`unchanged` can tell when a page need not be captured again. Images
+    are stored by :meth:`store_image` under ``IMAGE_DIR`` in the output directory,
+    named by their SHA-256 hash, and an image that is byte for byte, or (with Pillow
+    installed) visually identical to one already stored is not stored again; pages
+    refer to the stored copy instead. Images are never overwritten, so every page
+    that refers to one keeps showing it.
+
+    Images are visually identical if their decoded pixels are the same, even if they
+    were encoded differently. The perceptual hash (see :func:`ImageEncoder.dhash`)
+    only narrows down the stored images that are compared: a dHash of a whole page
+    cannot tell apart pages that differ by a few words, so it is never enough on its
+    own.
+
+    The manifest may be used from several threads at once.
+
+    Args:
+        path (str): path of the SQLite database, which is created if needed
+        output_dir (str): directory that the snapshot is written to
+        hash_size (:obj:`int`, optional): rows and columns of the perceptual hashes to
+            compute of images; ``0`` only deduplicates identical bytes (default: ``16``)
+
+    Attributes:
+        path (str): path of the SQLite database
+        output_dir (str): directory that the snapshot is written to
+        skipped_count (int): number of pages found to be unchanged
+        deduplicated_count (int): number of images that were already stored
+
+    """
+
+    def __init__(self, path, output_dir, hash_size=16):
+        """Open (or create) the database."""
+        self.path = path
+        self.output_dir = output_dir
+        self.hash_size = hash_size
+        self.skipped_count = 0
+        self.deduplicated_count = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def unchanged(self, url, lastmod) -> bool:
+        """Check whether a page is unchanged since its last snapshot, counting it if so.
+
+        A page is unchanged if it has a known ``lastmod``, the same one as when its
+        snapshot was taken, and the image of the snapshot is still there.
+
+        Args:
+            url (str): URL of the page
+            lastmod (str): ``lastmod`` of the page in the sitemap
+
+        Returns:
+            bool: True if the page need not be captured again
+
+        """
+        if lastmod in UNKNOWN_LASTMODS:
+            return False
+        with self._lock:
+            _row = self._conn.execute(
+                "SELECT pages.lastmod, images.path FROM pages "
+                "JOIN images ON images.sha256 = pages.sha256 WHERE pages.url = ?",
+                (url,),
+            ).fetchone()
+        if _row is None or _row[0] != lastmod:
+            return False
+        if not os.path.exists(os.path.join(self.output_dir, _row[1])):
+            return False
+        with self._lock:
+            self.skipped_count += 1
+        return True
+
+    def store_image(self, image) -> tuple:
+        """Store the screenshot of a page, unless an identical image is already stored.
+
+        Args:
+            image (ImageEncoder.EncodedImage): the screenshot, encoded as it is to be
+                written, with its thumbnail (if any) and perceptual hash (if any)
+
+        Returns:
+            tuple: ``(sha256, path, thumbnail_path)``: the hash that identifies the
+                stored image, its path within the output directory, and the path of
+                its thumbnail (or None if it has none)
+
+        """
+        _sha256 = hashlib.sha256(image.data).hexdigest()
+        with self._lock:
+            _row = self._conn.execute(
+                "SELECT sha256, path FROM images WHERE sha256 = ?", (_sha256,)
+            ).fetchone()
+            if _row is None and image.phash is not None:
+                _row = self._conn.execute(
+                    "SELECT sha256, path FROM images "
+                    "WHERE phash = ? AND width = ? AND height = ? AND pixels = ?",
+                    (image.phash, image.width, image.height, image.pixels),
+                ).fetchone()
+        if _row is not None and os.path.exists(os.path.join(self.output_dir, _row[1])):
+            with self._lock:
+                self.deduplicated_count += 1
+            _sha256, _path = _row
+            _stored = True
+        else:
+            _path = os.path.join(
+                IMAGE_DIR, _sha256[:2], "%s.%s" % (_sha256, image.extension)
+            )
+            _write(os.path.join(self.output_dir, _path), image.data)
+            _stored = False
+        _thumbnail_path = None
+        if image.thumbnail is not None:
+            # Thumbnails are named after the image they show
+            _thumbnail_path = "%s.thumb.%s" % (
+                os.path.splitext(_path)[0],
+                image.extension,
+            )
+            _full_path = os.path.join(self.output_dir, _thumbnail_path)
+            if not os.path.exists(_full_path):
+                _write(_full_path, image.thumbnail)
+        if not _stored:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO images "
+                    "(sha256, phash, pixels, width, height, path) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        _sha256,
+                        image.phash,
+                        image.pixels,
+                        image.width,
+                        image.height,
+                        _path,
+                    ),
+                )
+        return _sha256, _path, _thumbnail_path
+
+    def record(self, url, lastmod, sha256):
+        """Record the snapshot taken of a page.
+
+        Args:
+            url (str): URL of the page
+            lastmod (str): ``lastmod`` of the page in the sitemap
+            sha256 (str): the hash of the image that shows it, from :meth:`store_image`
+
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, lastmod, sha256, captured_at) "
+                "VALUES (?, ?, ?, ?)",
+                (url, lastmod, sha256, time.time()),
+            )
+
+    def close(self):
+        """Close the database."""
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,174 @@
+"""Remember what was crawled, so that later runs can skip unchanged URLs."""
+import sqlite3
+import time
+
+#: Values of ``lastmod`` that mean the sitemap did not say when a URL last changed.
+UNKNOWN_LASTMODS = (None, "", "UNKNOWN")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    lastmod TEXT,
+    crawled_at REAL NOT NULL,
+    status INTEGER,
+    error TEXT
+)
+"""
+
+
+class StateStore:
+    """SQLite database of the ``lastmod``, last crawl time and last status of each URL.
+
+    The store is called with each :class:`~SiteCrawlerQuick.CrawlResult` (so it can be
+    used as, or alongside, the ``result_sink`` of
+    :class:`~SiteCrawlerQuick.SiteCrawlerQuick`), and :meth:`should_crawl` is used as
+    its ``url_filter``. Results are written in batches, whenever ``buffer_size`` of
+    them are waiting or ``flush_interval`` seconds have passed.
+
+    In incremental mode, a URL is only crawled if it:
+
+    * has never been crawled
+    * has a ``lastmod`` different from the one it had when it was last crawled
+    * was last crawled more than ``max_age`` seconds ago
+    * failed (with an error, or a ``5xx`` or ``429 Too Many Requests`` response) the
+      last time it was crawled
+
+    Args:
+        path (str): path of the SQLite database, which is created if needed
+        incremental (:obj:`bool`, optional): only crawl new, changed, stale or failed
+            URLs (default: ``False``)
+        max_age (:obj:`float`, optional): seconds after which a URL is crawled again even
+            if it has not changed (default: ``86400``)
+        buffer_size (:obj:`int`, optional): most results to hold before writing them out
+            (default: ``1000``)
+        flush_interval (:obj:`float`, optional): most seconds to hold a result before
+            writing it out (default: ``1.0``)
+
+    Attributes:
+        path (str): path of the SQLite database
+        incremental (bool): only crawl new, changed, stale or failed URLs
+        max_age (float): seconds after which a URL is crawled again
+        skipped_count (int): number of URLs skipped because they were unchanged
+
+    Example::
+
+        with StateStore("sitegloop.db", incremental=True) as state:
+            crawler = SiteCrawlerQuick(
+                urls, result_sink=state, url_filter=state.should_crawl
+            )
+            await crawler.crawl_sites()
+
+    """
+
+    def __init__(
+        self,
+        path,
+        incremental=False,
+        max_age=86400,
+        buffer_size=1000,
+        flush_interval=1.0,
+    ):
+        """Open (or create) the database."""
+        self.path = path
+        self.incremental = incremental
+        self.max_age = max_age
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.skipped_count = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        # lastmod of each URL that is being crawled, until its result is stored
+        self._lastmods = {}
+        self._rows = []
+        self._flushed_at = time.monotonic()
+
+    def get(self, url) -> tuple:
+        """Look up what is known about a URL.
+
+        Args:
+            url (str): the URL to look up
+
+        Returns:
+            tuple: ``(lastmod, crawled_at, status, error)`` from the last time the URL
+                was crawled, or None if it has never been crawled
+
+        """
+        return self._conn.execute(
+            "SELECT lastmod, crawled_at, status, error FROM urls WHERE url = ?", (url,)
+        ).fetchone()
+
+    def should_crawl(self, url, lastmod=None) -> bool:
+        """Decide whether to crawl a URL, remembering its ``lastmod`` if so.
+
+        Args:
+            url (str): the URL that may be crawled
+            lastmod (:obj:`str`, optional): the ``lastmod`` of the URL in the sitemap
+
+        Returns:
+            bool: True if the URL should be crawled
+
+        """
+        if self.incremental and not self._changed(url, lastmod):
+            self.skipped_count += 1
+            return False
+        self._lastmods[url] = None if lastmod in UNKNOWN_LASTMODS else lastmod
+        return True
+
+    def _changed(self, url, lastmod) -> bool:
+        _row = self.get(url)
+        if _row is None:
+            return True
+        _last_lastmod, _crawled_at, _status, _error = _row
+        # Rate-limited URLs were not served either, so they are tried again
+        if _error is not None or _status is None or _status >= 500 or _status == 429:
+            return True
+        if time.time() - _crawled_at > self.max_age:
+            return True
+        return lastmod not in UNKNOWN_LASTMODS and lastmod != _last_lastmod
+
+    def __call__(self, result):
+        """Store the outcome of crawling a URL.
+
+        Args:
+            result (CrawlResult): the outcome of crawling a URL
+
+        """
+        self._rows.append(
+            (
+                result.url,
+                self._lastmods.pop(result.url, None),
+                time.time(),
+                result.status,
+                result.error,
+            )
+        )
+        if len(self._rows) >= self.buffer_size:
+            self.flush()
+        elif time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write every buffered result to the database."""
+        if self._rows:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO urls (url, lastmod, crawled_at, status, error) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    self._rows,
+                )
+            self._rows = []
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        """Write every buffered result, then close the database."""
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,152 @@
+"""Point URLs at another host (and scheme), such as a staging copy of a site."""
+import re
+import urllib.parse
+
+_ORIGIN_RE = re.compile(r"[A-Za-z][A-Za-z0-9+.-]*://[^/?#]*")
+
+# Most origins to remember the rewritten form of
+_ORIGIN_CACHE_SIZE = 1024
+
+
+def split_origin(url) -> tuple:
+    """Split a URL into its origin (``scheme://netloc``) and the rest of it.
+
+    Args:
+        url (str): the URL to split
+
+    Returns:
+        tuple: the origin, or ``""`` if the URL has none, and the rest of the URL (path,
+            params, query and fragment, exactly as given)
+
+    """
+    _match = _ORIGIN_RE.match(url)
+    if _match is None:
+        return "", url
+    _end = _match.end()
+    return url[:_end], url[_end:]
+
+
+class UrlRewriter:
+    """Replace the netloc (and scheme, if set) of URLs, keeping the rest of them intact.
+
+    Most URLs are rewritten by swapping their ``scheme://netloc`` prefix for the
+    rewritten one, which is worked out once per origin. URLs without such a prefix,
+    such as scheme-relative URLs, are parsed in full instead.
+
+    Args:
+        target_loc (str): netloc to point URLs at, such as ``"staging.example.com"``
+        target_scheme (:obj:`str`, optional): scheme to use instead of that of each URL
+
+    Example::
+
+        rewriter = UrlRewriter("staging.example.com", "http")
+        rewriter.rewrite("https://www.example.com/search?q=1")
+        # "http://staging.example.com/search?q=1"
+
+    """
+
+    def __init__(self, target_loc, target_scheme=None):
+        """Create the rewriter."""
+        self.target_loc = target_loc
+        self.target_scheme = target_scheme
+        self._origins = {}
+
+    def _rewrite_origin(self, origin) -> str:
+        _new_origin = self._origins.get(origin)
+        if _new_origin is None:
+            _scheme = self.target_scheme or origin.split(":", 1)[0].lower()
+            _new_origin = "%s://%s" % (_scheme, self.target_loc)
+            if len(self._origins) < _ORIGIN_CACHE_SIZE:
+                self._origins[origin] = _new_origin
+        return _new_origin
+
+    def _rewrite_parsed(self, url) -> str:
+        _parts = urllib.parse.urlsplit(url)
+        _scheme = self.target_scheme or _parts.scheme
+        return urllib.parse.urlunsplit(
+            (_scheme, self.target_loc, _parts.path, _parts.query, _parts.fragment)
+        )
+
+    def rewrite(self, url) -> str:
+        """Point a single URL at ``target_loc``.
+
+        Args:
+            url (str): the URL to rewrite
+
+        Returns:
+            str: the rewritten URL
+
+        """
+        _origin, _rest = split_origin(url)
+        if not _origin:
+            return self._rewrite_parsed(url)
+        return self._rewrite_origin(_origin) + _rest
+
+    def rewrite_items(self, items):
+        """Rewrite URLs lazily, as they are iterated over.
+
+        URLs that share their origin with the URL before them, as most URLs from a
+        sitemap do, are rewritten without looking the origin up again.
+
+        Args:
+            items (iterable): ``(url, value)`` pairs, such as ``urls.items()``
+
+        Yields:
+            tuple: ``(rewritten_url, value)``
+
+        """
+        _origin = None
+        _new_origin = None
+        _length = 0
+        for _url, _value in items:
+            if _origin is not None and _url.startswith(_origin):
+                if len(_url) == _length or _url[_length] in "/?#":
+                    yield _new_origin + _url[_length:], _value
+                    continue
+            _origin, _rest = split_origin(_url)
+            if not _origin:
+                _origin = None
+                yield self._rewrite_parsed(_url), _value
+                continue
+            _new_origin = self._rewrite_origin(_origin)
+            _length = len(_origin)
+            yield _new_origin + _rest, _value
+
+
+class RewrittenUrls:
+    """Lazy view of ``{url: lastmod}`` with every URL pointed at another host.
+
+    No copy of the URLs is made; they are rewritten as the view is iterated over.
+    URLs of different origins (such as ``http://`` and ``https://`` copies of a page,
+    with ``target_scheme`` set) could be rewritten to the same URL, which would then
+    appear twice, so the view is only meant for URLs that all share one origin (see
+    :meth:`~SiteCrawlerQuick.SiteCrawlerQuick.change_url_location`). URLs cannot be
+    looked up in the view, only iterated over.
+
+    Args:
+        urls (dict): the URLs, with their ``lastmod``
+        rewriter (UrlRewriter): rewrites each URL
+
+    """
+
+    def __init__(self, urls, rewriter):
+        """Create the view."""
+        self.urls = urls
+        self.rewriter = rewriter
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __iter__(self):
+        for _url, _lastmod in self.items():
+            yield _url
+
+    def items(self):
+        """Iterate over each rewritten URL and its ``lastmod``."""
+        return self.rewriter.rewrite_items(self.urls.items())
+
+    def __repr__(self):
+        return "<RewrittenUrls of %s URL(s) at %s>" % (
+            len(self),
+            self.rewriter.target_loc,
+        )
@@ -0,0 +1,431 @@
+"""Compact store of the URLs found in sitemaps, with their ``lastmod``."""
+import calendar
+import collections.abc
+import re
+import time
+from array import array
+
+from UrlRewriter import split_origin
+
+#: ``lastmod`` read back for URLs whose ``lastmod`` is missing.
+UNKNOWN_LASTMOD = "UNKNOWN"
+
+# The W3C datetime profile: YYYY, YYYY-MM, YYYY-MM-DD, then a time of hh:mm, hh:mm:ss
+# or hh:mm:ss.s (with any number of decimal places), which needs a time zone
+_LASTMOD_RE = re.compile(
+    r"^(\d{4})(?:-(\d{2})(?:-(\d{2})(?:T(\d{2}):(\d{2})(?::(\d{2})(?:\.(\d+))?)?"
+    r"(Z|[+-]\d{2}:\d{2}))?)?)?$"
+)
+
+# How the lastmod of each URL is written, so that it can be read back exactly: it is
+# missing, kept as a string, or a W3C datetime, whose format is
+# _W3C + 2 * precision, plus 1 if it ends in a UTC offset rather than "Z"
+_UNKNOWN, _RAW, _W3C = range(3)
+
+# Precisions of W3C datetimes; _SECONDS + n is seconds with n decimal places
+_YEAR, _MONTH, _DAY, _MINUTES, _SECONDS = range(5)
+
+# Most decimal places of seconds that are kept; the fraction is kept in an array("I")
+_MAX_DECIMALS = 9
+
+_STRFTIME_FORMATS = ("%Y", "%Y-%m", "%Y-%m-%d", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S")
+
+# Most distinct lastmod values to remember the encoding (and formatting) of;
+# sitemaps tend to repeat a few of them many times
+_LASTMOD_CACHE_SIZE = 4096
+
+# Fraction of the index that may be in use before it is doubled in size
+_MAX_LOAD = 0.6
+
+
+def _match_lastmod(lastmod) -> tuple:
+    """Parse a W3C datetime into ``(epoch, offset, precision, fraction, zone)``."""
+    _match = _LASTMOD_RE.match(lastmod)
+    if _match is None:
+        return None
+    _year, _month, _day, _hour, _minute, _second, _decimals, _zone = _match.groups()
+    if _month is None:
+        _precision = _YEAR
+    elif _day is None:
+        _precision = _MONTH
+    elif _hour is None:
+        _precision = _DAY
+    elif _second is None:
+        _precision = _MINUTES
+    else:
+        _precision = _SECONDS + len(_decimals or "")
+    _offset = 0
+    if _zone is not None and _zone != "Z":
+        _offset = int(_zone[1:3]) * 60 + int(_zone[4:6])
+        if _zone[0] == "-":
+            _offset = -_offset
+    _fields = (
+        int(_year),
+        int(_month or 1),
+        int(_day or 1),
+        int(_hour or 0),
+        int(_minute or 0),
+        int(_second or 0),
+    )
+    _epoch = calendar.timegm(_fields) - _offset * 60
+    return _epoch, _offset, _precision, int(_decimals or 0), _zone
+
+
+def parse_lastmod(lastmod) -> tuple:
+    """Parse a W3C datetime ``lastmod``, as used in sitemaps.
+
+    Args:
+        lastmod (str): the ``lastmod``, such as ``"2020-05-01"``,
+            ``"2020-05-01T10:30+02:00"`` or ``"2020-05-01T10:30:00.000Z"``
+
+    Returns:
+        tuple: ``(epoch_seconds, utc_offset_minutes, has_time)``, or None if the
+            ``lastmod`` is in another format; fractions of a second are left out
+
+    """
+    _parsed = _match_lastmod(lastmod)
+    if _parsed is None:
+        return None
+    _epoch, _offset, _precision, _fraction, _zone = _parsed
+    return _epoch, _offset, _precision >= _MINUTES
+
+
+def _format_lastmod(lastmod_format, epoch, offset, fraction) -> str:
+    _precision, _has_offset = divmod(lastmod_format - _W3C, 2)
+    _local = time.gmtime(epoch + offset * 60)
+    _text = time.strftime(_STRFTIME_FORMATS[min(_precision, _SECONDS)], _local)
+    if _precision > _SECONDS:
+        _text += ".%0*d" % (_precision - _SECONDS, fraction)
+    if _precision < _MINUTES:
+        return _text
+    if not _has_offset:
+        return _text + "Z"
+    return "%s%s%02d:%02d" % (
+        _text,
+        "-" if offset < 0 else "+",
+        abs(offset) // 60,
+        abs(offset) % 60,
+    )
+
+
+def _encode_lastmod(lastmod) -> tuple:
+    """Encode a ``lastmod`` as ``(format, epoch_seconds, utc_offset_minutes, fraction)``."""
+    if lastmod is None or lastmod in ("", UNKNOWN_LASTMOD):
+        return _UNKNOWN, 0, 0, 0
+    _parsed = _match_lastmod(lastmod)
+    if _parsed is None:
+        return _RAW, 0, 0, 0
+    _epoch, _offset, _precision, _fraction, _zone = _parsed
+    if _precision - _SECONDS > _MAX_DECIMALS:
+        return _RAW, 0, 0, 0
+    _format = _W3C + 2 * _precision + (_zone not in (None, "Z"))
+    # Dates that do not exist, such as 2020-02-30, and offsets written as -00:00 do
+    # not read back the same
+    if _format_lastmod(_format, _epoch, _offset, _fraction) != lastmod:
+        return _RAW, 0, 0, 0
+    return _format, _epoch, _offset, _fraction
+
+
+class UrlStore(collections.abc.Mapping):
+    """Memory efficient mapping of URLs to their ``lastmod``.
+
+    A drop-in replacement for the ``{url: lastmod}`` dicts built from sitemaps, which
+    holds millions of URLs in a fraction of the memory:
+
+    * the origin (``scheme://netloc``) of each URL is stored once, and each URL refers
+      to it by number
+    * the rest of each URL is stored, UTF-8 encoded, in a single buffer
+    * each ``lastmod`` in the W3C datetime format of sitemaps (from ``YYYY`` down to
+      fractions of a second) is parsed to seconds since the epoch, and kept in an
+      ``array('q')`` along with how it was written, so that it reads back exactly as
+      it was given (``lastmod`` values in other formats are kept as strings)
+    * URLs are looked up through an open addressing hash table of entry numbers
+
+    URLs are kept in the order they were added. They can be added or updated like in
+    a dict, but not removed. A missing ``lastmod`` (``None``, ``""`` or ``"UNKNOWN"``)
+    reads back as ``"UNKNOWN"``.
+
+    Args:
+        urls (:obj:`dict`, optional): URLs to add, with their ``lastmod``; a mapping,
+            or an iterable of ``(url, lastmod)`` pairs
+
+    Example::
+
+        urls = UrlStore()
+        urls["https://example.com/about/"] = "2020-05-01"
+        for url, lastmod in urls.items():
+            ...
+
+    """
+
+    def __init__(self, urls=None):
+        """Create the store."""
+        self._origins = []
+        self._origin_ids = {}
+        self._url_origins = array("I")
+        self._paths = bytearray()
+        self._path_ends = array("q")
+        self._lastmods = array("q")
+        self._formats = array("b")
+        self._offsets = array("h")
+        self._fractions = array("I")
+        self._raw_lastmods = {}
+        self._lastmod_codes = {}
+        self._lastmod_strings = {}
+        self._index = array("q", [0]) * 8
+        if urls is not None:
+            self.update(urls)
+
+    def __len__(self):
+        return len(self._path_ends)
+
+    def _url_at(self, position) -> str:
+        _start = self._path_ends[position - 1] if position else 0
+        _end = self._path_ends[position]
+        _rest = self._paths[_start:_end].decode("utf-8")
+        return self._origins[self._url_origins[position]] + _rest
+
+    def _lastmod_at(self, position) -> str:
+        _format = self._formats[position]
+        if _format == _UNKNOWN:
+            return UNKNOWN_LASTMOD
+        if _format == _RAW:
+            return self._raw_lastmods[position]
+        _key = (
+            _format,
+            self._lastmods[position],
+            self._offsets[position],
+            self._fractions[position],
+        )
+        _lastmod = self._lastmod_strings.get(_key)
+        if _lastmod is None:
+            _lastmod = _format_lastmod(*_key)
+            if len(self._lastmod_strings) >= _LASTMOD_CACHE_SIZE:
+                self._lastmod_strings.clear()
+            self._lastmod_strings[_key] = _lastmod
+        return _lastmod
+
+    def _slot(self, url, origin_id, rest) -> int:
+        """Find the index slot that holds a URL, or the empty slot it would go in."""
+        _mask = len(self._index) - 1
+        _slot = hash(url) & _mask
+        while True:
+            _entry = self._index[_slot]
+            if _entry == 0:
+                return _slot
+            _position = _entry - 1
+            if self._url_origins[_position] == origin_id:
+                _start = self._path_ends[_position - 1] if _position else 0
+                _end = self._path_ends[_position]
+                if self._paths[_start:_end] == rest:
+                    return _slot
+            _slot = (_slot + 1) & _mask
+
+    def position(self, url) -> int:
+        """Look up where a URL is in the order that URLs were added.
+
+        Args:
+            url (str): the URL to look up
+
+        Returns:
+            int: the position of the URL, from ``0``, or None if it is not stored
+
+        """
+        if not isinstance(url, str):
+            return None
+        _origin, _rest = split_origin(url)
+        _origin_id = self._origin_ids.get(_origin)
+        if _origin_id is None:
+            return None
+        _entry = self._index[self._slot(url, _origin_id, _rest.encode("utf-8"))]
+        return _entry - 1 if _entry else None
+
+    def url_at(self, position) -> str:
+        """Look up the URL at a position in the order that URLs were added.
+
+        Args:
+            position (int): the position of the URL, from ``0``
+
+        Returns:
+            str: the URL
+
+        Raises:
+            IndexError: if there is no URL at ``position``
+
+        """
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        return self._url_at(position)
+
+    def __getitem__(self, url):
+        _position = self.position(url)
+        if _position is None:
+            raise KeyError(url)
+        return self._lastmod_at(_position)
+
+    def __contains__(self, url):
+        return self.position(url) is not None
+
+    def __iter__(self):
+        for _position in range(len(self)):
+            yield self._url_at(_position)
+
+    def items(self):
+        """Iterate over each URL and its ``lastmod``, in the order they were added."""
+        # The same as _url_at() and _lastmod_at(), inlined as this is the hot path
+        _paths = self._paths
+        _path_ends = self._path_ends
+        _origins = self._origins
+        _url_origins = self._url_origins
+        _formats = self._formats
+        _lastmods = self._lastmods
+        _offsets = self._offsets
+        _fractions = self._fractions
+        _strings = self._lastmod_strings
+        _start = 0
+        for _position in range(len(_path_ends)):
+            _end = _path_ends[_position]
+            _rest = _paths[_start:_end].decode("utf-8")
+            _url = _origins[_url_origins[_position]] + _rest
+            _start = _end
+            _format = _formats[_position]
+            if _format == _UNKNOWN or _format == _RAW:
+                yield _url, self._lastmod_at(_position)
+                continue
+            _lastmod = _strings.get(
+                (
+                    _format,
+                    _lastmods[_position],
+                    _offsets[_position],
+                    _fractions[_position],
+                )
+            )
+            if _lastmod is None:
+                _lastmod = self._lastmod_at(_position)
+            yield _url, _lastmod
+
+    def origins(self) -> list:
+        """List the origins (``scheme://netloc``) of the URLs, each once.
+
+        Returns:
+            list: the origins, in the order they were first added, with ``""`` for URLs
+                that have no origin
+
+        """
+        return list(self._origins)
+
+    def lastmod_epoch(self, url) -> int:
+        """Look up the ``lastmod`` of a URL as seconds since the epoch.
+
+        Args:
+            url (str): the URL to look up
+
+        Returns:
+            int: the ``lastmod`` of the URL, or None if it is missing or not in a W3C
+                datetime format
+
+        Raises:
+            KeyError: if the URL is not stored
+
+        """
+        _position = self.position(url)
+        if _position is None:
+            raise KeyError(url)
+        if self._formats[_position] in (_UNKNOWN, _RAW):
+            return None
+        return self._lastmods[_position]
+
+    def __setitem__(self, url, lastmod):
+        self._store(url, lastmod, True)
+
+    def add(self, url, lastmod) -> bool:
+        """Add a URL and its ``lastmod``, unless the URL is already stored.
+
+        Args:
+            url (str): the URL to add
+            lastmod (str): the ``lastmod`` of the URL
+
+        Returns:
+            bool: True if the URL was added, False if it was already stored
+
+        """
+        return self._store(url, lastmod, False)
+
+    def _store(self, url, lastmod, replace) -> bool:
+        _origin, _rest = split_origin(url)
+        _origin_id = self._origin_ids.get(_origin)
+        if _origin_id is None:
+            _origin_id = self._origin_ids[_origin] = len(self._origins)
+            self._origins.append(_origin)
+        _rest = _rest.encode("utf-8")
+        _slot = self._slot(url, _origin_id, _rest)
+        _code = self._lastmod_codes.get(lastmod)
+        if _code is None:
+            _code = _encode_lastmod(lastmod)
+            if len(self._lastmod_codes) >= _LASTMOD_CACHE_SIZE:
+                self._lastmod_codes.clear()
+            self._lastmod_codes[lastmod] = _code
+        _format, _epoch, _offset, _fraction = _code
+        _entry = self._index[_slot]
+        if _entry:
+            if not replace:
+                return False
+            _position = _entry - 1
+            self._formats[_position] = _format
+            self._lastmods[_position] = _epoch
+            self._offsets[_position] = _offset
+            self._fractions[_position] = _fraction
+            self._raw_lastmods.pop(_position, None)
+        else:
+            _position = len(self._path_ends)
+            self._url_origins.append(_origin_id)
+            self._paths += _rest
+            self._path_ends.append(len(self._paths))
+            self._formats.append(_format)
+            self._lastmods.append(_epoch)
+            self._offsets.append(_offset)
+            self._fractions.append(_fraction)
+            self._index[_slot] = _position + 1
+        if _format == _RAW:
+            self._raw_lastmods[_position] = lastmod
+        if len(self._path_ends) > len(self._index) * _MAX_LOAD:
+            self._build_index(len(self._index) * 2)
+        return True
+
+    def _build_index(self, size):
+        self._index = array("q", [0]) * size
+        _mask = len(self._index) - 1
+        for _position in range(len(self)):
+            _slot = hash(self._url_at(_position)) & _mask
+            while self._index[_slot]:
+                _slot = (_slot + 1) & _mask
+            self._index[_slot] = _position + 1
+
+    def __getstate__(self):
+        # hash() of a str differs between processes, so the index is rebuilt on unpickling
+        _state = self.__dict__.copy()
+        del _state["_index"]
+        return _state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        _size = 8
+        while len(self) > _size * _MAX_LOAD:
+            _size *= 2
+        self._build_index(_size)
+
+    def update(self, urls):
+        """Add (or update) URLs and their ``lastmod``.
+
+        Args:
+            urls (dict): a mapping of URLs to their ``lastmod``, or an iterable of
+                ``(url, lastmod)`` pairs
+
+        """
+        if isinstance(urls, collections.abc.Mapping):
+            urls = urls.items()
+        for _url, _lastmod in urls:
+            self[_url] = _lastmod
+
+    def __repr__(self):
+        return "<UrlStore of %s URL(s)>" % len(self)
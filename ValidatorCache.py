@@ -0,0 +1,194 @@
+"""Remember the validators of each URL, so that later runs can make conditional requests."""
+import sqlite3
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS validators (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    used_at REAL NOT NULL
+)
+"""
+
+_INDEX = "CREATE INDEX IF NOT EXISTS validators_used_at ON validators (used_at)"
+
+#: Most URLs looked up in one query by :meth:`ValidatorCache.prefetch`.
+PREFETCH_SIZE = 500
+
+_NOT_PREFETCHED = object()
+
+
+class ValidatorCache:
+    """SQLite cache of the ``ETag`` and ``Last-Modified`` validators of each URL.
+
+    :meth:`headers` gives the ``If-None-Match`` / ``If-Modified-Since`` headers to send
+    with a request, and :meth:`update` stores the validators of the response. Updates
+    are written in batches, whenever ``buffer_size`` of them are waiting or
+    ``flush_interval`` seconds have passed. Once the cache holds more than
+    ``max_entries`` URLs, the least recently used ones are evicted as it is written.
+
+    :meth:`prefetch` looks up the validators of a batch of URLs in one query before
+    they are requested, so that :meth:`headers` need not query the database for each
+    request.
+
+    Args:
+        path (str): path of the SQLite database, which is created if needed
+        max_entries (:obj:`int`, optional): most URLs to keep validators for
+            (default: ``1000000``)
+        buffer_size (:obj:`int`, optional): most updates to hold before writing them out
+            (default: ``1000``)
+        flush_interval (:obj:`float`, optional): most seconds to hold an update before
+            writing it out (default: ``1.0``)
+
+    Attributes:
+        path (str): path of the SQLite database
+        max_entries (int): most URLs to keep validators for
+
+    Example::
+
+        with ValidatorCache("validators.db") as validators:
+            crawler = SiteCrawlerQuick(urls, validator_cache=validators)
+            await crawler.crawl_sites()
+
+    """
+
+    def __init__(self, path, max_entries=1000000, buffer_size=1000, flush_interval=1.0):
+        """Open (or create) the database."""
+        self.path = path
+        self.max_entries = max_entries
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.execute(_INDEX)
+        self._conn.commit()
+        # The number of URLs in the database is counted once, then kept up to date
+        (self._count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM validators"
+        ).fetchone()
+        self._rows = {}
+        self._prefetched = {}
+        self._flushed_at = time.monotonic()
+
+    def get(self, url) -> tuple:
+        """Look up the validators of a URL.
+
+        Args:
+            url (str): the URL to look up
+
+        Returns:
+            tuple: ``(etag, last_modified)``, or None if the URL has none
+
+        """
+        if url in self._rows:
+            return self._rows[url][1:3]
+        return self._conn.execute(
+            "SELECT etag, last_modified FROM validators WHERE url = ?", (url,)
+        ).fetchone()
+
+    def prefetch(self, urls):
+        """Look up the validators of URLs that are about to be requested.
+
+        The validators are held until :meth:`headers` is called for each URL.
+
+        Args:
+            urls (list): the URLs that will be requested
+
+        """
+        _urls = [url for url in urls if url not in self._rows]
+        for _start in range(0, len(_urls), PREFETCH_SIZE):
+            _end = _start + PREFETCH_SIZE
+            _batch = _urls[_start:_end]
+            for _url in _batch:
+                self._prefetched[_url] = None
+            for _url, _etag, _last_modified in self._conn.execute(
+                "SELECT url, etag, last_modified FROM validators WHERE url IN (%s)"
+                % ",".join("?" * len(_batch)),
+                _batch,
+            ):
+                self._prefetched[_url] = (_etag, _last_modified)
+
+    def headers(self, url) -> dict:
+        """Build the headers that make a request for a URL conditional.
+
+        Args:
+            url (str): the URL that will be requested
+
+        Returns:
+            dict: ``If-None-Match`` and/or ``If-Modified-Since`` headers, or an empty dict
+                if the URL has no validators
+
+        """
+        _validators = self._prefetched.pop(url, _NOT_PREFETCHED)
+        if _validators is _NOT_PREFETCHED or url in self._rows:
+            _validators = self.get(url)
+        if _validators is None:
+            return {}
+        _etag, _last_modified = _validators
+        _headers = {}
+        if _etag:
+            _headers["If-None-Match"] = _etag
+        if _last_modified:
+            _headers["If-Modified-Since"] = _last_modified
+        return _headers
+
+    def update(self, url, headers):
+        """Store the validators from a response.
+
+        Validators missing from a ``304 Not Modified`` response are kept from before.
+
+        Args:
+            url (str): the URL that was requested
+            headers (obj): the headers of the response
+
+        """
+        _etag = headers.get("ETag")
+        _last_modified = headers.get("Last-Modified")
+        if _etag is None and _last_modified is None:
+            _validators = self.get(url)
+            if _validators is None:
+                return
+            _etag, _last_modified = _validators
+        self._rows[url] = (url, _etag, _last_modified, time.time())
+        if len(self._rows) >= self.buffer_size:
+            self.flush()
+        elif time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write every buffered update, evicting the least recently used URLs if needed."""
+        if self._rows:
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE validators SET etag = ?, last_modified = ?, used_at = ? "
+                    "WHERE url = ?",
+                    (_row[1:] + _row[:1] for _row in self._rows.values()),
+                )
+                # Only the URLs that were not updated are inserted, which counts them
+                self._count += self._conn.executemany(
+                    "INSERT OR IGNORE INTO validators (url, etag, last_modified, used_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    self._rows.values(),
+                ).rowcount
+                if self._count > self.max_entries:
+                    self._count -= self._conn.execute(
+                        "DELETE FROM validators WHERE url IN "
+                        "(SELECT url FROM validators ORDER BY used_at LIMIT ?)",
+                        (self._count - self.max_entries,),
+                    ).rowcount
+            self._rows = {}
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        """Write every buffered update, then close the database."""
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
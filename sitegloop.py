@@ -3,8 +3,16 @@
 
 .. code-block:: console
 
-    usage: sitegloop.py [-h] [-m {quick,screenshot}] [-s SITEMAP_URL] [-tl TARGET_LOC] [-ts TARGET_SCHEME] [-n NUM_URLS_TO_GRAB] [-v] [--version] [-o OUTPUT_DIR] [-p PAGE_TEMPLATE] [-t TEMPLATE_DIR]
-                        [-ql QUICK_LIMIT]
+    usage: sitegloop.py [-h] [-m {quick,screenshot}] [-s SITEMAP_URL] [-u URL_FILE] [--sitemap-cache SITEMAP_CACHE] [-tl TARGET_LOC] [-ts TARGET_SCHEME] [-n NUM_URLS_TO_GRAB] [-v] [--version]
+                        [-o OUTPUT_DIR] [-p PAGE_TEMPLATE] [-t TEMPLATE_DIR] [--browsers BROWSERS] [--max-pages-per-browser MAX_PAGES_PER_BROWSER] [--writers WRITERS]
+                        [--write-queue-size WRITE_QUEUE_SIZE] [--manifest MANIFEST] [--phash-size PHASH_SIZE] [--image-format {jpeg,png,webp}] [--quality QUALITY] [--thumbnail-width THUMBNAIL_WIDTH]
+                        [--encoders ENCODERS] [--page-load-strategy {normal,eager,none}] [--page-load-timeout PAGE_LOAD_TIMEOUT] [--block-url PATTERN] [--block-resource {font,image,media}]
+                        [-ql QUICK_LIMIT] [--workers WORKERS] [--role {standalone,coordinator,worker}] [--coordinator COORDINATOR] [--batch-size BATCH_SIZE] [--lease-timeout LEASE_TIMEOUT]
+                        [--coordinator-timeout COORDINATOR_TIMEOUT] [--per-host-limit PER_HOST_LIMIT] [--keepalive-timeout KEEPALIVE_TIMEOUT] [--dns-cache-ttl DNS_CACHE_TTL] [--rate RATE]
+                        [--host-rate HOST_RATE] [--adaptive] [--min-limit MIN_LIMIT] [--target-p95 TARGET_P95] [--max-error-rate MAX_ERROR_RATE] [--connect-timeout CONNECT_TIMEOUT]
+                        [--read-timeout READ_TIMEOUT] [--total-timeout TOTAL_TIMEOUT] [--retries RETRIES] [--retry-base-delay RETRY_BASE_DELAY] [--retry-max-delay RETRY_MAX_DELAY]
+                        [--dead-letter DEAD_LETTER] [--state-db STATE_DB] [--incremental] [--max-age MAX_AGE] [--checkpoint CHECKPOINT] [--checkpoint-interval CHECKPOINT_INTERVAL] [--resume]
+                        [--validator-cache VALIDATOR_CACHE] [--validator-cache-size VALIDATOR_CACHE_SIZE] [--ndjson NDJSON] [--csv CSV] [-wm {get,head,range}] [--pipeline]
 
     Crawls a Sitemap and performs a quick asynchronous crawl of the resources contained
     within the sitemap.  This can be useful for warming the site's cache.  Alternatively,
@@ -24,6 +32,10 @@
                             Which mode you want to invoke, a 'quick' async crawl or a synchronous 'screenshot' capture
     -s SITEMAP_URL, --sitemap-url SITEMAP_URL
                             URL to the Sitemap to parse
+    -u URL_FILE, --url-file URL_FILE
+                            File of URLs to crawl (one per line) instead of reading a sitemap, such as a file written by '--dead-letter'.
+    --sitemap-cache SITEMAP_CACHE
+                            SQLite database to keep a parsed snapshot of each sitemap in. Sitemaps that have not changed since the last run are loaded from it instead of being parsed again.
     -tl TARGET_LOC, --target-loc TARGET_LOC
                             Target Location to use when crawling, if you want to crawl a different host from that defined within the sitemap.
     -ts TARGET_SCHEME, --target-scheme TARGET_SCHEME
@@ -42,12 +54,96 @@
                             Name of the Jinja2 template for snapshots
     -t TEMPLATE_DIR, --template-dir TEMPLATE_DIR
                             Path to the directory where the Jinja2 templates are stored
+    --browsers BROWSERS   Number of browser sessions to capture pages with at once. Default is 1.
+    --max-pages-per-browser MAX_PAGES_PER_BROWSER
+                            Pages after which a browser session is replaced by a new one. A session is also replaced as soon as a page fails with it. Default is 100.
+    --writers WRITERS     Number of threads writing screenshots and HTML pages, while the browsers go on to the next pages. Default is 2.
+    --write-queue-size WRITE_QUEUE_SIZE
+                            Most captured pages waiting to be written before the browsers wait for the writers. Default is 16.
+    --manifest MANIFEST   SQLite manifest of the snapshot: the lastmod and screenshot of each page. Pages whose lastmod is unchanged since their last snapshot are not visited again, and screenshots
+                            are stored once, under 'images' in the output directory, however many pages look identical.
+    --phash-size PHASH_SIZE
+                            Rows and columns of the perceptual hash that narrows down the stored screenshots compared pixel for pixel with each new one (requires Pillow). 0 only finds identical files.
+                            Default is 16.
+    --image-format {jpeg,png,webp}
+                            Format to write screenshots in. WebP and JPEG files are many times smaller than PNG, and require Pillow. Screenshots too tall for WebP are written as JPEG. Default is png.
+    --quality QUALITY     Quality of WebP and JPEG screenshots, from 1 to 100. Default is 80.
+    --thumbnail-width THUMBNAIL_WIDTH
+                            Width of a thumbnail of the top of each page, shown in its HTML page and linking to the full screenshot (requires Pillow). Default is 0: no thumbnails, so HTML pages show the
+                            full screenshot.
+    --encoders ENCODERS   Number of processes encoding screenshots and thumbnails. At most '--writers' screenshots are encoded at once. Default is one per CPU.
+    --page-load-strategy {normal,eager,none}
+                            When to capture a page: once it has loaded (normal), once its HTML has been parsed (eager), or at once (none). Default is normal.
+    --page-load-timeout PAGE_LOAD_TIMEOUT
+                            Most seconds to load a page for. Slower pages are stopped and captured as they are. Default is the browser driver's timeout.
+    --block-url PATTERN   Shell-style pattern of URLs for the browser not to load, such as '*.doubleclick.net/*'. Can be used more than once.
+    --block-resource {font,image,media}
+                            Type of resource for the browser not to load. Can be used more than once.
 
     Quick Crawl w/o Screenshots:
     These options pertain to quick crawls in which screenshots are not created, and the links are visited asynchronously.
 
     -ql QUICK_LIMIT, --quick-limit QUICK_LIMIT
                             Maximum number of connections to allow at once (requires '-q') Default is 100.
+    --workers WORKERS     Number of processes to split the crawl across, each crawling its own share of the URLs with its own share of '-ql' and the rates. Default is 1.
+    --role {standalone,coordinator,worker}
+                            Spread the crawl across machines: a 'coordinator' reads the sitemap(s) and leases batches of URLs to each 'worker' that connects to it, and collects their results. Workers do
+                            not need '-s'. Only use this on a trusted network. Default is standalone.
+    --coordinator COORDINATOR
+                            HOST:PORT that the coordinator listens on, and that workers connect to. Default is 127.0.0.1:8770.
+    --batch-size BATCH_SIZE
+                            Most URLs that the coordinator leases to a worker at once. Default is 500.
+    --lease-timeout LEASE_TIMEOUT
+                            Seconds that a worker may go without reporting on its batch before the coordinator leases the rest of it to another worker. Default is 120.
+    --coordinator-timeout COORDINATOR_TIMEOUT
+                            Seconds that a worker keeps trying to connect to the coordinator, which only listens once it has read the sitemap. Default is 600.
+    --per-host-limit PER_HOST_LIMIT
+                            Maximum number of connections to allow at once to a single host. Default is 0 (no limit).
+    --keepalive-timeout KEEPALIVE_TIMEOUT
+                            Seconds to keep idle connections open for reuse. Default is 15.
+    --dns-cache-ttl DNS_CACHE_TTL
+                            Seconds to cache DNS lookups for. Default is 10.
+    --rate RATE           Maximum number of requests per second across all hosts. Default is no limit.
+    --host-rate HOST_RATE
+                            Maximum number of requests per second to each host. Default is no limit.
+    --adaptive            Adapt the number of connections in use (up to '-ql') to the latency and errors observed, growing it while they are within their targets.
+    --min-limit MIN_LIMIT
+                            Fewest connections to use at once with '--adaptive'. Default is 1.
+    --target-p95 TARGET_P95
+                            Highest acceptable p95 latency in seconds with '--adaptive'. Default is 1.0.
+    --max-error-rate MAX_ERROR_RATE
+                            Highest acceptable fraction of errors with '--adaptive'. Default is 0.05.
+    --connect-timeout CONNECT_TIMEOUT
+                            Seconds to wait for a connection to be made. Default is 10.
+    --read-timeout READ_TIMEOUT
+                            Seconds to wait for more of a response to be received. Default is 30.
+    --total-timeout TOTAL_TIMEOUT
+                            Seconds to wait for a whole request to complete. Default is 60.
+    --retries RETRIES     Number of times to retry a URL that times out, cannot connect, or responds with 429, 500, 502, 503 or 504. Default is 3.
+    --retry-base-delay RETRY_BASE_DELAY
+                            Seconds to back off for before the first retry. Each retry after that backs off for up to twice as long, with random jitter. Default is 0.5.
+    --retry-max-delay RETRY_MAX_DELAY
+                            Longest that a retry is backed off for, in seconds. Default is 30.
+    --dead-letter DEAD_LETTER
+                            File to write the URLs that fail for good to: those that fail with an error, and those that still fail after every retry. They can be crawled again later with '-u'.
+    --state-db STATE_DB   SQLite database to record the lastmod, crawl time and status of each URL in. Default is sitegloop-state.db when '--incremental' is used.
+    --incremental         Only crawl URLs that are new, have a different lastmod, failed, or were last crawled more than '--max-age' hours ago, according to '--state-db'.
+    --max-age MAX_AGE     Hours after which '--incremental' crawls a URL again. Default is 24.
+    --checkpoint CHECKPOINT
+                            File to checkpoint the crawl in: a snapshot of the URLs to crawl, and a bitmap of those crawled so far. Default is sitegloop.checkpoint when '--resume' is used.
+    --checkpoint-interval CHECKPOINT_INTERVAL
+                            Most seconds between writing out the checkpoint. Default is 5.
+    --resume              Continue the crawl recorded in '--checkpoint', crawling only the URLs not crawled yet, without reading the sitemap(s) again. Starts a new crawl if there is no checkpoint.
+    --validator-cache VALIDATOR_CACHE
+                            SQLite database to store the ETag and Last-Modified of each URL in, and send them back as If-None-Match/If-Modified-Since when crawling again. 304 responses are counted as
+                            'Validated'.
+    --validator-cache-size VALIDATOR_CACHE_SIZE
+                            Most URLs to keep validators for, evicting the least recently used. Default is 1000000.
+    --ndjson NDJSON       File to write each result to as a line of JSON (url, status, bytes, latency, error) as soon as it completes.
+    --csv CSV             File to write each result to as a CSV row (url, status, bytes, latency, error) as soon as it completes.
+    -wm {get,head,range}, --warm-method {get,head,range}
+                            How each URL is requested: 'get' downloads the body and discards it, 'head' sends a HEAD request, and 'range' only requests the first byte. Default is get.
+    --pipeline            Start crawling URLs as soon as they are found, while the sitemap(s) are still being read. Sitemap reading pauses when the crawl falls behind.
 
 """
 
@@ -57,22 +153,50 @@ __license__ = "MIT"
 
 import argparse
 import asyncio
+import functools
 import itertools
 import os
 import sys
 from time import sleep
 
+import aiohttp
 from colored import attr, bg, fg
 from logzero import logger
 
 import url_utils
+from BrowserPool import PAGE_LOAD_STRATEGIES, RESOURCE_TYPES, CaptureProfile
+from Checkpoint import Checkpoint
+from ConcurrencyController import ConcurrencyController
+from ConnectionPool import ConnectionPool
+from DistributedCrawl import Coordinator, Worker, parse_address
+from ImageEncoder import IMAGE_FORMATS, ImageEncoder
+from RateLimiter import RateLimiter
+from ResultSinks import CsvSink, NdjsonSink, TeeSink, TerminalSink, UrlSink
+from RetryPolicy import RetryPolicy
 from SiteCrawler import SiteCrawler
-from SiteCrawlerQuick import SiteCrawlerQuick
+from ShardedCrawler import ShardedCrawler
+from SiteCrawlerQuick import VALIDATED, WARM_METHODS, SiteCrawlerQuick
+from SitemapCache import SitemapCache
+from SiteGloopErrors import ImageEncodingError, InvalidHostname
+from SiteGloopUtils import is_fqdn
 from SitemapReaderQuick import SitemapReaderQuick
+from SnapshotManifest import SnapshotManifest
+from StateStore import StateStore
+from UrlRewriter import UrlRewriter
+from UrlStore import UrlStore
+from ValidatorCache import ValidatorCache
 
 height_adjustment = 0
 # Set num_urls_to_grab to a number if you want to limit the number of pages to parse
 num_urls_to_grab = None
+# Number of URLs per connection that may wait between the sitemap reader and the
+# crawler when pipelining, before sitemap reading is paused
+pipeline_buffer_factor = 10
+# Database used to remember what was crawled when '--incremental' is used without
+# '--state-db'
+default_state_db = "sitegloop-state.db"
+# Checkpoint used when '--resume' is used without '--checkpoint'
+default_checkpoint = "sitegloop.checkpoint"
 
 
 def find_log_level(lvl=0):
@@ -100,6 +224,231 @@ def find_log_level(lvl=0):
         return 10
 
 
+def read_url_file(url_file):
+    """Read the URLs to crawl from a file, such as a dead-letter file.
+
+    Parameters
+    ----------
+    url_file : str
+        path to a file with one URL per line; blank lines and lines starting with
+        '#' are skipped
+
+    Returns
+    -------
+    UrlStore
+        the URLs as keys, each with a lastmod of "UNKNOWN"
+    """
+    urls = UrlStore()
+    with open(url_file) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                urls[line] = "UNKNOWN"
+    return urls
+
+
+def print_summary(site_crawler):
+    """Print a summary of a quick crawl.
+
+    The result of each URL has already been written out by the result sinks as it
+    completed, so only the totals are printed here.
+
+    Parameters
+    ----------
+    site_crawler : SiteCrawlerQuick
+        crawler that has finished crawling
+    """
+    if site_crawler.result_sink is not None:
+        site_crawler.result_sink.flush()
+    print(
+        "\n\n%s%s%s Results of Site Crawl: %s\n"
+        % (attr("bold"), fg("white"), bg("green"), attr("reset"))
+    )
+    for status, count in sorted(
+        site_crawler.status_counts.items(), key=lambda item: str(item[0])
+    ):
+        if status == VALIDATED or isinstance(status, int) and status < 300:
+            status_color = fg("green")
+        elif isinstance(status, int) and status < 400:
+            status_color = fg("yellow")
+        else:
+            status_color = "%s%s" % (attr("bold"), fg("red"))
+        print("%s%s%s : %s URL(s)" % (status_color, status, attr("reset"), count))
+    if site_crawler.concurrency is not None:
+        print(
+            "\nAdaptive concurrency: %s at the end of the crawl, %s at its peak"
+            % (site_crawler.concurrency.limit, site_crawler.concurrency.peak_limit)
+        )
+    print("\n%s" % site_crawler.latency_stats.format_tables())
+    if site_crawler.dead_letter_count:
+        print("\n%s URL(s) failed for good" % site_crawler.dead_letter_count)
+
+
+def open_result_sinks(args):
+    """Open the sinks that each result is written to as it completes.
+
+    Parameters
+    ----------
+    args : ArgumentParser Namespace
+        object containing the attributes passed via the command line
+
+    Returns
+    -------
+    TeeSink
+        the results as colored lines on the terminal, and to any NDJSON or CSV file
+        requested
+    """
+    sinks = [TerminalSink()]
+    if args.ndjson is not None:
+        sinks.append(NdjsonSink(args.ndjson))
+    if args.csv is not None:
+        sinks.append(CsvSink(args.csv))
+    return TeeSink(sinks)
+
+
+def crawl_engine_options(args, shards=1):
+    """Build the connection pool, limits and caches used by a quick crawl.
+
+    Parameters
+    ----------
+    args : ArgumentParser Namespace
+        object containing the attributes passed via the command line
+    shards : int, optional
+        number of processes that the crawl is split across, by default 1. The
+        connection limits and rates are divided between them.
+
+    Returns
+    -------
+    dict
+        keyword arguments for SiteCrawlerQuick
+    """
+    conn_limit = max(1, args.quick_limit // shards)
+    per_host_limit = args.per_host_limit
+    if per_host_limit:
+        per_host_limit = max(1, per_host_limit // shards)
+    rate = args.rate / shards if args.rate else args.rate
+    host_rate = args.host_rate / shards if args.host_rate else args.host_rate
+    # Share connections between reading the sitemap(s) and crawling
+    pool = ConnectionPool(
+        limit=conn_limit,
+        limit_per_host=per_host_limit,
+        keepalive_timeout=args.keepalive_timeout,
+        ttl_dns_cache=args.dns_cache_ttl,
+    )
+    concurrency = None
+    if args.adaptive:
+        concurrency = ConcurrencyController(
+            conn_limit,
+            min_limit=args.min_limit,
+            target_latency=args.target_p95,
+            max_error_rate=args.max_error_rate,
+            verbosity=find_log_level(args.verbose),
+        )
+    validator_cache = None
+    if args.validator_cache is not None:
+        # Make conditional requests for URLs whose validators were seen before
+        validator_cache = ValidatorCache(
+            args.validator_cache, max_entries=args.validator_cache_size
+        )
+    return dict(
+        target_loc=args.target_loc,
+        target_scheme=args.target_scheme,
+        conn_limit=conn_limit,
+        verbosity=find_log_level(args.verbose),
+        warm_method=args.warm_method,
+        pool=pool,
+        rate_limiter=RateLimiter(rate=rate, host_rate=host_rate),
+        concurrency=concurrency,
+        timeout=aiohttp.ClientTimeout(
+            total=args.total_timeout,
+            connect=args.connect_timeout,
+            sock_read=args.read_timeout,
+        ),
+        retry_policy=RetryPolicy(
+            max_retries=args.retries,
+            base_delay=args.retry_base_delay,
+            max_delay=args.retry_max_delay,
+        ),
+        validator_cache=validator_cache,
+    )
+
+
+def url_rewriter(args):
+    """Build the function that points sitemap URLs at the target location, if any.
+
+    Parameters
+    ----------
+    args : ArgumentParser Namespace
+        object containing the attributes passed via the command line
+
+    Returns
+    -------
+    callable
+        returns the URL to crawl for a sitemap URL, or None if '-tl' is not used
+    """
+    if not args.target_loc:
+        return None
+    if not is_fqdn(args.target_loc):
+        raise InvalidHostname(
+            "Value of 'target_loc' (%s) is not a valid FQDN!" % args.target_loc
+        )
+    return UrlRewriter(args.target_loc, args.target_scheme).rewrite
+
+
+def make_shard_crawler(args, shard, shards, urls, result_sink, dead_letter_sink):
+    """Build the crawler for one shard of a '--workers' crawl, in its worker process.
+
+    Parameters
+    ----------
+    args : ArgumentParser Namespace
+        object containing the attributes passed via the command line
+    shard : int
+        the shard to crawl
+    shards : int
+        the number of shards
+    urls : dict
+        the URLs of the shard, already pointed at the target location
+    result_sink : callable
+        sends each result back to the parent process
+    dead_letter_sink : callable
+        sends each URL that failed for good back to the parent process
+
+    Returns
+    -------
+    SiteCrawlerQuick
+        crawler with its share of the connections and rates
+    """
+    options = crawl_engine_options(args, shards)
+    options.update(target_loc=None, target_scheme=None)
+    return SiteCrawlerQuick(
+        urls=urls, result_sink=result_sink, dead_letter_sink=dead_letter_sink, **options
+    )
+
+
+def make_batch_crawler(options, urls, result_sink, dead_letter_sink):
+    """Build the crawler for one batch of URLs leased by a '--role worker'.
+
+    Parameters
+    ----------
+    options : dict
+        keyword arguments for SiteCrawlerQuick, shared by every batch
+    urls : dict
+        the URLs of the batch, already pointed at the target location
+    result_sink : callable
+        streams each result back to the coordinator
+    dead_letter_sink : callable
+        streams each URL that failed for good back to the coordinator
+
+    Returns
+    -------
+    SiteCrawlerQuick
+        crawler for the batch
+    """
+    return SiteCrawlerQuick(
+        urls=urls, result_sink=result_sink, dead_letter_sink=dead_letter_sink, **options
+    )
+
+
 def main(args):
     """Run Sitegloop on behalf of the user.
 
@@ -108,66 +457,274 @@ def main(args):
     args : ArgumentParser Namespace
         object containing the attributes passed via the command line
     """
-    if args.sitemap_url is None:
+    if args.role == "standalone" and args.resume:
+        # The checkpoint holds the URLs to crawl, so no sitemap is needed to resume
+        pass
+    elif args.role != "worker" and args.sitemap_url is None and args.url_file is None:
         logger.error(
-            "NO SITEMAP DEFINED! Must use '-s' option or SITEMAP_URL Environment Variable."
+            "NO SITEMAP DEFINED! Must use '-s' option, '-u' option, or SITEMAP_URL Environment Variable."
         )
         sys.exit(1)
-    sitemaploop = asyncio.get_event_loop()
-    sitemap = SitemapReaderQuick(
-        args.sitemap_url,
+    if args.mode == "screenshot":
+        # Check that the screenshots can be encoded before reading the sitemap
+        try:
+            ImageEncoder(args.image_format, thumbnail_width=args.thumbnail_width)
+        except ImageEncodingError as e:
+            logger.error(e.message)
+            sys.exit(1)
+    if args.mode == "screenshot" and (args.checkpoint is not None or args.resume):
+        # Only the quick crawl feeds its results to the checkpoint
+        logger.error("'--checkpoint' and '--resume' only work with '-m quick'")
+        sys.exit(1)
+    crawler_options = crawl_engine_options(args)
+    result_sink = open_result_sinks(args)
+    state_store = None
+    url_filter = None
+    if args.state_db is not None or args.incremental:
+        # Record the outcome of each URL, so that later runs can skip it if unchanged
+        state_store = StateStore(
+            args.state_db or default_state_db,
+            incremental=args.incremental,
+            max_age=args.max_age * 3600,
+        )
+        result_sink.sinks.append(state_store)
+        url_filter = state_store.should_crawl
+    checkpoint = None
+    if args.role != "worker" and (args.checkpoint is not None or args.resume):
+        # Record which URLs have been crawled, so that a stopped crawl can be resumed
+        checkpoint = Checkpoint(
+            args.checkpoint or default_checkpoint,
+            interval=args.checkpoint_interval,
+            rewrite_url=url_rewriter(args),
+        )
+        result_sink.sinks.append(checkpoint)
+    dead_letter_sink = None
+    if args.dead_letter is not None:
+        dead_letter_sink = UrlSink(args.dead_letter, flush_interval=0)
+    crawler_options.update(
+        result_sink=result_sink,
+        dead_letter_sink=dead_letter_sink,
+        url_filter=url_filter,
+    )
+    pool = crawler_options["pool"]
+    validator_cache = crawler_options["validator_cache"]
+    sitemap_cache = None
+    if args.sitemap_cache is not None:
+        # Skip parsing sitemaps that have not changed since they were last read
+        sitemap_cache = SitemapCache(args.sitemap_cache)
+    reader_options = dict(
         conn_limit=args.quick_limit,
         verbosity=find_log_level(args.verbose),
+        url_limit=args.num_urls_to_grab,
+        pool=pool,
+        sitemap_cache=sitemap_cache,
     )
-    sitemaploop.run_until_complete(sitemap.parse_sitemap())
+    try:
+        run(args, pool, reader_options, crawler_options, checkpoint)
+        if checkpoint is not None:
+            print(
+                "\n%s of %s URL(s) crawled, see '%s'"
+                % (checkpoint.completed_count, checkpoint.total, checkpoint.path)
+            )
+        if state_store is not None and state_store.incremental:
+            print(
+                "\n%s unchanged URL(s) skipped, see '%s'"
+                % (state_store.skipped_count, state_store.path)
+            )
+    finally:
+        # Write out whatever was crawled, even if the crawl did not finish
+        result_sink.close()
+        if dead_letter_sink is not None:
+            dead_letter_sink.close()
+        if validator_cache is not None:
+            validator_cache.close()
+        if sitemap_cache is not None:
+            sitemap_cache.close()
 
-    if args.num_urls_to_grab:
-        urls_to_grab = dict(
-            itertools.islice(sitemap.get_sitemap_data().items(), args.num_urls_to_grab)
-        )
-    else:
-        urls_to_grab = sitemap.get_sitemap_data()
 
-    if args.mode == "quick":
-        import aiohttp
+def run(args, pool, reader_options, crawler_options, checkpoint=None):
+    """Read the sitemap(s), then crawl the URLs found.
 
-        from SiteCrawlerQuick import SiteCrawlerQuick
+    Parameters
+    ----------
+    args : ArgumentParser Namespace
+        object containing the attributes passed via the command line
+    pool : ConnectionPool
+        connections shared between reading the sitemap(s) and crawling
+    reader_options : dict
+        keyword arguments for SitemapReaderQuick
+    crawler_options : dict
+        keyword arguments for SiteCrawlerQuick
+    checkpoint : Checkpoint, optional
+        checkpoint to resume from (with '--resume') or to start, by default None
+    """
+    sitemaploop = asyncio.get_event_loop()
 
-        site_crawler = SiteCrawlerQuick(
-            urls=urls_to_grab,
-            target_loc=args.target_loc,
-            target_scheme=args.target_scheme,
-            conn_limit=args.quick_limit,
+    pipeline = args.pipeline and args.url_file is None
+    if args.workers > 1 and pipeline:
+        logger.warning("'--pipeline' is not used with '--workers'")
+        pipeline = False
+    if args.role != "standalone" and pipeline:
+        logger.warning("'--pipeline' is not used with '--role'")
+        pipeline = False
+    if checkpoint is not None and pipeline:
+        logger.warning("'--pipeline' is not used with '--checkpoint' or '--resume'")
+        pipeline = False
+    if args.mode == "quick" and args.role == "worker":
+        # Crawl the batches leased from the coordinator, which reads the sitemap(s)
+        host, port = parse_address(args.coordinator)
+        batch_options = dict(crawler_options, target_loc=None, target_scheme=None)
+        for option in ("result_sink", "dead_letter_sink", "url_filter"):
+            del batch_options[option]
+        site_crawler = Worker(
+            host,
+            port,
+            functools.partial(make_batch_crawler, batch_options),
+            connect_timeout=args.coordinator_timeout,
+            verbosity=find_log_level(args.verbose),
+        )
+        sitemaploop.run_until_complete(site_crawler.run())
+        sitemaploop.run_until_complete(pool.close())
+        print_summary(site_crawler)
+        return
+    if args.mode == "quick" and pipeline:
+        # Crawl URLs as soon as they are found, rather than reading every sitemap first
+        url_queue = asyncio.Queue(maxsize=pipeline_buffer_factor * args.quick_limit)
+        sitemap = SitemapReaderQuick(
+            args.sitemap_url, url_queue=url_queue, **reader_options
+        )
+        site_crawler = SiteCrawlerQuick(**crawler_options)
+        sitemaploop.run_until_complete(
+            asyncio.gather(sitemap.parse_sitemap(), site_crawler.crawl_queue(url_queue))
         )
+        sitemaploop.run_until_complete(pool.close())
+        print_summary(site_crawler)
+        return
 
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(site_crawler.crawl_sites())
+    urls_to_grab = None
+    if checkpoint is not None and args.resume:
+        urls_to_grab = checkpoint.load()
+        resumed = urls_to_grab is not None
+        if not resumed:
+            logger.warning(
+                "No checkpoint found at '%s', starting a new crawl" % checkpoint.path
+            )
+        else:
+            print(
+                "Resuming crawl: %s of %s URL(s) already crawled\n"
+                % (checkpoint.completed_count, checkpoint.total)
+            )
+    if urls_to_grab is not None:
+        pass
+    elif args.url_file is not None:
+        urls_to_grab = read_url_file(args.url_file)
+        if args.num_urls_to_grab is not None:
+            urls_to_grab = UrlStore(
+                itertools.islice(urls_to_grab.items(), args.num_urls_to_grab)
+            )
+    elif args.sitemap_url is not None:
+        sitemap = SitemapReaderQuick(args.sitemap_url, **reader_options)
+        sitemaploop.run_until_complete(sitemap.parse_sitemap())
+        urls_to_grab = sitemap.get_sitemap_data()
+    else:
+        logger.error("NO SITEMAP DEFINED! Must use '-s' option or '-u' option.")
+        sys.exit(1)
+    if checkpoint is not None and not (args.resume and resumed):
+        checkpoint.start(urls_to_grab)
 
-        print(
-            "\n\n%s%s%s Results of Site Crawl: %s\n"
-            % (attr("bold"), fg("white"), bg("green"), attr("reset"))
+    rewrite_url = url_rewriter(args)
+    if args.mode == "quick" and args.role == "coordinator":
+        # Lease the URLs out to '--role worker' processes, which may be on other machines
+        sitemaploop.run_until_complete(pool.close())
+        host, port = parse_address(args.coordinator)
+        site_crawler = Coordinator(
+            urls_to_grab,
+            host,
+            port,
+            batch_size=args.batch_size,
+            lease_timeout=args.lease_timeout,
+            result_sink=crawler_options["result_sink"],
+            dead_letter_sink=crawler_options["dead_letter_sink"],
+            url_filter=crawler_options["url_filter"],
+            rewrite_url=rewrite_url,
+            conditional=args.validator_cache is not None,
+            verbosity=find_log_level(args.verbose),
+        )
+        sitemaploop.run_until_complete(site_crawler.run())
+        print_summary(site_crawler)
+    elif args.mode == "quick" and args.workers > 1:
+        # Each worker process crawls its own shard with its own connections
+        sitemaploop.run_until_complete(pool.close())
+        site_crawler = ShardedCrawler(
+            urls_to_grab,
+            args.workers,
+            functools.partial(make_shard_crawler, args),
+            result_sink=crawler_options["result_sink"],
+            dead_letter_sink=crawler_options["dead_letter_sink"],
+            url_filter=crawler_options["url_filter"],
+            rewrite_url=rewrite_url,
         )
-        for crawlres in site_crawler.results:
-            for url, status in crawlres.result().items():
-                if isinstance(status, int) and status < 400:
-                    if int(status) < 300:
-                        status_color = fg("green")
-                    elif int(status) < 400:
-                        status_color = fg("yellow")
-                else:
-                    status_color = "%s%s" % (attr("bold"), fg("red"))
-                print("%s : %s%s%s" % (url, status_color, status, attr("reset")))
+        sitemaploop.run_until_complete(site_crawler.crawl_sites())
+        print_summary(site_crawler)
+    elif args.mode == "quick":
+        site_crawler = SiteCrawlerQuick(urls=urls_to_grab, **crawler_options)
+
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(site_crawler.crawl_sites())
+        loop.run_until_complete(pool.close())
+        print_summary(site_crawler)
     else:
+        sitemaploop.run_until_complete(pool.close())
         from selenium import webdriver
         from selenium.webdriver.firefox.options import Options
 
-        site_crawler = SiteCrawler(
-            urls=urls_to_grab,
-            output_dir=args.output_dir,
-            template_dir=args.template_dir,
-            page_template=args.page_template,
-            mode=args.mode,
-        )
+        manifest = None
+        if args.manifest:
+            manifest = SnapshotManifest(
+                args.manifest,
+                "output" if args.output_dir is None else args.output_dir,
+                hash_size=args.phash_size,
+            )
+        try:
+            site_crawler = SiteCrawler(
+                urls=urls_to_grab,
+                output_dir=args.output_dir,
+                template_dir=args.template_dir,
+                page_template=args.page_template,
+                mode=args.mode,
+                browsers=args.browsers,
+                max_pages_per_browser=args.max_pages_per_browser,
+                writers=args.writers,
+                write_queue_size=args.write_queue_size,
+                manifest=manifest,
+                image_format=args.image_format,
+                quality=args.quality,
+                thumbnail_width=args.thumbnail_width,
+                encoders=args.encoders,
+                capture_profile=CaptureProfile(
+                    page_load_strategy=args.page_load_strategy,
+                    page_load_timeout=args.page_load_timeout,
+                    block_urls=args.block_url or (),
+                    block_resources=args.block_resource or (),
+                ),
+            )
+        finally:
+            if manifest is not None:
+                manifest.close()
+        if site_crawler.failed_count:
+            logger.error(
+                "%s page(s) could not be snapshotted" % site_crawler.failed_count
+            )
+        if site_crawler.stopped_count:
+            logger.warning(
+                "%s page(s) were captured before they had finished loading"
+                % site_crawler.stopped_count
+            )
+        if manifest is not None:
+            logger.info(
+                "%s unchanged page(s) skipped, %s duplicate image(s) not stored again"
+                % (manifest.skipped_count, manifest.deduplicated_count)
+            )
 
 
 if __name__ == "__main__":
@@ -207,6 +764,28 @@ if __name__ == "__main__":
         help="URL to the Sitemap to parse",
     )
 
+    universal_group.add_argument(
+        "-u",
+        "--url-file",
+        action="store",
+        default=None,
+        help=(
+            "File of URLs to crawl (one per line) instead of reading a sitemap, such \n"
+            "as a file written by '--dead-letter'."
+        ),
+    )
+
+    universal_group.add_argument(
+        "--sitemap-cache",
+        action="store",
+        default=None,
+        help=(
+            "SQLite database to keep a parsed snapshot of each sitemap in. Sitemaps \n"
+            "that have not changed since the last run are loaded from it instead of \n"
+            "being parsed again."
+        ),
+    )
+
     universal_group.add_argument(
         "-tl",
         "--target-loc",
@@ -282,6 +861,158 @@ if __name__ == "__main__":
         help="Path to the directory where the Jinja2 templates are stored",
     )
 
+    screenshot_group.add_argument(
+        "--browsers",
+        type=int,
+        action="store",
+        default=1,
+        help="Number of browser sessions to capture pages with at once. Default is 1.",
+    )
+
+    screenshot_group.add_argument(
+        "--max-pages-per-browser",
+        type=int,
+        action="store",
+        default=100,
+        help=(
+            "Pages after which a browser session is replaced by a new one. A session \n"
+            "is also replaced as soon as a page fails with it. Default is 100."
+        ),
+    )
+
+    screenshot_group.add_argument(
+        "--writers",
+        type=int,
+        action="store",
+        default=2,
+        help=(
+            "Number of threads writing screenshots and HTML pages, while the browsers \n"
+            "go on to the next pages. Default is 2."
+        ),
+    )
+
+    screenshot_group.add_argument(
+        "--write-queue-size",
+        type=int,
+        action="store",
+        default=16,
+        help=(
+            "Most captured pages waiting to be written before the browsers wait for \n"
+            "the writers. Default is 16."
+        ),
+    )
+
+    screenshot_group.add_argument(
+        "--manifest",
+        action="store",
+        default=None,
+        type=str,
+        help=(
+            "SQLite manifest of the snapshot: the lastmod and screenshot of each page. \n"
+            "Pages whose lastmod is unchanged since their last snapshot are not visited \n"
+            "again, and screenshots are stored once, under 'images' in the output \n"
+            "directory, however many pages look identical."
+        ),
+    )
+
+    screenshot_group.add_argument(
+        "--phash-size",
+        type=int,
+        action="store",
+        default=16,
+        help=(
+            "Rows and columns of the perceptual hash that narrows down the stored \n"
+            "screenshots compared pixel for pixel with each new one (requires Pillow). 0 \n"
+            "only finds identical files. Default is 16."
+        ),
+    )
+
+    screenshot_group.add_argument(
+        "--image-format",
+        choices=sorted(IMAGE_FORMATS),
+        action="store",
+        default="png",
+        help=(
+            "Format to write screenshots in. WebP and JPEG files are many times smaller \n"
+            "than PNG, and require Pillow. Screenshots too tall for WebP are written as \n"
+            "JPEG. Default is png."
+        ),
+    )
+
+    screenshot_group.add_argument(
+        "--quality",
+        type=int,
+        action="store",
+        default=80,
+        help="Quality of WebP and JPEG screenshots, from 1 to 100. Default is 80.",
+    )
+
+    screenshot_group.add_argument(
+        "--thumbnail-width",
+        type=int,
+        action="store",
+        default=0,
+        help=(
+            "Width of a thumbnail of the top of each page, shown in its HTML page and \n"
+            "linking to the full screenshot (requires Pillow). Default is 0: no \n"
+            "thumbnails, so HTML pages show the full screenshot."
+        ),
+    )
+
+    screenshot_group.add_argument(
+        "--encoders",
+        type=int,
+        action="store",
+        default=None,
+        help=(
+            "Number of processes encoding screenshots and thumbnails. At most \n"
+            "'--writers' screenshots are encoded at once. Default is one per CPU."
+        ),
+    )
+
+    screenshot_group.add_argument(
+        "--page-load-strategy",
+        choices=PAGE_LOAD_STRATEGIES,
+        action="store",
+        default="normal",
+        help=(
+            "When to capture a page: once it has loaded (normal), once its HTML has \n"
+            "been parsed (eager), or at once (none). Default is normal."
+        ),
+    )
+
+    screenshot_group.add_argument(
+        "--page-load-timeout",
+        type=float,
+        action="store",
+        default=None,
+        help=(
+            "Most seconds to load a page for. Slower pages are stopped and captured \n"
+            "as they are. Default is the browser driver's timeout."
+        ),
+    )
+
+    screenshot_group.add_argument(
+        "--block-url",
+        action="append",
+        default=None,
+        metavar="PATTERN",
+        help=(
+            "Shell-style pattern of URLs for the browser not to load, such as \n"
+            "'*.doubleclick.net/*'. Can be used more than once."
+        ),
+    )
+
+    screenshot_group.add_argument(
+        "--block-resource",
+        choices=RESOURCE_TYPES,
+        action="append",
+        default=None,
+        help=(
+            "Type of resource for the browser not to load. Can be used more than once."
+        ),
+    )
+
     quick_group = parser.add_argument_group(
         "Quick Crawl w/o Screenshots",
         "These options pertain to quick crawls in which screenshots are not created, and the links are visited asynchronously.",
@@ -296,5 +1027,331 @@ if __name__ == "__main__":
         help="Maximum number of connections to allow at once (requires '-q') Default is 100.",
     )
 
+    quick_group.add_argument(
+        "--workers",
+        type=int,
+        action="store",
+        default=1,
+        help=(
+            "Number of processes to split the crawl across, each crawling its own \n"
+            "share of the URLs with its own share of '-ql' and the rates. Default is 1."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--role",
+        action="store",
+        choices=["standalone", "coordinator", "worker"],
+        default="standalone",
+        help=(
+            "Spread the crawl across machines: a 'coordinator' reads the sitemap(s) \n"
+            "and leases batches of URLs to each 'worker' that connects to it, and \n"
+            "collects their results. Workers do not need '-s'. Only use this on a \n"
+            "trusted network. Default is standalone."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--coordinator",
+        action="store",
+        default="127.0.0.1:8770",
+        help=(
+            "HOST:PORT that the coordinator listens on, and that workers connect to. \n"
+            "Default is 127.0.0.1:8770."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--batch-size",
+        type=int,
+        action="store",
+        default=500,
+        help="Most URLs that the coordinator leases to a worker at once. Default is 500.",
+    )
+
+    quick_group.add_argument(
+        "--lease-timeout",
+        type=float,
+        action="store",
+        default=120,
+        help=(
+            "Seconds that a worker may go without reporting on its batch before the \n"
+            "coordinator leases the rest of it to another worker. Default is 120."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--coordinator-timeout",
+        type=float,
+        action="store",
+        default=600,
+        help=(
+            "Seconds that a worker keeps trying to connect to the coordinator, which \n"
+            "only listens once it has read the sitemap. Default is 600."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--per-host-limit",
+        type=int,
+        action="store",
+        default=0,
+        help="Maximum number of connections to allow at once to a single host. Default is 0 (no limit).",
+    )
+
+    quick_group.add_argument(
+        "--keepalive-timeout",
+        type=float,
+        action="store",
+        default=15,
+        help="Seconds to keep idle connections open for reuse. Default is 15.",
+    )
+
+    quick_group.add_argument(
+        "--dns-cache-ttl",
+        type=int,
+        action="store",
+        default=10,
+        help="Seconds to cache DNS lookups for. Default is 10.",
+    )
+
+    quick_group.add_argument(
+        "--rate",
+        type=float,
+        action="store",
+        default=None,
+        help="Maximum number of requests per second across all hosts. Default is no limit.",
+    )
+
+    quick_group.add_argument(
+        "--host-rate",
+        type=float,
+        action="store",
+        default=None,
+        help="Maximum number of requests per second to each host. Default is no limit.",
+    )
+
+    quick_group.add_argument(
+        "--adaptive",
+        action="store_true",
+        default=False,
+        help=(
+            "Adapt the number of connections in use (up to '-ql') to the latency and \n"
+            "errors observed, growing it while they are within their targets."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--min-limit",
+        type=int,
+        action="store",
+        default=1,
+        help="Fewest connections to use at once with '--adaptive'. Default is 1.",
+    )
+
+    quick_group.add_argument(
+        "--target-p95",
+        type=float,
+        action="store",
+        default=1.0,
+        help="Highest acceptable p95 latency in seconds with '--adaptive'. Default is 1.0.",
+    )
+
+    quick_group.add_argument(
+        "--max-error-rate",
+        type=float,
+        action="store",
+        default=0.05,
+        help="Highest acceptable fraction of errors with '--adaptive'. Default is 0.05.",
+    )
+
+    quick_group.add_argument(
+        "--connect-timeout",
+        type=float,
+        action="store",
+        default=10,
+        help="Seconds to wait for a connection to be made. Default is 10.",
+    )
+
+    quick_group.add_argument(
+        "--read-timeout",
+        type=float,
+        action="store",
+        default=30,
+        help="Seconds to wait for more of a response to be received. Default is 30.",
+    )
+
+    quick_group.add_argument(
+        "--total-timeout",
+        type=float,
+        action="store",
+        default=60,
+        help="Seconds to wait for a whole request to complete. Default is 60.",
+    )
+
+    quick_group.add_argument(
+        "--retries",
+        type=int,
+        action="store",
+        default=3,
+        help=(
+            "Number of times to retry a URL that times out, cannot connect, or \n"
+            "responds with 429, 500, 502, 503 or 504. Default is 3."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--retry-base-delay",
+        type=float,
+        action="store",
+        default=0.5,
+        help=(
+            "Seconds to back off for before the first retry. Each retry after that \n"
+            "backs off for up to twice as long, with random jitter. Default is 0.5."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--retry-max-delay",
+        type=float,
+        action="store",
+        default=30,
+        help="Longest that a retry is backed off for, in seconds. Default is 30.",
+    )
+
+    quick_group.add_argument(
+        "--dead-letter",
+        action="store",
+        default=None,
+        help=(
+            "File to write the URLs that fail for good to: those that fail with an \n"
+            "error, and those that still fail after every retry. They can be crawled \n"
+            "again later with '-u'."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--state-db",
+        action="store",
+        default=None,
+        help=(
+            "SQLite database to record the lastmod, crawl time and status of each \n"
+            "URL in. Default is %s when '--incremental' is used." % default_state_db
+        ),
+    )
+
+    quick_group.add_argument(
+        "--incremental",
+        action="store_true",
+        default=False,
+        help=(
+            "Only crawl URLs that are new, have a different lastmod, failed, or were \n"
+            "last crawled more than '--max-age' hours ago, according to '--state-db'."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--max-age",
+        type=float,
+        action="store",
+        default=24,
+        help="Hours after which '--incremental' crawls a URL again. Default is 24.",
+    )
+
+    quick_group.add_argument(
+        "--checkpoint",
+        action="store",
+        default=None,
+        help=(
+            "File to checkpoint the crawl in: a snapshot of the URLs to crawl, and a \n"
+            "bitmap of those crawled so far. Default is %s when '--resume' is used."
+            % default_checkpoint
+        ),
+    )
+
+    quick_group.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        action="store",
+        default=5,
+        help="Most seconds between writing out the checkpoint. Default is 5.",
+    )
+
+    quick_group.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help=(
+            "Continue the crawl recorded in '--checkpoint', crawling only the URLs \n"
+            "not crawled yet, without reading the sitemap(s) again. Starts a new \n"
+            "crawl if there is no checkpoint."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--validator-cache",
+        action="store",
+        default=None,
+        help=(
+            "SQLite database to store the ETag and Last-Modified of each URL in, and \n"
+            "send them back as If-None-Match/If-Modified-Since when crawling again. \n"
+            "304 responses are counted as 'Validated'."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--validator-cache-size",
+        type=int,
+        action="store",
+        default=1000000,
+        help=(
+            "Most URLs to keep validators for, evicting the least recently used. \n"
+            "Default is 1000000."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--ndjson",
+        action="store",
+        default=None,
+        help=(
+            "File to write each result to as a line of JSON (url, status, bytes, \n"
+            "latency, error) as soon as it completes."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--csv",
+        action="store",
+        default=None,
+        help=(
+            "File to write each result to as a CSV row (url, status, bytes, latency, \n"
+            "error) as soon as it completes."
+        ),
+    )
+
+    quick_group.add_argument(
+        "-wm",
+        "--warm-method",
+        action="store",
+        choices=WARM_METHODS,
+        default="get",
+        help=(
+            "How each URL is requested: 'get' downloads the body and discards it, \n"
+            "'head' sends a HEAD request, and 'range' only requests the first byte. \n"
+            "Default is get."
+        ),
+    )
+
+    quick_group.add_argument(
+        "--pipeline",
+        action="store_true",
+        default=False,
+        help=(
+            "Start crawling URLs as soon as they are found, while the sitemap(s) are \n"
+            "still being read. Sitemap reading pauses when the crawl falls behind."
+        ),
+    )
+
     args = parser.parse_args()
     main(args)